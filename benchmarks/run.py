@@ -0,0 +1,124 @@
+"""Time the plugin on synthetic sources and report the results as JSON.
+
+    python -m benchmarks.run --output new.json
+    python -m benchmarks.run --shape nested_try --size 4 --size 8 --compare old.json
+
+Run from the repository root with the package importable (e.g. installed or with
+PYTHONPATH=src).
+"""
+import argparse
+import ast
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Sequence
+
+from benchmarks.shapes import DEFAULT_SIZES, SHAPES
+from flake_rba.plugin import ReferencedBeforeAssignmentASTPlugin
+
+
+def _revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, universal_newlines=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_plugin(tree: ast.AST, lines: List[str]) -> int:
+    return sum(1 for _ in ReferencedBeforeAssignmentASTPlugin(tree, lines).run())
+
+
+def measure(shape: str, size: int, repeat: int) -> Dict[str, Any]:
+    source = SHAPES[shape](size)
+    tree = ast.parse(source)
+    lines = source.splitlines(True)
+    nodes = sum(1 for _ in ast.walk(tree))
+
+    best = float('inf')
+    errors = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        errors = _run_plugin(tree, lines)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        _run_plugin(tree, lines)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'shape': shape,
+        'size': size,
+        'nodes': nodes,
+        'errors': errors,
+        'seconds': best,
+        'nodes_per_second': nodes / best if best else None,
+        'peak_memory_bytes': peak,
+    }
+
+
+def compare(results: Sequence[Dict[str, Any]], baseline: Dict[str, Any]) -> List[str]:
+    """Describe how `results` changed relative to a previous report."""
+    previous = {(entry['shape'], entry['size']): entry for entry in baseline['results']}
+    lines = []
+    for entry in results:
+        old = previous.get((entry['shape'], entry['size']))
+        if old is None:
+            continue
+        speedup = old['seconds'] / entry['seconds'] if entry['seconds'] else float('inf')
+        memory = entry['peak_memory_bytes'] / old['peak_memory_bytes'] if old['peak_memory_bytes'] else 1.0
+        lines.append(
+            f"{entry['shape']:>15} {entry['size']:>6}: {speedup:6.2f}x faster, "
+            f"{memory:5.2f}x peak memory, errors {old['errors']} -> {entry['errors']}"
+        )
+    return lines
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description=__doc__.splitlines()[0])
+    parser.add_argument('--shape', action='append', choices=sorted(SHAPES),
+                        help='shape to run, may be repeated (default: all)')
+    parser.add_argument('--size', action='append', type=int,
+                        help='size to run every selected shape at, may be repeated (default: per shape)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the best is kept')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--compare', metavar='REPORT', help='print the change relative to a previous report')
+    args = parser.parse_args(argv)
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    results = [
+        measure(shape, size, args.repeat)
+        for shape in args.shape or sorted(SHAPES)
+        for size in args.size or DEFAULT_SIZES[shape]
+    ]
+    report = {
+        'revision': _revision(),
+        'python': platform.python_version(),
+        'results': results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        for line in compare(results, baseline):
+            print(line, file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Generators of synthetic worst-case sources for the visitor.
+
+Every generator takes a single size parameter and returns the source of a module.
+"""
+from typing import Callable, Dict, List
+
+
+def _indent(depth: int) -> str:
+    return '    ' * depth
+
+
+def elif_chain(branches: int) -> str:
+    """One function dispatching over `branches` if/elif arms."""
+    lines = ['def dispatch(value):', '    if value == 0:', '        result = 0']
+    for i in range(1, branches):
+        lines += [f'    elif value == {i}:', f'        result = {i}']
+    lines += ['    else:', '        result = -1', '    return result']
+    return '\n'.join(lines) + '\n'
+
+
+def nested_if(depth: int) -> str:
+    """If/else statements nested `depth` levels deep."""
+    lines = ['def nested(value):']
+    for level in range(depth):
+        lines += [f'{_indent(level + 1)}if value > {level}:']
+    lines += [f'{_indent(depth + 1)}result = {depth}']
+    for level in reversed(range(depth)):
+        lines += [f'{_indent(level + 1)}else:', f'{_indent(level + 2)}result = {level}']
+    lines += ['    return result']
+    return '\n'.join(lines) + '\n'
+
+
+def nested_try(depth: int) -> str:
+    """Try/except statements nested `depth` levels deep, like layered retries."""
+    lines = ['def retry(call):']
+    for level in range(depth):
+        lines += [f'{_indent(level + 1)}try:']
+    lines += [f'{_indent(depth + 1)}result = call()']
+    for level in reversed(range(depth)):
+        lines += [f'{_indent(level + 1)}except OSError:', f'{_indent(level + 2)}result = {level}']
+    lines += ['    return result']
+    return '\n'.join(lines) + '\n'
+
+
+def nested_ifexp(depth: int) -> str:
+    """A conditional expression nested `depth` levels deep in its else branch."""
+    expression = 'default'
+    for level in reversed(range(depth)):
+        expression = f'(value{level} if flag{level} else {expression})'
+    names = ', '.join([f'value{level}, flag{level}' for level in range(depth)] + ['default'])
+    return f'def pick({names}):\n    return {expression}\n'
+
+
+def straight_line(statements: int) -> str:
+    """One function of `statements` assignments, each reading the previous one."""
+    lines = ['def compute(seed):', '    v0 = seed']
+    lines += [f'    v{i} = v{i - 1} + {i}' for i in range(1, statements)]
+    lines += [f'    return v{statements - 1}']
+    return '\n'.join(lines) + '\n'
+
+
+def huge_module(functions: int) -> str:
+    """A module of `functions` small functions calling each other and module constants."""
+    lines: List[str] = ['import os', 'LIMIT = 10', '']
+    for i in range(functions):
+        lines += [
+            f'def function_{i}(value, items=None):',
+            '    if value > LIMIT:',
+            '        result = os.path.join(str(value), "x")',
+            '    else:',
+            f'        result = function_{(i + 1) % functions}(value + 1)',
+            '    for item in items or []:',
+            '        result += item',
+            '    return result',
+            '',
+        ]
+    return '\n'.join(lines)
+
+
+def comprehensions(count: int) -> str:
+    """A function building `count` list, set, dict and generator comprehensions."""
+    lines = ['def build(rows):']
+    for i in range(count):
+        lines += [
+            f'    a{i} = [row for row in rows]',
+            f'    b{i} = {{key: row for key, row in enumerate(rows)}}',
+            f'    c{i} = {{row for row in rows}}',
+            f'    d{i} = sum(row for row in rows)',
+        ]
+    lines += ['    return rows']
+    return '\n'.join(lines) + '\n'
+
+
+SHAPES: Dict[str, Callable[[int], str]] = {
+    'elif_chain': elif_chain,
+    'nested_if': nested_if,
+    'nested_try': nested_try,
+    'nested_ifexp': nested_ifexp,
+    'straight_line': straight_line,
+    'huge_module': huge_module,
+    'comprehensions': comprehensions,
+}
+
+# Python refuses more than 100 levels of indentation, which caps the nested statement
+# shapes.
+DEFAULT_SIZES: Dict[str, List[int]] = {
+    'elif_chain': [50, 200, 800],
+    'nested_if': [10, 30, 90],
+    'nested_try': [10, 30, 90],
+    'nested_ifexp': [10, 30, 90],
+    'straight_line': [500, 2000, 8000],
+    'huge_module': [100, 500, 2000],
+    'comprehensions': [50, 200, 800],
+}
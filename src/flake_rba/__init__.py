@@ -1,3 +1,4 @@
-__all__ = ['ReferencedBeforeAssignmentASTPlugin']
+__all__ = ['BatchResults', 'ReferencedBeforeAssignmentASTPlugin', 'check_many']
 
+from flake_rba.api import BatchResults, check_many
 from flake_rba.plugin import ReferencedBeforeAssignmentASTPlugin
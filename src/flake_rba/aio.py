@@ -0,0 +1,110 @@
+"""asyncio entry points, for services and editors that can't block their event loop.
+
+Parsing and analysis run in an executor: the loop's default thread pool unless another
+one is given. The analysis holds the GIL, so a `ProcessPoolExecutor` is the one that
+scales with the number of files; a thread pool only keeps the loop responsive.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import Executor
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple, cast
+
+from flake_rba.api import Checker
+from flake_rba.plugin import Flake8ASTErrorInfo
+
+DEFAULT_CONCURRENCY = 8
+
+# Checkers of the current worker thread or process, by their options.
+_local = threading.local()
+CheckerOptions = Tuple[Optional[FrozenSet[str]], int, bool]
+
+
+def _checker(options: CheckerOptions) -> Checker:
+    checkers: Optional[Dict[CheckerOptions, Checker]] = getattr(_local, 'checkers', None)
+    if checkers is None:
+        checkers = _local.checkers = {}
+    checker = checkers.get(options)
+    if checker is None:
+        default_names, max_errors, fail_fast = options
+        checker = checkers[options] = Checker(default_names, max_errors=max_errors, fail_fast=fail_fast)
+    return checker
+
+
+def _analyze_source(source: str, filename: str, options: CheckerOptions) -> List[Flake8ASTErrorInfo]:
+    return _checker(options).check_source(source, filename)
+
+
+def _analyze_path(path: str, options: CheckerOptions) -> List[Flake8ASTErrorInfo]:
+    return _checker(options).check_path(path)
+
+
+async def _run(executor: Optional[Executor], func: Any, *args: Any) -> Any:
+    # Cancelling the caller cancels the call if it hasn't started yet; a call that's
+    # already running finishes in the executor and its result is dropped.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+
+async def analyze_source_async(
+        source: str,
+        filename: str = '<unknown>',
+        *,
+        executor: Optional[Executor] = None,
+        default_names: Optional[FrozenSet[str]] = None,
+        max_errors: int = 0,
+        fail_fast: bool = False,
+) -> List[Flake8ASTErrorInfo]:
+    """Check source code in `executor`; raises SyntaxError if it can't be parsed.
+
+    `max_errors` and `fail_fast` work like the arguments of `Checker`.
+    """
+    errors = await _run(executor, _analyze_source, source, filename, (default_names, max_errors, fail_fast))
+    return cast(List[Flake8ASTErrorInfo], errors)
+
+
+async def analyze_path_async(
+        path: str,
+        *,
+        executor: Optional[Executor] = None,
+        default_names: Optional[FrozenSet[str]] = None,
+        max_errors: int = 0,
+        fail_fast: bool = False,
+) -> List[Flake8ASTErrorInfo]:
+    """Read and check a file in `executor`; raises OSError, UnicodeError or SyntaxError."""
+    errors = await _run(executor, _analyze_path, path, (default_names, max_errors, fail_fast))
+    return cast(List[Flake8ASTErrorInfo], errors)
+
+
+async def analyze_paths_async(
+        paths: Sequence[str],
+        *,
+        executor: Optional[Executor] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        default_names: Optional[FrozenSet[str]] = None,
+        max_errors: int = 0,
+        fail_fast: bool = False,
+        return_exceptions: bool = False,
+) -> List[Any]:
+    """Check files in `executor`, at most `concurrency` at a time, and return their errors in order.
+
+    Like `asyncio.gather`, the first exception is raised unless `return_exceptions` is set,
+    in which case it takes the place of the file's errors. When the call is cancelled or
+    raises, the files that haven't been started are cancelled.
+    """
+    if concurrency < 1:
+        raise ValueError(f'concurrency must be at least 1, got {concurrency}')
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def analyze(path: str) -> List[Flake8ASTErrorInfo]:
+        async with semaphore:
+            return await analyze_path_async(
+                path, executor=executor, default_names=default_names, max_errors=max_errors, fail_fast=fail_fast,
+            )
+
+    tasks = [asyncio.ensure_future(analyze(path)) for path in paths]
+    try:
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,144 @@
+import ast
+import os
+import tokenize
+from array import array
+from itertools import islice
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from flake_rba.cache import FunctionCache
+from flake_rba.plugin import CODE, MSG, ErrorRecord, Flake8ASTErrorInfo, ReferencedBeforeAssignmentNodeVisitor
+
+# (line, column, message); the column is 1-based, as flake8 reports it.
+Report = Tuple[int, int, str]
+
+
+def as_reports(errors: Iterable[Flake8ASTErrorInfo]) -> List[Report]:
+    return [(error.line_number, error.offset + 1, error.msg) for error in errors]
+
+
+def failure_report(exc: Exception) -> Report:
+    """Report a file that couldn't be read (E902) or parsed (E999), like flake8 does."""
+    if isinstance(exc, SyntaxError):
+        return exc.lineno or 1, exc.offset or 1, f'E999 SyntaxError: {exc.msg}'
+    return 1, 1, f'E902 {type(exc).__name__}: {exc}'
+
+
+def read_source(path: str) -> str:
+    """Read a Python file, honouring its encoding declaration."""
+    with tokenize.open(path) as file:
+        return file.read()
+
+
+class Checker:
+    """Analysis setup reused across many files: the options, one visitor and its caches.
+
+    flake8 builds a new plugin object for every file; this is the counterpart for
+    callers that drive the analysis themselves.
+    """
+
+    def __init__(
+            self,
+            default_names: Optional[FrozenSet[str]] = None,
+            function_cache: Optional[FunctionCache] = None,
+            max_errors: int = 0,
+            fail_fast: bool = False,
+    ):
+        self.visitor = ReferencedBeforeAssignmentNodeVisitor(default_names, function_cache=function_cache)
+        # At most this many errors are returned per file, 0 for no limit. Fail-fast stops
+        # the walk at the limit (1 if unset) instead of finishing it.
+        self.max_errors = max_errors or (1 if fail_fast else 0)
+        self.fail_fast = fail_fast
+
+    def check_tree(self, tree: ast.AST, lines: Optional[Sequence[str]] = None) -> List[Flake8ASTErrorInfo]:
+        visitor = self.visitor
+        visitor.reset(lines)
+        try:
+            if self.fail_fast:
+                errors: Iterable[ErrorRecord] = islice(visitor.iter_visit(tree), self.max_errors)
+            else:
+                visitor.visit(tree)
+                errors = visitor.errors[:self.max_errors] if self.max_errors else visitor.errors
+            return [error.info() for error in errors]
+        finally:
+            visitor.reset()
+
+    def check_source(self, source: str, filename: str = '<unknown>') -> List[Flake8ASTErrorInfo]:
+        """Check source code; raises SyntaxError if it can't be parsed."""
+        tree = ast.parse(source, filename)
+        return self.check_tree(tree, source.splitlines(True))
+
+    def check_path(self, path: str) -> List[Flake8ASTErrorInfo]:
+        return self.check_source(read_source(path), path)
+
+
+class BatchResults:
+    """Errors of a batch of files as parallel columns, one entry per error.
+
+    `file_index` points into `files` and `name_id` into `names`, the table of distinct
+    names; columns are `array('l')`, so aggregating millions of errors needs no Python
+    object per error. Files that couldn't be read or parsed are listed in `failures`,
+    informational reports such as F829 in `notices`.
+    """
+
+    def __init__(self, files: List[str]):
+        self.files = files
+        self.file_index = array('l')
+        self.line = array('l')
+        self.col = array('l')
+        self.name_id = array('l')
+        self.names: List[str] = []
+        self.failures: List[Tuple[int, Report]] = []
+        self.notices: List[Tuple[int, Report]] = []
+        self._name_ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.line)
+
+    def _add(self, file_index: int, errors: Iterable[ErrorRecord]) -> None:
+        name_ids = self._name_ids
+        for error in errors:
+            if error.code != CODE:
+                self.notices.append((file_index, (error.line_number, error.offset + 1, error.msg)))
+                continue
+            name = error.name
+            name_id = name_ids.get(name)
+            if name_id is None:
+                name_id = name_ids[name] = len(self.names)
+                self.names.append(name)
+            self.file_index.append(file_index)
+            self.line.append(error.line_number)
+            self.col.append(error.offset)
+            self.name_id.append(name_id)
+
+    def reports(self) -> Iterator[Tuple[str, Report]]:
+        """Yield `(file, (line, column, message))` for every error, columns 1-based as flake8 has them."""
+        files, names = self.files, self.names
+        for file_index, line, col, name_id in zip(self.file_index, self.line, self.col, self.name_id):
+            yield files[file_index], (line, col + 1, MSG % names[name_id])
+
+
+def check_many(
+        sources_or_paths: Iterable[Union[str, 'os.PathLike[str]', Tuple[str, str]]],
+        default_names: Optional[FrozenSet[str]] = None,
+        function_cache: Optional[FunctionCache] = None,
+) -> BatchResults:
+    """Check many files with one visitor and collect the errors into columns.
+
+    Items are paths, or `(filename, source)` pairs for code that isn't on disk.
+    """
+    visitor = ReferencedBeforeAssignmentNodeVisitor(default_names, function_cache=function_cache)
+    items = list(sources_or_paths)
+    results = BatchResults([os.fspath(item) if not isinstance(item, tuple) else item[0] for item in items])
+    for file_index, item in enumerate(items):
+        filename = results.files[file_index]
+        try:
+            source = item[1] if isinstance(item, tuple) else read_source(filename)
+            tree = ast.parse(source, filename)
+        except (SyntaxError, OSError, UnicodeError, ValueError) as exc:
+            results.failures.append((file_index, failure_report(exc)))
+            continue
+        visitor.reset(source.splitlines(True))
+        visitor.visit(tree)
+        results._add(file_index, visitor.errors)
+    visitor.reset()
+    return results
@@ -0,0 +1,95 @@
+import sys
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+Version = Tuple[int, int]
+
+# Builtins of Python 3.6, the oldest target we support.
+_PYTHON36_BUILTINS = frozenset((
+    'ArithmeticError', 'AssertionError', 'AttributeError', 'BaseException', 'BlockingIOError',
+    'BrokenPipeError', 'BufferError', 'BytesWarning', 'ChildProcessError', 'ConnectionAbortedError',
+    'ConnectionError', 'ConnectionRefusedError', 'ConnectionResetError', 'DeprecationWarning',
+    'EOFError', 'Ellipsis', 'EnvironmentError', 'Exception', 'False', 'FileExistsError',
+    'FileNotFoundError', 'FloatingPointError', 'FutureWarning', 'GeneratorExit', 'IOError',
+    'ImportError', 'ImportWarning', 'IndentationError', 'IndexError', 'InterruptedError',
+    'IsADirectoryError', 'KeyError', 'KeyboardInterrupt', 'LookupError', 'MemoryError',
+    'ModuleNotFoundError', 'NameError', 'None', 'NotADirectoryError', 'NotImplemented',
+    'NotImplementedError', 'OSError', 'OverflowError', 'PendingDeprecationWarning',
+    'PermissionError', 'ProcessLookupError', 'RecursionError', 'ReferenceError', 'ResourceWarning',
+    'RuntimeError', 'RuntimeWarning', 'StopAsyncIteration', 'StopIteration', 'SyntaxError',
+    'SyntaxWarning', 'SystemError', 'SystemExit', 'TabError', 'TimeoutError', 'True', 'TypeError',
+    'UnboundLocalError', 'UnicodeDecodeError', 'UnicodeEncodeError', 'UnicodeError',
+    'UnicodeTranslateError', 'UnicodeWarning', 'UserWarning', 'ValueError', 'Warning',
+    'ZeroDivisionError', '__build_class__', '__debug__', '__import__', 'abs', 'all', 'any', 'ascii',
+    'bin', 'bool', 'bytearray', 'bytes', 'callable', 'chr', 'classmethod', 'compile', 'complex',
+    'delattr', 'dict', 'dir', 'divmod', 'enumerate', 'eval', 'exec', 'filter', 'float', 'format',
+    'frozenset', 'getattr', 'globals', 'hasattr', 'hash', 'hex', 'id', 'input', 'int', 'isinstance',
+    'issubclass', 'iter', 'len', 'list', 'locals', 'map', 'max', 'memoryview', 'min', 'next',
+    'object', 'oct', 'open', 'ord', 'pow', 'print', 'property', 'range', 'repr', 'reversed', 'round',
+    'set', 'setattr', 'slice', 'sorted', 'staticmethod', 'str', 'sum', 'super', 'tuple', 'type',
+    'vars', 'zip',
+))
+
+# Builtins introduced by later releases.
+_ADDED_BUILTINS = {
+    (3, 7): ('breakpoint',),
+    (3, 10): ('aiter', 'anext', 'EncodingWarning'),
+    (3, 11): ('BaseExceptionGroup', 'ExceptionGroup'),
+    (3, 13): ('PythonFinalizationError',),
+}
+
+# Module attributes and the helpers installed by the `site` module. Assuming here that
+# we always check a source code in files, and __file__ is defined.
+_MODULE_NAMES = frozenset((
+    '__builtins__', '__doc__', '__file__', '__loader__', '__name__', '__package__', '__spec__',
+    'copyright', 'credits', 'exit', 'help', 'license', 'quit',
+))
+
+MIN_VERSION: Version = (3, 6)
+MAX_VERSION: Version = (3, 13)
+
+
+def _build_registry() -> Dict[Version, FrozenSet[str]]:
+    registry = {}
+    names = _PYTHON36_BUILTINS | _MODULE_NAMES
+    for minor in range(MIN_VERSION[1], MAX_VERSION[1] + 1):
+        names = names.union(_ADDED_BUILTINS.get((3, minor), ()))
+        registry[(3, minor)] = names
+    return registry
+
+
+BUILTINS_BY_VERSION = _build_registry()
+
+
+def parse_version(value: str) -> Version:
+    """Parse a target version such as '3.8' or 'py38'."""
+    text = value.strip().lower()
+    if text.startswith('py'):
+        text = text[2:]
+        if '.' not in text and len(text) > 1:
+            text = text[0] + '.' + text[1:]
+    major, _, minor = text.partition('.')
+    try:
+        return int(major), int(minor)
+    except ValueError:
+        raise ValueError(f'invalid target Python version: {value!r}') from None
+
+
+def builtins_for(version: Version) -> FrozenSet[str]:
+    """Return builtin names of the target version, clamped to the supported range."""
+    version = (version[0], version[1])
+    if version < MIN_VERSION:
+        version = MIN_VERSION
+    elif version > MAX_VERSION:
+        version = MAX_VERSION
+    return BUILTINS_BY_VERSION[version]
+
+
+def known_names(version: Optional[Version] = None, extra: Iterable[str] = ()) -> FrozenSet[str]:
+    """Names that never need an assignment: builtins of the target version plus `extra`."""
+    if version is None:
+        version = (sys.version_info[0], sys.version_info[1])
+    names = builtins_for(version)
+    extra_names = frozenset(extra)
+    if extra_names:
+        names = names | extra_names
+    return names
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# Bump whenever the layout of cache entries changes.
+CACHE_FORMAT = '1'
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+# Eviction lists the whole directory, so it only runs every that many writes.
+_EVICT_INTERVAL = 64
+
+Result = Tuple[int, int, str]
+# Source lines of a function and a digest of the names visible to it.
+FunctionKey = Tuple[Tuple[str, ...], str]
+# Line relative to the function, column, code, name and node class of an error in it.
+FunctionResult = Tuple[int, int, str, str, type]
+
+
+class ResultCache:
+    """Errors found in a file, stored on disk under a hash of the file content.
+
+    Entries are written to a temporary file and renamed into place, so processes sharing
+    the directory never read a partial entry. Reading an entry refreshes its mtime, and
+    the least recently used entries are removed once the directory outgrows `max_size`
+    bytes.
+    """
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(lines: Sequence[str], *parts: str) -> str:
+        digest = hashlib.sha256(CACHE_FORMAT.encode())
+        for part in parts:
+            digest.update(b'\0' + part.encode())
+        digest.update(b'\0')
+        for line in lines:
+            digest.update(line.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key: str) -> Optional[List[Result]]:
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as file:
+                entries = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return [(line, col, msg) for line, col, msg in entries]
+
+    def put(self, key: str, results: Iterable[Result]) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump([list(result) for result in results], file)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._writes += 1
+        if self._writes % _EVICT_INTERVAL == 1:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache is within 90% of its size."""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith('.json') or entry.name.startswith('.tmp-'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_size:
+            return
+        entries.sort()
+        target = self.max_size * 9 // 10
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                # Already evicted by another process.
+                pass
+            total -= size
+
+
+class FunctionCache:
+    """In-memory LRU map from a function fingerprint to the errors found in its body.
+
+    Errors are stored with line numbers relative to the first line of the function, so
+    an entry applies wherever the same function text appears with the same names visible.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[FunctionKey, Tuple[FunctionResult, ...]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(lines: Sequence[str], visible_names: Iterable[str]) -> FunctionKey:
+        # The lines are compared rather than hashed into a digest: strings cache their
+        # hash, so the lines of a nested function aren't hashed again for every
+        # function around it.
+        names = '\0'.join(sorted(visible_names)).encode('utf-8', 'surrogatepass')
+        return tuple(lines), hashlib.sha256(names).hexdigest()
+
+    def get(self, key: FunctionKey) -> Optional[Tuple[FunctionResult, ...]]:
+        entries = self._entries
+        results = entries.get(key)
+        if results is not None:
+            entries.move_to_end(key)
+        return results
+
+    def put(self, key: FunctionKey, results: Iterable[FunctionResult]) -> None:
+        entries = self._entries
+        entries[key] = tuple(results)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
@@ -0,0 +1,591 @@
+"""Definite assignment over per-scope control flow graphs.
+
+An alternative to ReferencedBeforeAssignmentNodeVisitor: every module, class, function
+and lambda body is turned into a graph of basic blocks in one pass over its statements,
+each block holding the loads, bindings and deletions of names in evaluation order.
+A worklist solver then computes the names definitely bound on entry to every block,
+and loads of local names that aren't are reported.
+
+Names a scope never binds are resolved against the names bound anywhere in the
+enclosing scopes, since a function body may run after its enclosing scope has
+finished. As in the default engine, top-level functions and classes count as defined
+from the start of the module. Known limitations: the bodies of `finally` clauses are only analysed for the
+normal paths into them, exceptions swallowed by context managers are not modelled and
+annotations are never evaluated.
+"""
+import ast
+import sys
+from collections import deque
+from typing import Deque, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from flake_rba.traversal import child_nodes
+
+LOAD, BIND, DEL = 0, 1, 2
+# Every name; the state of blocks no path has reached yet.
+TOP = -1
+# Stands for all names in a BIND event of `from module import *`.
+STAR = '*'
+
+Event = Tuple[int, str, Optional[ast.AST]]
+
+_FUNCTIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)
+_COMPREHENSIONS = (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)
+_PATTERN = getattr(ast, 'pattern', None)
+_NAMED_EXPR = getattr(ast, 'NamedExpr', None)
+
+# Before 3.8 literals have classes of their own, holding the value in these attributes.
+# Later they are deprecated aliases of ast.Constant, and reading the attributes warns.
+_LITERAL_VALUES: Dict[type, str] = {}
+if sys.version_info < (3, 8):  # pragma: no cover
+    _LITERAL_VALUES = {ast.NameConstant: 'value', ast.Num: 'n', ast.Str: 's'}
+
+
+class Block:
+    """A basic block: events run in order, then control passes to one of `succs`.
+
+    Any event may raise, passing control to `exc_target`, the handler dispatch of the
+    innermost enclosing `try`.
+    """
+    __slots__ = ('index', 'events', 'succs', 'exc_target')
+
+    def __init__(self, index: int, exc_target: Optional['Block']):
+        # Position in the blocks of the scope.
+        self.index = index
+        self.events: List[Event] = []
+        self.succs: List[Block] = []
+        self.exc_target = exc_target
+
+
+class Scope:
+    """A module, class or function body with its graph and the names it binds."""
+
+    def __init__(self, node: ast.AST, parent: Optional['Scope']):
+        self.node = node
+        self.parent = parent
+        self.is_class = isinstance(node, ast.ClassDef)
+        self.blocks: List[Block] = []
+        self.params: List[str] = []
+        self.bound: Set[str] = set()
+        self.globals: Set[str] = set()
+        self.nonlocals: Set[str] = set()
+        self.star_import = False
+
+    def local_names(self) -> Set[str]:
+        return self.bound - self.globals - self.nonlocals
+
+
+def _constant_truth(node: ast.AST) -> Optional[bool]:
+    if isinstance(node, ast.Constant):
+        return bool(node.value)
+    field = _LITERAL_VALUES.get(node.__class__)
+    if field is not None:
+        return bool(getattr(node, field))
+    return None
+
+
+def _is_irrefutable(pattern: ast.AST) -> bool:
+    if isinstance(pattern, ast.MatchAs):  # type: ignore
+        return pattern.pattern is None or _is_irrefutable(pattern.pattern)  # type: ignore
+    if isinstance(pattern, ast.MatchOr):  # type: ignore
+        return any(_is_irrefutable(alternative) for alternative in pattern.patterns)  # type: ignore
+    return False
+
+
+class ScopeBuilder:
+    """Builds the graph of one scope, queueing the scopes nested in it."""
+
+    def __init__(self, scope: Scope, nested: List[Scope]):
+        self.scope = scope
+        self.nested = nested
+        self.exc_targets: List[Block] = []
+        # (continue target, break target) of enclosing loops.
+        self.loops: List[Tuple[Block, Block]] = []
+        self.current = self.entry = self._new_block()
+
+    def build(self) -> None:
+        node = self.scope.node
+        if isinstance(node, ast.Lambda):
+            self._expr(node.body)
+        else:
+            self._statements(node.body)  # type: ignore
+
+    def _new_block(self) -> Block:
+        block = Block(len(self.scope.blocks), self.exc_targets[-1] if self.exc_targets else None)
+        self.scope.blocks.append(block)
+        return block
+
+    def _follow(self, block: Block) -> Block:
+        """Make `block` a successor of the current block and continue in it."""
+        self.current.succs.append(block)
+        self.current = block
+        return block
+
+    def _jump(self, target: Optional[Block]) -> None:
+        """End the current block; code following a jump is unreachable until a join."""
+        if target is not None:
+            self.current.succs.append(target)
+        self.current = self._new_block()
+
+    def _emit(self, kind: int, name: str, node: Optional[ast.AST] = None) -> None:
+        if kind != LOAD:
+            self.scope.bound.add(name)
+        self.current.events.append((kind, name, node))
+
+    def _nest(self, node: ast.AST) -> None:
+        self.nested.append(Scope(node, self.scope))
+
+    def _statements(self, body: List[ast.stmt]) -> None:
+        for stmt in body:
+            method = getattr(self, '_stmt_' + stmt.__class__.__name__, None)
+            if method is None:
+                for child in child_nodes(stmt):
+                    self._expr(child)
+            else:
+                method(stmt)
+
+    def _expr(self, root: ast.AST, shadowed: FrozenSet[str] = frozenset()) -> None:
+        # `shadowed` holds the targets of the comprehensions `root` belongs to.
+        events = self.current.events
+        bound = self.scope.bound
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            cls = node.__class__
+            if cls is ast.Name:
+                name = node.id  # type: ignore
+                if name not in shadowed:
+                    ctx = node.ctx.__class__  # type: ignore
+                    if ctx is ast.Load:
+                        events.append((LOAD, name, node))
+                    else:
+                        bound.add(name)
+                        events.append((DEL if ctx is ast.Del else BIND, name, node))
+            elif cls is ast.Constant:
+                continue
+            elif cls is _NAMED_EXPR:
+                # The value is evaluated first, and the target is never a comprehension's.
+                self._expr(node.value, shadowed)  # type: ignore
+                self._expr(node.target)  # type: ignore
+            elif cls is ast.Lambda:
+                self._nest(node)
+                args = node.args  # type: ignore
+                stack.extend(reversed([default for default in args.defaults + args.kw_defaults if default is not None]))
+            elif cls in _COMPREHENSIONS:
+                self._comprehension(node, shadowed)
+            else:
+                stack.extend(reversed(child_nodes(node)))
+
+    def _comprehension(self, node: ast.AST, shadowed: FrozenSet[str]) -> None:
+        # The first iterable is evaluated in the enclosing scope; everything else in a
+        # scope of its own, in which only the targets are bound.
+        generators = node.generators  # type: ignore
+        inner = shadowed.union(
+            target.id
+            for generator in generators
+            for target in ast.walk(generator.target)
+            if isinstance(target, ast.Name)
+        )
+        self._expr(generators[0].iter, shadowed)
+        for index, generator in enumerate(generators):
+            if index:
+                self._expr(generator.iter, inner)
+            for condition in generator.ifs:
+                self._expr(condition, inner)
+        if isinstance(node, ast.DictComp):
+            self._expr(node.key, inner)
+            self._expr(node.value, inner)
+        else:
+            self._expr(node.elt, inner)  # type: ignore
+
+    def _stmt_FunctionDef(self, node: ast.FunctionDef) -> None:
+        for child in node.decorator_list + node.args.defaults:
+            self._expr(child)
+        for default in node.args.kw_defaults:
+            if default is not None:
+                self._expr(default)
+        self._emit(BIND, node.name, node)
+        self._nest(node)
+
+    _stmt_AsyncFunctionDef = _stmt_FunctionDef
+
+    def _stmt_ClassDef(self, node: ast.ClassDef) -> None:
+        for child in node.decorator_list + node.bases + node.keywords:  # type: ignore
+            self._expr(child)
+        self._emit(BIND, node.name, node)
+        self._nest(node)
+
+    def _stmt_Assign(self, node: ast.Assign) -> None:
+        self._expr(node.value)
+        for target in node.targets:
+            self._expr(target)
+
+    def _stmt_AugAssign(self, node: ast.AugAssign) -> None:
+        target = node.target
+        if isinstance(target, ast.Name):
+            self._emit(LOAD, target.id, target)
+            self._expr(node.value)
+            self._emit(BIND, target.id, target)
+        else:
+            self._expr(target)
+            self._expr(node.value)
+
+    def _stmt_AnnAssign(self, node: ast.AnnAssign) -> None:
+        if node.value is not None:
+            self._expr(node.value)
+            self._expr(node.target)
+        elif isinstance(node.target, ast.Name):
+            # Annotating a name makes it local without binding it.
+            self.scope.bound.add(node.target.id)
+        else:
+            for child in child_nodes(node.target):
+                self._expr(child)
+
+    def _stmt_Import(self, node: ast.Import) -> None:
+        for alias in node.names:
+            self._emit(BIND, alias.asname or alias.name.partition('.')[0], node)
+
+    def _stmt_ImportFrom(self, node: ast.ImportFrom) -> None:
+        for alias in node.names:
+            if alias.name == '*':
+                self.scope.star_import = True
+                self.current.events.append((BIND, STAR, node))
+            else:
+                self._emit(BIND, alias.asname or alias.name, node)
+
+    def _stmt_Global(self, node: ast.Global) -> None:
+        self.scope.globals.update(node.names)
+
+    def _stmt_Nonlocal(self, node: ast.Nonlocal) -> None:
+        self.scope.nonlocals.update(node.names)
+
+    def _stmt_Return(self, node: ast.Return) -> None:
+        if node.value is not None:
+            self._expr(node.value)
+        self._jump(None)
+
+    def _stmt_Raise(self, node: ast.Raise) -> None:
+        for child in child_nodes(node):
+            self._expr(child)
+        # The exception edge of the block already leads to the handlers.
+        self._jump(None)
+
+    def _stmt_Break(self, node: ast.Break) -> None:
+        self._jump(self.loops[-1][1] if self.loops else None)
+
+    def _stmt_Continue(self, node: ast.Continue) -> None:
+        self._jump(self.loops[-1][0] if self.loops else None)
+
+    def _stmt_If(self, node: ast.If) -> None:
+        # elif chains are followed in a loop, however long they are.
+        ends: List[Block] = []
+        while True:
+            self._expr(node.test)
+            branch = self.current
+            self._follow(self._new_block())
+            self._statements(node.body)
+            ends.append(self.current)
+            self.current = branch
+            self._follow(self._new_block())
+            if len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If):
+                node = node.orelse[0]
+                continue
+            self._statements(node.orelse)
+            ends.append(self.current)
+            break
+        join = self._new_block()
+        for end in ends:
+            end.succs.append(join)
+        self.current = join
+
+    def _stmt_While(self, node: ast.While) -> None:
+        header = self._follow(self._new_block())
+        self._expr(node.test)
+        after = self._new_block()
+        orelse = self._new_block()
+        if not _constant_truth(node.test):
+            header.succs.append(orelse)
+        self._loop_body(header, after, node.body)
+        self.current = orelse
+        self._statements(node.orelse)
+        self._follow(after)
+
+    def _stmt_For(self, node: ast.For) -> None:
+        self._expr(node.iter)
+        header = self._follow(self._new_block())
+        after = self._new_block()
+        orelse = self._new_block()
+        header.succs.append(orelse)
+        self._loop_body(header, after, node.body, node.target)
+        self.current = orelse
+        self._statements(node.orelse)
+        self._follow(after)
+
+    _stmt_AsyncFor = _stmt_For
+
+    def _loop_body(self, header: Block, after: Block, body: List[ast.stmt], target: Optional[ast.AST] = None) -> None:
+        self.current = header
+        self._follow(self._new_block())
+        if target is not None:
+            # Bound on every iteration.
+            self._expr(target)
+        self.loops.append((header, after))
+        self._statements(body)
+        self.loops.pop()
+        self.current.succs.append(header)
+
+    def _stmt_With(self, node: ast.With) -> None:
+        for item in node.items:
+            self._expr(item.context_expr)
+            if item.optional_vars is not None:
+                self._expr(item.optional_vars)
+        self._statements(node.body)
+
+    _stmt_AsyncWith = _stmt_With
+
+    def _stmt_Try(self, node: ast.Try) -> None:
+        dispatch = self._new_block()
+        self.exc_targets.append(dispatch)
+        self._follow(self._new_block())
+        self._statements(node.body)
+        self.exc_targets.pop()
+        body_end = self.current
+
+        ends = []
+        for handler in node.handlers:
+            self.current = dispatch
+            self._follow(self._new_block())
+            if handler.type is not None:
+                self._expr(handler.type)
+            if handler.name is not None:
+                self._emit(BIND, handler.name, handler)
+            self._statements(handler.body)
+            if handler.name is not None:
+                # The name is deleted when the handler ends.
+                self._emit(DEL, handler.name)
+            ends.append(self.current)
+
+        self.current = body_end
+        self._follow(self._new_block())
+        self._statements(node.orelse)
+        ends.append(self.current)
+
+        if node.finalbody:
+            final = self._new_block()
+            for end in ends:
+                end.succs.append(final)
+            self.current = final
+            self._statements(node.finalbody)
+            ends = [self.current]
+
+        join = self._new_block()
+        for end in ends:
+            end.succs.append(join)
+        self.current = join
+
+    _stmt_TryStar = _stmt_Try
+
+    def _stmt_Match(self, node: ast.AST) -> None:
+        self._expr(node.subject)  # type: ignore
+        dispatch = self.current
+        ends = []
+        exhaustive = False
+        for case in node.cases:  # type: ignore
+            self.current = dispatch
+            self._follow(self._new_block())
+            self._pattern(case.pattern)
+            if case.guard is not None:
+                self._expr(case.guard)
+            self._statements(case.body)
+            ends.append(self.current)
+            exhaustive = exhaustive or (case.guard is None and _is_irrefutable(case.pattern))
+        if not exhaustive:
+            ends.append(dispatch)
+        join = self._new_block()
+        for end in ends:
+            end.succs.append(join)
+        self.current = join
+
+    def _pattern(self, root: ast.AST) -> None:
+        stack = [root]
+        while stack:
+            pattern = stack.pop()
+            for child in reversed(child_nodes(pattern)):
+                if isinstance(child, _PATTERN):  # type: ignore
+                    stack.append(child)
+                else:
+                    self._expr(child)
+            for field in ('name', 'rest'):
+                name = getattr(pattern, field, None)
+                if name is not None:
+                    self._emit(BIND, name, pattern)
+
+
+def _reachable(blocks: List[Block]) -> List[Block]:
+    seen = [False] * len(blocks)
+    seen[0] = True
+    order = [blocks[0]]
+    for block in order:
+        targets = block.succs if block.exc_target is None else block.succs + [block.exc_target]
+        for target in targets:
+            if not seen[target.index]:
+                seen[target.index] = True
+                order.append(target)
+    return order
+
+
+def solve(blocks: List[Block], entry_state: int, bits: Dict[str, int]) -> List[Optional[int]]:
+    """Return the names definitely bound on entry to each block, None for unreachable ones.
+
+    The entry block is `blocks[0]`. States are bitmasks over `bits`; names without a bit
+    are ignored. Exception edges carry the state on entry to the raising block minus
+    anything it deletes, which is no larger than the state at any point inside it.
+    """
+    if len(blocks) == 1:
+        return [entry_state]
+    reachable = _reachable(blocks)
+    size = len(blocks)
+    gens = [0] * size
+    kills = [0] * size
+    deleted = [0] * size
+    preds: List[List[int]] = [[] for _ in range(size)]
+    exc_preds: List[List[int]] = [[] for _ in range(size)]
+    for block in reachable:
+        index = block.index
+        gen = kill = dels = 0
+        for kind, name, _ in block.events:
+            if kind == LOAD:
+                continue
+            mask = TOP if name == STAR else bits.get(name, 0)
+            if kind == BIND:
+                gen |= mask
+                kill &= ~mask
+            else:
+                gen &= ~mask
+                kill |= mask
+                dels |= mask
+        gens[index], kills[index], deleted[index] = gen, kill, dels
+        for succ in block.succs:
+            preds[succ.index].append(index)
+        if block.exc_target is not None:
+            exc_preds[block.exc_target.index].append(index)
+
+    state_in: List[Optional[int]] = [None] * size
+    state_out = [TOP] * size
+    for block in reachable:
+        state_in[block.index] = TOP
+    worklist: Deque[Block] = deque(reachable)
+    queued = [False] * size
+    for block in reachable:
+        queued[block.index] = True
+    while worklist:
+        block = worklist.popleft()
+        index = block.index
+        queued[index] = False
+        state = entry_state if index == 0 else TOP
+        for pred in preds[index]:
+            state &= state_out[pred]
+        for pred in exc_preds[index]:
+            state &= state_in[pred] & ~deleted[pred]  # type: ignore
+        changed_in = state != state_in[index]
+        state_in[index] = state
+        out = (state & ~kills[index]) | gens[index]
+        targets: List[Block] = []
+        if out != state_out[index]:
+            state_out[index] = out
+            targets.extend(block.succs)
+        if changed_in and block.exc_target is not None:
+            targets.append(block.exc_target)
+        for target in targets:
+            if not queued[target.index]:
+                queued[target.index] = True
+                worklist.append(target)
+    return state_in
+
+
+def build_scopes(tree: ast.AST) -> List[Scope]:
+    """Build the graphs of the module and of every scope nested in it, outermost first."""
+    scopes = [Scope(tree, None)]
+    for scope in scopes:
+        node = scope.node
+        if isinstance(node, _FUNCTIONS):
+            args = node.args
+            params = getattr(args, 'posonlyargs', []) + args.args + args.kwonlyargs
+            params += [arg for arg in (args.vararg, args.kwarg) if arg is not None]
+            scope.params = [arg.arg for arg in params]
+        elif scope.is_class:
+            scope.params = ['__module__', '__qualname__']
+        scope.bound.update(scope.params)
+        ScopeBuilder(scope, scopes).build()
+    return scopes
+
+
+def _visible_names(scope: Scope, module_names: Set[str]) -> Set[str]:
+    """Names bound anywhere in the scopes enclosing `scope` that its code can see."""
+    names: Set[str] = set()
+    parent = scope.parent
+    while parent is not None:
+        if parent.parent is None:
+            names |= module_names
+        elif not parent.is_class:
+            names |= parent.local_names()
+        elif isinstance(scope.node, _FUNCTIONS) and scope.parent is parent:
+            # The implicit closure of methods.
+            names.add('__class__')
+        parent = parent.parent
+    return names
+
+
+def unbound_loads(tree: ast.AST, default_names: FrozenSet[str]) -> List[ast.Name]:
+    """Return the Name nodes that may be loaded before their name is bound, by position."""
+    scopes = build_scopes(tree)
+    module = scopes[0]
+    # Names bound through `global` are set whenever some function runs, so they aren't
+    # tracked through the module body.
+    global_names = set()
+    for scope in scopes[1:]:
+        global_names |= scope.globals & scope.bound
+    module_names = module.bound | global_names
+    star_import = module.star_import
+
+    found: List[ast.Name] = []
+    for scope in scopes:
+        local_names = scope.local_names()
+        if scope is module:
+            local_names -= global_names
+        bits = {name: 1 << index for index, name in enumerate(sorted(local_names))}
+        visible = module_names if scope is module else _visible_names(scope, module_names)
+
+        entry_state = 0
+        for name in scope.params:
+            entry_state |= bits.get(name, 0)
+        if scope is module or scope.is_class:
+            # Until a module or class binds a name, loading it finds the builtin or,
+            # in a class, the name of an enclosing scope.
+            for name, bit in bits.items():
+                if name in default_names or (scope.is_class and name in visible):
+                    entry_state |= bit
+        if scope is module:
+            # Like the default engine, count top-level functions and classes as defined
+            # from the start, so that code may refer to them before their definition.
+            for stmt in getattr(tree, 'body', ()):
+                if isinstance(stmt, (ast.FunctionDef, ast.ClassDef)):
+                    entry_state |= bits.get(stmt.name, 0)
+        state_in = solve(scope.blocks, entry_state, bits)
+
+        for block, state in zip(scope.blocks, state_in):
+            if state is None:
+                continue
+            for kind, name, node in block.events:
+                name_bit = bits.get(name)
+                if kind == LOAD:
+                    if name_bit is not None:
+                        if not state & name_bit:
+                            found.append(node)  # type: ignore
+                    elif not (name in default_names or name in visible or star_import):
+                        found.append(node)  # type: ignore
+                elif name == STAR:
+                    state = TOP
+                elif name_bit is not None:
+                    state = state | name_bit if kind == BIND else state & ~name_bit
+    found.sort(key=lambda node: (node.lineno, node.col_offset))
+    return found
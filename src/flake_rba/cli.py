@@ -0,0 +1,163 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import FrozenSet, Iterator, List, Optional, Sequence, Tuple
+
+from flake_rba.api import Checker, Report, as_reports, failure_report
+from flake_rba.builtin_names import known_names, parse_version
+from flake_rba.cache import FunctionCache
+from flake_rba.daemon import check_remote, serve
+from flake_rba.files import DEFAULT_EXCLUDE, iter_python_files
+from flake_rba.plugin import _split_names
+from flake_rba.watch import DEFAULT_POLL_INTERVAL, watch
+
+_worker_checker: Optional[Checker] = None
+
+
+def _init_worker(default_names: FrozenSet[str], max_errors: int = 0, fail_fast: bool = False) -> None:
+    global _worker_checker
+    _worker_checker = Checker(default_names, FunctionCache(), max_errors, fail_fast)
+
+
+def check_file(path: str) -> List[Report]:
+    """Check a file with the checker of the current worker process."""
+    checker = _worker_checker
+    if checker is None:
+        checker = Checker()
+    try:
+        errors = checker.check_path(path)
+    except (SyntaxError, OSError, UnicodeError, ValueError) as exc:
+        return [failure_report(exc)]
+    return as_reports(errors)
+
+
+def check_files(
+        paths: Sequence[str],
+        default_names: FrozenSet[str],
+        jobs: int,
+        max_errors: int = 0,
+        fail_fast: bool = False,
+) -> Iterator[Tuple[str, List[Report]]]:
+    """Check files, fanning them out to `jobs` worker processes, and yield reports in order.
+
+    Closing the iterator early cancels the files that haven't been started yet.
+    """
+    if jobs <= 1 or len(paths) <= 1:
+        _init_worker(default_names, max_errors, fail_fast)
+        for path in paths:
+            yield path, check_file(path)
+        return
+
+    chunksize = max(1, len(paths) // (jobs * 8))
+    initargs = (default_names, max_errors, fail_fast)
+    with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=initargs) as executor:
+        results = executor.map(check_file, paths, chunksize=chunksize)
+        try:
+            yield from zip(paths, results)
+        finally:
+            # Cancels the pending chunks, so leaving the pool doesn't wait for them.
+            results.close()  # type: ignore
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='python -m flake_rba',
+        description='Find variables referenced before assignment (F823) without running flake8.',
+    )
+    parser.add_argument('paths', nargs='*', default=['.'], metavar='PATH',
+                        help='files and directories to check (default: current directory)')
+    parser.add_argument('--exclude', default=DEFAULT_EXCLUDE,
+                        help='comma-separated glob patterns of files and directories to skip '
+                             '(default: %(default)s)')
+    parser.add_argument('--extend-exclude', default='',
+                        help='comma-separated patterns to skip in addition to --exclude')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--target-version', default=None,
+                        help='Python version of the checked code, e.g. 3.8')
+    parser.add_argument('--extra-globals', default='',
+                        help='comma-separated names to treat as always defined')
+    parser.add_argument('--max-errors-per-file', type=int, default=0,
+                        help='report at most this many errors per file, 0 for all (default: %(default)s)')
+    parser.add_argument('--fail-fast', action='store_true',
+                        help='stop at the first file with errors, and stop checking a file once '
+                             '--max-errors-per-file errors (1 if unset) are found')
+    parser.add_argument('--serve', action='store_true',
+                        help='run as a daemon keeping parsed files and results in memory, serving '
+                             'checks on a Unix socket until stopped')
+    parser.add_argument('--daemon', action='store_true',
+                        help='send the check to the running daemon, checking in this process if there is none')
+    parser.add_argument('--watch', action='store_true',
+                        help='check once, then keep re-checking the files that change and print '
+                             'new (+) and resolved (-) errors, until interrupted')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='seconds between checks for changes where inotify is not available '
+                             '(default: %(default)s)')
+    parser.add_argument('--socket', default=None,
+                        help='Unix socket of the daemon (default: $FLAKE_RBA_SOCKET, or a per-user '
+                             'socket in $XDG_RUNTIME_DIR or a private directory in the temporary directory)')
+    return parser
+
+
+def _check_in_daemon(args: argparse.Namespace, paths: Sequence[str]) -> Optional[List[List[Report]]]:
+    """Reports of the files checked by the daemon, or None if it isn't running or fails."""
+    try:
+        return check_remote(
+            paths,
+            socket_path=args.socket,
+            target_version=args.target_version,
+            extra_globals=_split_names(args.extra_globals),
+            max_errors=args.max_errors_per_file,
+            fail_fast=args.fail_fast,
+        )
+    except (OSError, ValueError):
+        return None
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        target_version = parse_version(args.target_version) if args.target_version else None
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    default_names = known_names(target_version, _split_names(args.extra_globals))
+    exclude = _split_names(args.exclude) + _split_names(args.extend_exclude)
+
+    if args.max_errors_per_file < 0:
+        print('--max-errors-per-file must not be negative', file=sys.stderr)
+        return 2
+    if args.serve:
+        try:
+            serve(args.socket)
+        except OSError as exc:
+            print(exc, file=sys.stderr)
+            return 2
+        return 0
+    if args.watch:
+        options = (args.target_version, tuple(sorted(_split_names(args.extra_globals))),
+                   args.max_errors_per_file, args.fail_fast)
+        try:
+            watch(args.paths, exclude, options, poll_interval=args.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    paths = list(iter_python_files(args.paths, exclude))
+    found = False
+    remote = _check_in_daemon(args, paths) if args.daemon else None
+    results: Iterator[Tuple[str, List[Report]]]
+    if remote is not None:
+        results = zip(paths, remote)
+    else:
+        results = check_files(paths, default_names, args.jobs, args.max_errors_per_file, args.fail_fast)
+    for path, reports in results:
+        for line, col, msg in reports:
+            found = True
+            print(f'{path}:{line}:{col}: {msg}')
+        if found and args.fail_fast:
+            if hasattr(results, 'close'):
+                results.close()  # type: ignore
+            break
+    return 1 if found else 0
@@ -0,0 +1,328 @@
+"""Long-running checker process serving requests over a Unix socket.
+
+The daemon keeps what a fresh process would have to rebuild on every run: parsed
+trees of the files it has seen, results per function and the builtins tables of the
+options in use. A request is a single JSON line naming files and/or passing buffers;
+the response is a single JSON line with the reports of each, in order:
+
+    {"paths": ["/abs/module.py"], "buffers": [{"filename": "a.py", "source": "..."}],
+     "options": {"target_version": "3.8", "extra_globals": [], "max_errors": 0, "fail_fast": false}}
+    {"results": [[[3, 7, "F823 ..."]], []]}
+
+`{"command": "ping"}` reports the size of the caches, `{"command": "stop"}` stops the daemon.
+"""
+import ast
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import stat
+import tempfile
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple, cast
+
+from flake_rba.api import Checker, Report, as_reports, failure_report, read_source
+from flake_rba.builtin_names import known_names, parse_version
+from flake_rba.cache import FunctionCache
+
+SOCKET_ENV = 'FLAKE_RBA_SOCKET'
+# Parsed trees are kept until the sources they came from add up to that many bytes.
+DEFAULT_MAX_SOURCE_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_FUNCTIONS = 16384
+# Checkers, and so builtins tables, are kept for that many sets of options.
+_MAX_CHECKERS = 8
+# Seconds a client waits for the daemon before checking in process.
+DEFAULT_TIMEOUT = 30.0
+# Seconds the daemon waits for a client to send its request or read the response.
+REQUEST_TIMEOUT = 5.0
+
+# Options of a request: target version, extra globals, max errors, fail fast.
+Options = Tuple[Optional[str], Tuple[str, ...], int, bool]
+
+
+def default_socket_path() -> str:
+    """$FLAKE_RBA_SOCKET, or a socket in a directory only the current user can access.
+
+    That's $XDG_RUNTIME_DIR or a directory of the user's own in the temporary directory,
+    which is created if needed; raises PermissionError if someone else owns it.
+    """
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    directory = os.environ.get('XDG_RUNTIME_DIR')
+    if not directory:
+        directory = os.path.join(tempfile.gettempdir(), f'flake_rba-{os.getuid()}')
+        try:
+            os.mkdir(directory, 0o700)
+        except FileExistsError:
+            pass
+        info = os.lstat(directory)
+        # Whoever controls the directory can replace the socket in it.
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise PermissionError(f'{directory} is not a private directory of the current user')
+    return os.path.join(directory, 'flake_rba.sock')
+
+
+class _Source:
+    """A parsed source, or the report of why it couldn't be read or parsed."""
+    __slots__ = ('signature', 'size', 'lines', 'tree', 'failure', 'reports')
+
+    def __init__(self, signature: Any = None):
+        # Stat of the file the source was read from, to tell whether it changed since.
+        self.signature = signature
+        self.size = 0
+        self.lines: Optional[List[str]] = None
+        self.tree: Optional[ast.AST] = None
+        self.failure: Optional[Report] = None
+        # Reports by the options they were produced with.
+        self.reports: Dict[Options, List[Report]] = {}
+
+
+def _parse(source: str, filename: str, signature: Any = None) -> _Source:
+    entry = _Source(signature)
+    entry.size = len(source)
+    try:
+        entry.tree = ast.parse(source, filename)
+        entry.lines = source.splitlines(True)
+    except (SyntaxError, ValueError) as exc:
+        entry.failure = failure_report(exc)
+    return entry
+
+
+class SourceCache:
+    """LRU map of parsed sources, bounded by the total size of the sources."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_SOURCE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: 'OrderedDict[Any, _Source]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Any) -> Optional[_Source]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: Any, entry: _Source) -> None:
+        entries = self._entries
+        previous = entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous.size
+        entries[key] = entry
+        self.size += entry.size
+        # The newest entry stays, however large it is.
+        while self.size > self.max_bytes and len(entries) > 1:
+            _, evicted = entries.popitem(last=False)
+            self.size -= evicted.size
+
+
+class Daemon:
+    """Warm state shared by all requests: parsed sources, function results and checkers."""
+
+    def __init__(self, max_source_bytes: int = DEFAULT_MAX_SOURCE_BYTES, max_functions: int = DEFAULT_MAX_FUNCTIONS):
+        self.sources = SourceCache(max_source_bytes)
+        self.max_functions = max_functions
+        # Entries are keyed by the names a function sees bound, not by the builtins and
+        # extra globals, so every target version and set of extra globals gets its own.
+        self._function_caches: 'OrderedDict[Tuple[Optional[str], Tuple[str, ...]], FunctionCache]' = OrderedDict()
+        self._checkers: 'OrderedDict[Options, Checker]' = OrderedDict()
+        self.stopped = False
+
+    def _checker(self, options: Options) -> Checker:
+        checkers = self._checkers
+        checker = checkers.get(options)
+        if checker is None:
+            target_version, extra_globals, max_errors, fail_fast = options
+            default_names = known_names(parse_version(target_version) if target_version else None, extra_globals)
+            function_cache = self._function_cache(target_version, extra_globals)
+            checker = checkers[options] = Checker(default_names, function_cache, max_errors, fail_fast)
+            if len(checkers) > _MAX_CHECKERS:
+                checkers.popitem(last=False)
+        else:
+            checkers.move_to_end(options)
+        return checker
+
+    def _function_cache(self, target_version: Optional[str], extra_globals: Tuple[str, ...]) -> FunctionCache:
+        caches = self._function_caches
+        key = (target_version, extra_globals)
+        cache = caches.get(key)
+        if cache is None:
+            cache = caches[key] = FunctionCache(self.max_functions)
+            if len(caches) > _MAX_CHECKERS:
+                caches.popitem(last=False)
+        else:
+            caches.move_to_end(key)
+        return cache
+
+    def _reports(self, entry: _Source, options: Options) -> List[Report]:
+        if entry.failure is not None:
+            return [entry.failure]
+        reports = entry.reports.get(options)
+        if reports is None:
+            errors = self._checker(options).check_tree(entry.tree, entry.lines)  # type: ignore
+            reports = entry.reports[options] = as_reports(errors)
+        return reports
+
+    def check_path(self, path: str, options: Options) -> List[Report]:
+        try:
+            stat = os.stat(path)
+        except OSError as exc:
+            return [failure_report(exc)]
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        entry = self.sources.get(path)
+        if entry is None or entry.signature != signature:
+            try:
+                entry = _parse(read_source(path), path, signature)
+            except (OSError, UnicodeError, SyntaxError) as exc:
+                # tokenize.open raises SyntaxError for a bad encoding declaration.
+                entry = _Source(signature)
+                entry.failure = failure_report(exc)
+            self.sources.put(path, entry)
+        return self._reports(entry, options)
+
+    def check_buffer(self, source: str, filename: str, options: Options) -> List[Report]:
+        key = hashlib.sha256(source.encode('utf-8', 'surrogatepass')).hexdigest()
+        entry = self.sources.get(key)
+        if entry is None:
+            entry = _parse(source, filename)
+            self.sources.put(key, entry)
+        return self._reports(entry, options)
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        command = request.get('command')
+        if command == 'stop':
+            self.stopped = True
+            return {'stopped': True}
+        if command == 'ping':
+            return {'sources': len(self.sources), 'functions': sum(map(len, self._function_caches.values()))}
+        raw_options = request.get('options') or {}
+        try:
+            options: Options = (
+                raw_options.get('target_version') or None,
+                tuple(sorted(raw_options.get('extra_globals') or ())),
+                int(raw_options.get('max_errors') or 0),
+                bool(raw_options.get('fail_fast')),
+            )
+            self._checker(options)
+        except (TypeError, ValueError) as exc:
+            return {'error': str(exc)}
+        results = [self.check_path(path, options) for path in request.get('paths') or ()]
+        for buffer in request.get('buffers') or ():
+            results.append(self.check_buffer(buffer['source'], buffer.get('filename', '<unknown>'), options))
+        return {'results': results}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    # Requests are handled one at a time, so a client that stalls mustn't hold the daemon.
+    timeout = REQUEST_TIMEOUT
+
+    def handle(self) -> None:
+        try:
+            line = self.rfile.readline()
+        except socket.timeout:
+            return
+        try:
+            response = self.server.daemon.handle(json.loads(line))  # type: ignore
+        except (ValueError, KeyError, TypeError) as exc:
+            response = {'error': f'bad request: {exc}'}
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class _Server(socketserver.UnixStreamServer):
+    def __init__(self, path: str, daemon: Daemon):
+        self.daemon = daemon
+        super().__init__(path, _RequestHandler)
+
+
+def serve(path: Optional[str] = None, daemon: Optional[Daemon] = None) -> None:
+    """Serve requests on the Unix socket at `path` until a stop request comes in.
+
+    Requests are handled one at a time: the analysis holds the GIL anyway, and it keeps
+    the caches free of locks. Raises OSError if another daemon already listens there.
+    """
+    path = path or default_socket_path()
+    daemon = daemon or Daemon()
+    if os.path.exists(path):
+        try:
+            request(path, {'command': 'ping'})
+        except socket.timeout:
+            # Busy with a long request rather than gone.
+            raise OSError(f'a daemon is already listening on {path}') from None
+        except OSError:
+            # Left behind by a daemon that didn't stop cleanly.
+            os.unlink(path)
+        else:
+            raise OSError(f'a daemon is already listening on {path}')
+    # Bound with the permissions already restricted: a chmod afterwards would leave a
+    # window in which other users can connect.
+    umask = os.umask(0o077)
+    try:
+        server = _Server(path, daemon)
+    finally:
+        os.umask(umask)
+    try:
+        while not daemon.stopped:
+            server.handle_request()
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def request(path: str, payload: Dict[str, Any], timeout: Optional[float] = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+    """Send a request to the daemon at `path`.
+
+    Raises OSError if none is listening, the socket belongs to another user or the daemon
+    doesn't answer within `timeout` seconds, and ValueError if it answers with an error.
+    """
+    if os.lstat(path).st_uid != os.getuid():
+        # Another user's process would get the sources sent to it.
+        raise PermissionError(f'{path} belongs to another user')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(path)
+        client.sendall(json.dumps(payload).encode() + b'\n')
+        with client.makefile('rb') as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError(f'no response from the daemon on {path}')
+    response = cast(Dict[str, Any], json.loads(line))
+    if 'error' in response:
+        raise ValueError(response['error'])
+    return response
+
+
+def check_remote(
+        paths: Sequence[str] = (),
+        buffers: Sequence[Tuple[str, str]] = (),
+        socket_path: Optional[str] = None,
+        *,
+        target_version: Optional[str] = None,
+        extra_globals: Sequence[str] = (),
+        max_errors: int = 0,
+        fail_fast: bool = False,
+) -> List[List[Report]]:
+    """Check files and `(filename, source)` buffers in the daemon.
+
+    Raises OSError if no daemon is running or it doesn't answer, and ValueError if it
+    rejects the request, so callers can fall back to checking in process.
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        raise OSError('Unix sockets are not available')
+    response = request(socket_path or default_socket_path(), {
+        'paths': [os.path.abspath(path) for path in paths],
+        'buffers': [{'filename': filename, 'source': source} for filename, source in buffers],
+        'options': {
+            'target_version': target_version,
+            'extra_globals': list(extra_globals),
+            'max_errors': max_errors,
+            'fail_fast': fail_fast,
+        },
+    })
+    return [[(line, col, msg) for line, col, msg in reports] for reports in response['results']]
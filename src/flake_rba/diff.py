@@ -0,0 +1,171 @@
+"""Diff mode: check only the scopes a change touches.
+
+The lines changed since a revision come from `git diff`; each is mapped onto the
+innermost function or class around it, or the module. The visitor then walks the module
+as usual but skips the bodies of functions without changed lines, and only errors in
+touched scopes are reported. Skipped bodies can't affect other scopes: the visitor
+gives every function a scope of its own.
+"""
+import ast
+import os
+import re
+import subprocess
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Union
+
+Function = Union[ast.FunctionDef, ast.AsyncFunctionDef]
+Scope = Union[ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef]
+# Changed lines of every changed file by absolute path; None for files git doesn't track.
+ChangedLines = Dict[str, Optional[Set[int]]]
+
+_HUNK = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+_SCOPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+# Fields of statements and except clauses holding blocks of statements.
+_BLOCKS = ('body', 'orelse', 'finalbody', 'handlers')
+
+
+def _git(args: Sequence[str], cwd: Optional[str]) -> str:
+    try:
+        result = subprocess.run(
+            ['git', '-c', 'core.quotePath=false'] + list(args),
+            cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+        )
+    except FileNotFoundError:
+        raise ValueError('git is not installed') from None
+    except subprocess.CalledProcessError as exc:
+        raise ValueError(f'git {" ".join(args)} failed: {exc.stderr.decode(errors="replace").strip()}') from None
+    return result.stdout.decode('utf-8', 'surrogateescape')
+
+
+def parse_diff(diff: str, root: str) -> ChangedLines:
+    """Map the files of a zero-context unified diff to their added or modified lines.
+
+    A pure deletion marks the lines around it, so the scope it was removed from counts
+    as touched.
+    """
+    changed: ChangedLines = {}
+    lines: Optional[Set[int]] = None
+    for line in diff.splitlines():
+        if line.startswith('+++ '):
+            target = line[4:]
+            if target == '/dev/null':
+                lines = None
+                continue
+            lines = changed.setdefault(os.path.join(root, target[2:]), set())
+            continue
+        match = _HUNK.match(line)
+        if match is None or lines is None:
+            continue
+        start = int(match.group(1))
+        count = 1 if match.group(2) is None else int(match.group(2))
+        if count:
+            lines.update(range(start, start + count))
+        else:
+            lines.update((max(start, 1), start + 1))
+    return changed
+
+
+def changed_lines(rev: str, cwd: Optional[str] = None) -> ChangedLines:
+    """Lines changed in the working tree since `rev`; raises ValueError if git fails.
+
+    Paths are resolved with `os.path.realpath`, so look files up the same way.
+    """
+    root = os.path.realpath(_git(['rev-parse', '--show-toplevel'], cwd).strip())
+    # Explicit prefixes, since diff.noprefix or diff.mnemonicPrefix may change them.
+    diff = _git([
+        'diff', '-U0', '--no-color', '--no-ext-diff', '--no-renames', '--src-prefix=a/', '--dst-prefix=b/',
+        rev, '--',
+    ], root)
+    changed = parse_diff(diff, root)
+    for path in _git(['ls-files', '--others', '--exclude-standard'], root).splitlines():
+        changed[os.path.join(root, path)] = None
+    return changed
+
+
+def _end_line(node: ast.AST) -> int:
+    end_lineno: Optional[int] = getattr(node, 'end_lineno', None)
+    if end_lineno is not None:
+        return end_lineno
+    # Python < 3.8 doesn't record where nodes end.
+    return max(getattr(child, 'lineno', 0) for child in ast.walk(node))
+
+
+def _first_line(node: ast.AST) -> int:
+    return min([node.lineno] + [decorator.lineno for decorator in getattr(node, 'decorator_list', ())])  # type: ignore
+
+
+def function_bounds(tree: ast.Module, last_line: int) -> Dict[Function, int]:
+    """A line every function of `tree` ends on or before, for Python < 3.8.
+
+    A statement ends before the next one of its block starts, or where the block ends.
+    Unlike the last line of the nodes in it, the bound never misses closing brackets or
+    the rest of a string; it may include trailing blank lines and comments.
+    """
+    bounds: Dict[Function, int] = {}
+    pending: List[Tuple[List[ast.AST], int]] = [(tree.body, last_line)]  # type: ignore
+    while pending:
+        block, end = pending.pop()
+        for index, node in enumerate(block):
+            node_end = _first_line(block[index + 1]) - 1 if index + 1 < len(block) else end
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                bounds[node] = node_end
+            for field in _BLOCKS:
+                statements = getattr(node, field, None)
+                if statements:
+                    pending.append((statements, node_end))
+    return bounds
+
+
+class ScopeMap:
+    """The functions and classes of a module with the lines they span."""
+
+    def __init__(self, tree: ast.AST):
+        self.tree = tree
+        # (first line, first body line, last line, node), outer scopes first.
+        self.scopes: List[Tuple[int, int, int, Scope]] = []
+        self.parents: Dict[Scope, Scope] = {}
+        pending: List[Tuple[ast.AST, Scope]] = [(tree, tree)]  # type: ignore
+        while pending:
+            node, scope = pending.pop()
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, _SCOPES):
+                    self.scopes.append((child.lineno, child.body[0].lineno, _end_line(child), child))
+                    self.parents[child] = scope
+                    pending.append((child, child))
+                else:
+                    pending.append((child, scope))
+        self.scopes.sort(key=lambda scope: (scope[0], -scope[2]))
+
+    def _innermost(self, line: int, body_only: bool) -> Scope:
+        innermost: Scope = self.tree  # type: ignore
+        for first, body_first, last, node in self.scopes:
+            if first > line:
+                break
+            if (body_first if body_only else first) <= line <= last:
+                innermost = node
+        return innermost
+
+    def touched(self, lines: Set[int]) -> Set[Scope]:
+        """The innermost scopes around `lines`.
+
+        A changed function or class line touches the enclosing scope as well, where its
+        name, decorators and defaults belong.
+        """
+        touched: Set[Scope] = set()
+        for line in lines:
+            scope = self._innermost(line, False)
+            touched.add(scope)
+            if scope is not self.tree and line < scope.body[0].lineno:  # type: ignore
+                touched.add(self.parents[scope])
+        return touched
+
+    def containing(self, lines: Set[int]) -> Set[Function]:
+        """The functions that have changed lines anywhere in them."""
+        return {
+            node for first, _, last, node in self.scopes
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+            and any(first <= line <= last for line in lines)
+        }
+
+    def scope_of(self, line: int) -> Scope:
+        """The scope code at `line` runs in."""
+        return self._innermost(line, True)
@@ -0,0 +1,322 @@
+"""Index of the names every module of a project exports, to resolve `from x import *`.
+
+For each module the index records the names bound at its top level (or its `__all__`,
+when that's a literal) and the modules it star-imports itself. It's stored as JSON and
+refreshed incrementally: files whose modification time and size didn't change are not
+read, files whose content hash didn't change are not parsed.
+"""
+import ast
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Sequence, Set, Tuple
+
+from flake_rba.files import DEFAULT_EXCLUDE, iter_python_files
+
+# Bump whenever the layout of the index or what is recorded changes.
+INDEX_FORMAT = 1
+
+# Entry of a file: [mtime_ns, size, sha256, module, is_package, names, has_all, star imports].
+FileEntry = List[Any]
+
+_STATEMENT_LISTS = ('body', 'orelse', 'finalbody', 'handlers')
+
+
+def _string(node: ast.AST) -> Optional[str]:
+    if isinstance(node, ast.Constant):
+        value = node.value
+    elif sys.version_info < (3, 8) and isinstance(node, ast.Str):  # pragma: no cover
+        # Before 3.8 string literals have a class of their own; later reading `s` warns.
+        value = node.s
+    else:
+        return None
+    return value if isinstance(value, str) else None
+
+
+def _strings(nodes: Sequence[ast.AST]) -> Optional[List[str]]:
+    values = [_string(node) for node in nodes]
+    if all(isinstance(value, str) for value in values):
+        return values  # type: ignore
+    return None
+
+
+def _literal_names(node: ast.AST) -> Optional[List[str]]:
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return _strings(node.elts)
+    return None
+
+
+def _top_level_statements(tree: ast.Module) -> Iterator[ast.stmt]:
+    """Top-level statements in source order, including the ones in if, try, with and loop bodies."""
+    pending = tree.body[::-1]
+    while pending:
+        stmt = pending.pop()
+        yield stmt
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        children: List[ast.stmt] = []
+        for field in _STATEMENT_LISTS:
+            for child in getattr(stmt, field, ()):
+                if isinstance(child, ast.ExceptHandler):
+                    children.extend(child.body)
+                else:
+                    children.append(child)
+        pending.extend(reversed(children))
+
+
+def _absolute_module(module: Optional[str], level: int, importer: Optional[str], is_package: bool) -> Optional[str]:
+    """Resolve the module of an import relative to the module `importer`."""
+    if not level:
+        return module
+    if importer is None:
+        return None
+    parts = importer.split('.')
+    if not is_package:
+        parts.pop()
+    if level - 1 > len(parts):
+        return None
+    parts = parts[:len(parts) - (level - 1)]
+    if module:
+        parts.append(module)
+    return '.'.join(parts) or None
+
+
+class ModuleExports:
+    """Top-level names of a module, `__all__` if it's a literal, and its own star imports."""
+    __slots__ = ('names', 'has_all', 'star_imports')
+
+    def __init__(self, names: Sequence[str], has_all: bool, star_imports: Sequence[str]):
+        self.names = list(names)
+        self.has_all = has_all
+        self.star_imports = list(star_imports)
+
+    @classmethod
+    def from_tree(cls, tree: ast.Module, module: Optional[str] = None, is_package: bool = False) -> 'ModuleExports':
+        names: Set[str] = set()
+        all_names: Optional[List[str]] = None
+        dynamic_all = False
+        star_imports: List[str] = []
+        for stmt in _top_level_statements(tree):
+            if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                names.add(stmt.name)
+                continue
+            if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+                for alias in stmt.names:
+                    if alias.name == '*':
+                        imported = _absolute_module(
+                            getattr(stmt, 'module', None), getattr(stmt, 'level', 0) or 0, module, is_package,
+                        )
+                        if imported is not None:
+                            star_imports.append(imported)
+                    elif alias.asname is not None:
+                        names.add(alias.asname)
+                    else:
+                        names.add(alias.name.partition('.')[0])
+                continue
+            targets: List[ast.AST] = []
+            if isinstance(stmt, ast.Assign):
+                targets = list(stmt.targets)
+                if any(isinstance(target, ast.Name) and target.id == '__all__' for target in targets):
+                    all_names = _literal_names(stmt.value)
+                    dynamic_all = dynamic_all or all_names is None
+            elif isinstance(stmt, ast.AugAssign) and isinstance(stmt.target, ast.Name) and stmt.target.id == '__all__':
+                extra = _literal_names(stmt.value)
+                if extra is None or all_names is None:
+                    dynamic_all = True
+                else:
+                    all_names = all_names + extra
+            elif isinstance(stmt, ast.AnnAssign) and stmt.value is not None:
+                targets = [stmt.target]
+            elif isinstance(stmt, (ast.For, ast.AsyncFor)):
+                targets = [stmt.target]
+            elif isinstance(stmt, (ast.With, ast.AsyncWith)):
+                targets = [item.optional_vars for item in stmt.items if item.optional_vars is not None]
+            elif isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call):
+                func = stmt.value.func
+                if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and func.value.id == '__all__':
+                    args = stmt.value.args
+                    extra = None
+                    if func.attr == 'append':
+                        extra = _strings(args)
+                    elif func.attr == 'extend' and len(args) == 1:
+                        extra = _literal_names(args[0])
+                    if extra is None or all_names is None:
+                        dynamic_all = True
+                    else:
+                        all_names = all_names + extra
+            for target in targets:
+                for node in ast.walk(target):
+                    if isinstance(node, ast.Name):
+                        names.add(node.id)
+        if all_names is not None and not dynamic_all:
+            return cls(all_names, True, star_imports)
+        return cls(sorted(name for name in names if not name.startswith('_')), False, star_imports)
+
+
+def module_name(path: str, roots: Sequence[str]) -> Optional[Tuple[str, bool]]:
+    """The dotted name of the module at `path` and whether it's a package, given the source roots."""
+    path = os.path.abspath(path)
+    for root in roots:
+        root = os.path.abspath(root)
+        relative = os.path.relpath(path, root)
+        if relative.startswith(os.pardir) or not relative.endswith('.py'):
+            continue
+        parts = relative[:-3].split(os.sep)
+        is_package = parts[-1] == '__init__'
+        if is_package:
+            parts.pop()
+        if parts and all(part.isidentifier() for part in parts):
+            return '.'.join(parts), is_package
+    return None
+
+
+class ExportIndex:
+    """Exports of all modules under the source roots, persisted to `path`."""
+
+    def __init__(self, path: Optional[str], roots: Sequence[str] = ('.',), exclude: Sequence[str] = ()):
+        self.path = path
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.exclude = list(exclude) or DEFAULT_EXCLUDE.split(',')
+        self._files: Dict[str, FileEntry] = {}
+        self._modules: Dict[str, ModuleExports] = {}
+        self._packages: Set[str] = set()
+        self._resolved: Dict[str, FrozenSet[str]] = {}
+        if path is not None:
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding='utf-8') as file:  # type: ignore
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get('format') == INDEX_FORMAT and data.get('roots') == self.roots:
+            self._files = data.get('files', {})
+
+    def save(self) -> None:
+        """Write the index atomically, so parallel runs never read half of it."""
+        if self.path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump({'format': INDEX_FORMAT, 'roots': self.roots, 'files': self._files}, file)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def update(self) -> int:
+        """Bring the index up to date with the files on disk; returns how many were parsed."""
+        files: Dict[str, FileEntry] = {}
+        parsed = 0
+        for path in iter_python_files(self.roots, self.exclude):
+            path = os.path.abspath(path)
+            name = module_name(path, self.roots)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name is None:
+                continue
+            entry = self._files.get(path)
+            if entry is not None and entry[:2] == [stat.st_mtime_ns, stat.st_size] and entry[3:5] == list(name):
+                files[path] = entry
+                continue
+            try:
+                with open(path, 'rb') as file:
+                    content = file.read()
+            except OSError:
+                continue
+            digest = hashlib.sha256(content).hexdigest()
+            if entry is not None and entry[2] == digest and entry[3:5] == list(name):
+                files[path] = [stat.st_mtime_ns, stat.st_size] + entry[2:]
+                continue
+            try:
+                exports = ModuleExports.from_tree(ast.parse(content, path), name[0], name[1])
+            except (SyntaxError, ValueError):
+                exports = ModuleExports((), False, ())
+            parsed += 1
+            files[path] = [
+                stat.st_mtime_ns, stat.st_size, digest, name[0], name[1],
+                exports.names, exports.has_all, exports.star_imports,
+            ]
+        self._files = files
+        self._index()
+        return parsed
+
+    def _index(self) -> None:
+        self._modules = {}
+        self._packages = set()
+        self._resolved = {}
+        # Earlier roots win when several define the same module.
+        for path, (_, _, _, module, is_package, names, has_all, star_imports) in sorted(
+                self._files.items(), key=lambda item: self._root_rank(item[0]), reverse=True):
+            self._modules[module] = ModuleExports(names, has_all, star_imports)
+            if is_package:
+                self._packages.add(module)
+            else:
+                self._packages.discard(module)
+
+    def _root_rank(self, path: str) -> int:
+        for rank, root in enumerate(self.roots):
+            if path.startswith(root + os.sep):
+                return rank
+        return len(self.roots)
+
+    def digest_for(self, tree: ast.Module, importer: Optional[str]) -> str:
+        """Hash of the module name and of the names its star imports bind, to key cached results.
+
+        Results for `tree` depend on the index through these only.
+        """
+        is_package = importer in self._packages
+        digest = hashlib.sha256((importer or '').encode())
+        for stmt in _top_level_statements(tree):
+            if not isinstance(stmt, ast.ImportFrom) or stmt.names[0].name != '*':
+                continue
+            target = _absolute_module(stmt.module, stmt.level or 0, importer, is_package)
+            names = self.exports(target) if target is not None else None
+            digest.update(b'\n' + f'{stmt.level}:{stmt.module}'.encode())
+            if names is not None:
+                digest.update('\0'.join(sorted(names)).encode())
+        return digest.hexdigest()
+
+    def module_of(self, path: str) -> Optional[str]:
+        name = module_name(path, self.roots)
+        return name[0] if name is not None else None
+
+    def exports(self, module: str) -> Optional[FrozenSet[str]]:
+        """Names `from module import *` binds, following its own star imports; None if unknown."""
+        resolved = self._resolved.get(module)
+        if resolved is not None:
+            return resolved
+        if module not in self._modules:
+            return None
+        names: Set[str] = set()
+        seen = {module}
+        pending = [module]
+        while pending:
+            exports = self._modules.get(pending.pop())
+            if exports is None:
+                continue
+            names.update(exports.names)
+            # With a literal __all__ the module lists what it re-exports itself.
+            if not exports.has_all:
+                for star in exports.star_imports:
+                    if star not in seen:
+                        seen.add(star)
+                        pending.append(star)
+        resolved = self._resolved[module] = frozenset(names)
+        return resolved
+
+    def star_import(self, module: Optional[str], level: int, importer: Optional[str]) -> Optional[FrozenSet[str]]:
+        """Names bound by `from <level dots><module> import *` in the module `importer`."""
+        target = _absolute_module(module, level, importer, importer in self._packages)
+        return self.exports(target) if target is not None else None
@@ -0,0 +1,76 @@
+import fnmatch
+import os
+from typing import Iterator, Sequence, Tuple
+
+DEFAULT_EXCLUDE = '.svn,CVS,.bzr,.hg,.git,__pycache__,.tox,.nox,.eggs,*.egg,.venv,venv'
+
+
+def _is_excluded(path: str, patterns: Sequence[str]) -> bool:
+    basename = os.path.basename(path)
+    absolute = os.path.abspath(path)
+    return any(
+        fnmatch.fnmatch(basename, pattern) or fnmatch.fnmatch(absolute, pattern)
+        for pattern in patterns
+    )
+
+
+def iter_python_files(paths: Sequence[str], exclude: Sequence[str]) -> Iterator[str]:
+    """Yield the Python files under `paths`, skipping excluded files and directories."""
+    for path in paths:
+        if not os.path.isdir(path):
+            # Explicitly named files are checked whatever their extension.
+            if not _is_excluded(path, exclude):
+                yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if not _is_excluded(os.path.join(root, name), exclude))
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                if name.endswith('.py') and not _is_excluded(file_path, exclude):
+                    yield file_path
+
+
+def iter_directories(paths: Sequence[str], exclude: Sequence[str]) -> Iterator[str]:
+    """Yield the directories holding the files `iter_python_files` yields, as absolute paths."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield os.path.dirname(os.path.abspath(path))
+            continue
+        for root, dirs, _ in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if not _is_excluded(os.path.join(root, name), exclude))
+            yield os.path.abspath(root)
+
+
+def _reach(paths: Sequence[str], exclude: Sequence[str], path: str) -> Iterator[Tuple[str, bool]]:
+    """Name the absolute `path` the way the walks of `paths` do, with whether it is one of them.
+
+    Nothing is yielded for paths outside `paths` or in excluded directories.
+    """
+    for root in paths:
+        absolute_root = os.path.abspath(root)
+        if path == absolute_root:
+            yield root, True
+        elif path.startswith(os.path.join(absolute_root, '')) and os.path.isdir(root):
+            named = root
+            for part in os.path.relpath(path, absolute_root).split(os.sep):
+                named = os.path.join(named, part)
+                if _is_excluded(named, exclude):
+                    break
+            else:
+                yield named, False
+
+
+def iter_python_files_at(paths: Sequence[str], exclude: Sequence[str], path: str) -> Iterator[str]:
+    """Yield the files `iter_python_files` yields that are the absolute `path` or under it."""
+    for named, is_root in _reach(paths, exclude, path):
+        if is_root or os.path.isdir(named):
+            yield from iter_python_files([named], exclude)
+        elif named.endswith('.py'):
+            yield named
+
+
+def iter_directories_at(paths: Sequence[str], exclude: Sequence[str], path: str) -> Iterator[str]:
+    """Yield the directories `iter_directories` yields that are the absolute `path` or under it."""
+    for named, _ in _reach(paths, exclude, path):
+        if os.path.isdir(named):
+            yield from iter_directories([named], exclude)
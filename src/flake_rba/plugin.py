@@ -1,24 +1,92 @@
 import ast
-from typing import NamedTuple, Iterator, List, Any, Union
-
-
-class Frame(list):  # type: ignore
-    pass
+import hashlib
+import os
+import sys
+from itertools import islice
+from time import perf_counter
+from typing import AbstractSet, Iterator, Any, NamedTuple, Union, FrozenSet, Optional, List, Sequence, Dict, Tuple
+
+from flake_rba.builtin_names import known_names, parse_version
+from flake_rba.cache import DEFAULT_MAX_SIZE, FunctionCache, FunctionKey, ResultCache
+from flake_rba.cfg import unbound_loads
+from flake_rba.diff import ChangedLines, ScopeMap, changed_lines, function_bounds
+from flake_rba.exports import ExportIndex
+from flake_rba.prescan import is_straight_line
+from flake_rba.profiling import PROFILE_ENV, PROFILE_PER_FILE_ENV, Profiler, get_profiler, profiled
+from flake_rba.scope_tables import LAMBDA, ScopeKey, StaticNames, static_names
+from flake_rba.symbols import Mask, SymbolTable
+from flake_rba.traversal import child_nodes, handler_table, iter_walk, walk
+
+# 'precise' merges the names bound in branches, 'fast' checks statements in order, as
+# if every branch ran: it's linear in the size of the code, but misses names that are
+# only bound in some branches.
+PRECISE = 'precise'
+FAST = 'fast'
+MODES = (PRECISE, FAST)
+DEFAULT_BRANCH_BUDGET = 5000
+# Informational: a scope went over its budget, the rest of it was checked in fast mode.
+BUDGET_CODE = 'F829'
+BUDGET_MSG = f"{BUDGET_CODE} '%s' is too complex, checked the rest of it without tracking branches"
+# Budget of a scope: the function (None for the module), the branch statements it may
+# still merge, its deadline and what straight_line was before it ran out.
+BudgetState = Tuple[Optional[ast.AST], Optional[int], Optional[float], Optional[bool]]
 
 
 class ReferencedBeforeAssignmentNodeVisitor(ast.NodeVisitor):
-    # Assuming here that we always check a source code in files, and __file__ is defined.
-    default_names = list(__builtins__.keys()) + ['__file__', '__builtins__']  # type: ignore
-
-    def __init__(self):
+    default_names: FrozenSet[str] = known_names()
+    mode = PRECISE
+    # If and try statements merged per scope before the rest of it is checked without
+    # merging, and seconds per scope before the same happens; 0 for no limit.
+    branch_budget = DEFAULT_BRANCH_BUDGET
+    time_budget = 0.0
+
+    def __init__(
+            self,
+            default_names: Optional[FrozenSet[str]] = None,
+            lines: Optional[Sequence[str]] = None,
+            function_cache: Optional[FunctionCache] = None,
+            use_symtable: bool = False,
+            export_index: Optional[ExportIndex] = None,
+    ):
         super().__init__()
-        self.stack: List[Frame] = []
-        self.errors = []
+        if default_names is not None:
+            self.default_names = default_names
+        self.function_cache = function_cache
+        # Resolves star imports of project modules; they bind nothing else but '*' without it.
+        self.export_index = export_index
+        # Resolve non-local names of functions with a `symtable` pre-pass; needs the lines.
+        self.use_symtable = use_symtable
+        self._handlers = handler_table(type(self))
+        self.reset(lines)
+
+    def reset(self, lines: Optional[Sequence[str]] = None) -> None:
+        """Forget the previous tree, so the visitor can be reused for the next one."""
+        # Source lines are needed to reuse results of unchanged functions.
+        self.lines = lines
+        self.scopes = SymbolTable()
+        self.errors: List[ErrorRecord] = []
+        # Non-local names of the innermost function, resolved by the pre-pass.
+        self.static_names: StaticNames = {}
+        # Set while visiting a function that needs no branch merging, see prescan.
+        self.straight_line = False
+        # Dotted name of the module, to resolve relative star imports with the export index.
+        self.module_name: Optional[str] = None
+        # Functions to visit the bodies of, None for all of them; see the diff module.
+        self.only_functions: Optional[AbstractSet[ast.AST]] = None
+        self._static_scopes: Optional[Dict[ScopeKey, List[StaticNames]]] = None
+        # Where functions end before Python 3.8, which doesn't record it; see the function cache.
+        self._function_bounds: Dict[ast.AST, int] = {}
+        # Budget of the innermost scope: the function (None for the module), the branch
+        # statements it may still merge and when its time is up (None for no limit).
+        self._budget_scope: Optional[ast.AST] = None
+        self._branches_left: Optional[int] = self.branch_budget or None
+        self._deadline: Optional[float] = None
+        # What straight_line was before the budget of the scope ran out, None while it lasts.
+        self._straight_line_before_budget: Optional[bool] = None
+        # How many scopes ran out of budget so far.
+        self._budgets_exceeded = 0
         # for if/else control flow. Todo: use single control flow stack
-        self.tracking_stack = []
-
-    def visit_ExceptHandler(self, node: ast.ExceptHandler) -> Any:
-        self.generic_visit(node)
+        self.tracking_stack: List[Any] = []
 
     def visit_AnnAssign(self, node: ast.AnnAssign) -> Any:
         assign_target = node.target
@@ -27,107 +95,99 @@ class ReferencedBeforeAssignmentNodeVisitor(ast.NodeVisitor):
 
     def visit_Assign(self, node: ast.Assign) -> Any:
         # Todo: check multiple targets
-        self._visit_values(node.value)
+        yield node.value
         for assign_target in node.targets:
             self._visit_assign_target(assign_target)
 
-    def _visit_values(self, value_target):
-        if isinstance(value_target, list):
-            for sub_node in value_target:
-                self.visit(sub_node)
-        else:
-            self.visit(value_target)
-
     def _visit_assign_target(self, assign_target):
         # Todo: properly check these types below
         # Todo: add assignSub/assignAdd etc. operations
-        if isinstance(assign_target, ast.Name):
-            self.stack[-1].append(assign_target.id)
-        elif isinstance(assign_target, ast.Tuple):
-            for element in assign_target.elts:
-                self._visit_assign_target(element)
-        elif isinstance(assign_target, ast.Attribute):
-            pass
-        elif isinstance(assign_target, ast.Subscript):
-            pass
-        elif isinstance(assign_target, ast.List):
-            for element in assign_target.elts:
-                self._visit_assign_target(element)
-        elif isinstance(assign_target, (ast.Dict, ast.Set)):
-            pass
-        elif isinstance(assign_target, ast.Starred):
-            pass
-        else:
-            pass
-
-    def visit_Return(self, node: ast.Return) -> Any:
-        self.generic_visit(node)
+        # Attributes, subscripts and starred targets don't bind anything (yet).
+        pending = [assign_target]
+        while pending:
+            target = pending.pop()
+            if isinstance(target, ast.Name):
+                self.scopes.bind(target.id)
+            elif isinstance(target, (ast.Tuple, ast.List)):
+                pending.extend(reversed(target.elts))
 
     def visit_If(self, node: ast.If) -> Any:
         # Todo: merge if/else and try-except clause checks
-        self._visit_if_helper(node)
+        if self.straight_line:
+            return child_nodes(node)
+        return self._visit_if_helper(node)
 
     def _visit_if_helper(self, node: ast.If) -> Any:
-        self.stack.append(Frame())
-        self.visit(node.test)  # type: ignore
+        # Nested statements come here directly, so the budget is charged here too.
+        if self.straight_line or not self._spend_budget():
+            yield child_nodes(node)
+            return False
+
+        # An elif is an If alone in the orelse of the previous one. The branches of the
+        # whole chain are walked one after the other in a single frame and merged at
+        # once: names bound in all of the branches that don't jump away.
+        self.scopes.push()
+        yield node.test
+
+        merged: Optional[Mask] = None
+        branch: Optional[ast.If] = node
+        body = node.body
+        while True:
+            abort_branch = False
+            dead_branch = False
+            for expr in body:
+                if isinstance(expr, (ast.Return, ast.Raise, ast.Continue, ast.Break)):
+                    abort_branch = True
+                    yield expr
+                    break
+                if isinstance(expr, ast.If):
+                    dead_branch = yield self._visit_if_helper(expr)
+                else:
+                    yield expr
+                if dead_branch:
+                    abort_branch = True
+                    break
 
-        abort_if_branch = False
-        dead_branch = False
-        for expr in node.body:
-            if isinstance(expr, (ast.Return, ast.Raise, ast.Continue, ast.Break)):
-                abort_if_branch = True
-                self.visit(expr)  # type: ignore
+            frame_state = self.scopes.clear()
+            if not abort_branch:
+                merged = frame_state if merged is None else merged & frame_state
+            if branch is None:
                 break
-            if isinstance(expr, ast.If):
-                dead_branch = self._visit_if_helper(expr)
+            orelse = branch.orelse
+            if len(orelse) == 1 and isinstance(orelse[0], ast.If):
+                branch = orelse[0]
+                yield branch.test
+                body = branch.body
             else:
-                self.visit(expr)  # type: ignore
-            if dead_branch:
-                abort_if_branch = True
-                break
-
-        frame_state = {name for name in self.stack[-1]}
-        self.stack[-1].clear()
+                branch = None
+                body = orelse
 
-        abort_else_branch = False
-        dead_branch = False
-        for expr in node.orelse:
-            if isinstance(expr, (ast.Return, ast.Raise, ast.Continue, ast.Break)):
-                self.visit(expr)  # type: ignore
-                abort_else_branch = True
-                break
-            if isinstance(expr, ast.If):
-                dead_branch = self._visit_if_helper(expr)
-            else:
-                self.visit(expr)  # type: ignore
-            if dead_branch:
-                abort_else_branch = True
-                break
-
-        orelse_frame_state = {name for name in self.stack[-1]}
-        self.stack[-1].clear()
-
-        dead_end_branch = False
-        if not abort_else_branch and not abort_if_branch:
-            intersection = frame_state.intersection(orelse_frame_state)
-        elif abort_if_branch and not abort_else_branch:
-            intersection = orelse_frame_state
-        elif not abort_if_branch and abort_else_branch:
-            intersection = frame_state
-        else:
-            intersection = set()
-            dead_end_branch = True
-
-        self.stack.pop()
-        for name in intersection:
-            self.stack[-1].append(name)
-        return dead_end_branch
+        self.scopes.pop()
+        if merged is None:
+            return True
+        self.scopes.bind_mask(merged)
+        return False
 
     def visit_Try(self, node: ast.Try) -> Any:
-        self._visit_try_helper(node)
+        if self.straight_line:
+            return self._visit_try_straight(node)
+        return self._visit_try_helper(node)
+
+    def _visit_try_straight(self, node: ast.Try) -> Any:
+        # The helper doesn't visit the exception types either.
+        yield node.body
+        for handler in node.handlers:
+            if handler.name is not None:
+                self.scopes.bind(handler.name)
+            yield handler.body
+        yield node.orelse + node.finalbody
 
     def _visit_try_helper(self, node: ast.Try) -> Any:
-        self.stack.append(Frame())
+        if self.straight_line or not self._spend_budget():
+            yield self._visit_try_straight(node)
+            return False
+
+        self.scopes.push()
 
         scopes = []
         abort_try_branch = False
@@ -135,84 +195,75 @@ class ReferencedBeforeAssignmentNodeVisitor(ast.NodeVisitor):
         for expr in node.body:
             if isinstance(expr, (ast.Return, ast.Raise, ast.Continue, ast.Break)):
                 abort_try_branch = True
-                self.visit(expr)  # type: ignore
+                yield expr
                 break
             if isinstance(expr, ast.Try):
-                dead_end = self._visit_try_helper(expr)  # type: ignore
-            if isinstance(expr, ast.If):
-                dead_end = self._visit_if_helper(expr)  # type: ignore
+                dead_end = yield self._visit_try_helper(expr)
+            elif isinstance(expr, ast.If):
+                dead_end = yield self._visit_if_helper(expr)
             else:
-                self.visit(expr)  # type: ignore
+                yield expr
 
+        frame_state = self.scopes.clear()
         if not abort_try_branch and not dead_end:
-            frame_state = {name for name in self.stack[-1]}
             scopes.append(frame_state)
-        self.stack[-1].clear()
 
         for handler in node.handlers:
             abort_handler_branch = False
 
             if handler.name is not None:
-                self.stack[-1].append(handler.name)
+                self.scopes.bind(handler.name)
 
             dead_end = False
             for expr in handler.body:
                 if isinstance(expr, (ast.Return, ast.Raise, ast.Continue, ast.Break)):
                     abort_handler_branch = True
-                    self.visit(expr)  # type: ignore
+                    yield expr
                     break
                 if isinstance(expr, ast.Try):
-                    dead_end = self._visit_try_helper(expr)  # type: ignore
-                if isinstance(expr, ast.If):
-                    dead_end = self._visit_if_helper(expr)  # type: ignore
+                    dead_end = yield self._visit_try_helper(expr)
+                elif isinstance(expr, ast.If):
+                    dead_end = yield self._visit_if_helper(expr)
                 else:
-                    self.visit(expr)  # type: ignore
+                    yield expr
 
+            handler_frame_state = self.scopes.clear()
             if not abort_handler_branch and not dead_end:
-                handler_frame_state = {name for name in self.stack[-1]}
                 scopes.append(handler_frame_state)
-            self.stack[-1].clear()
 
         dead_end = False
         abort_else_branch = False
         for expr in node.orelse:
             if isinstance(expr, (ast.Return, ast.Raise, ast.Continue, ast.Break)):
-                self.visit(expr)  # type: ignore
+                yield expr
                 abort_else_branch = True
                 break
             if isinstance(expr, ast.Try):
-                dead_end = self._visit_try_helper(expr)  # type: ignore
-            if isinstance(expr, ast.If):
-                dead_end = self._visit_if_helper(expr)
+                dead_end = yield self._visit_try_helper(expr)
+            elif isinstance(expr, ast.If):
+                dead_end = yield self._visit_if_helper(expr)
             else:
-                self.visit(expr)  # type: ignore
+                yield expr
 
+        orelse_frame_state = self.scopes.clear()
         if not abort_else_branch and node.orelse and not dead_end:
-            orelse_frame_state = {name for name in self.stack[-1]}
             scopes.append(orelse_frame_state)
-        self.stack[-1].clear()
 
         for expr in node.finalbody:
             if isinstance(expr, (ast.Return, ast.Raise, ast.Continue, ast.Break)):
-                self.visit(expr)  # type: ignore
+                yield expr
                 break
             if isinstance(expr, ast.If):
-                self._visit_if_helper(expr)
+                yield self._visit_if_helper(expr)
             else:
-                self.visit(expr)  # type: ignore
+                yield expr
 
-        self.stack.pop()
-        scope_intersection = None
+        self.scopes.pop()
+        scope_intersection = -1 if scopes else 0
         for scope in scopes:
-            if scope_intersection is None:
-                scope_intersection = scope
-                continue
-            scope_intersection = scope_intersection.intersection(scope)  # type: ignore
-        if scope_intersection is None:
-            scope_intersection = set()
+            scope_intersection &= scope
 
-        for name in scope_intersection:
-            self.stack[-1].append(name)
+        self.scopes.bind_mask(scope_intersection)
 
         if not scopes:
             return True
@@ -220,10 +271,10 @@ class ReferencedBeforeAssignmentNodeVisitor(ast.NodeVisitor):
 
     def _track(self, track, first_try):
         if first_try:
-            for variable in self.stack[-1]:
+            for variable in self.scopes.names_in(self.scopes.top()):
                 track.add(variable)
         else:
-            frame_set = set(self.stack[-1])
+            frame_set = self.scopes.names_in(self.scopes.top())
             to_remove = []
             for frame in track:
                 if frame not in frame_set:
@@ -233,291 +284,729 @@ class ReferencedBeforeAssignmentNodeVisitor(ast.NodeVisitor):
 
     def visit_FunctionDef(self, node: ast.FunctionDef) -> Any:
         # Todo: track kwargs, *args and **kwargs
-        self.stack[-1].append(node.name)
-        try:
-            self.stack.append(Frame())
-            for arg in node.args.args:
-                self.stack[-1].append(arg.arg)
-            if node.args.vararg is not None:
-                self.stack[-1].append(node.args.vararg.arg)
-            if node.args.kwarg is not None:
-                self.stack[-1].append(node.args.kwarg.arg)
-            if node.args.kwonlyargs is not None:
-                self.stack[-1].extend([arg.arg for arg in node.args.kwonlyargs])
-
-            self.generic_visit(node)
-        finally:
-            self.stack.pop()
+        yield from self._visit_function(node)
 
     def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> Any:
         # Todo: It seems like I have to add entire async support,
         #  i.e., async for, async with, ...
-        self.stack[-1].append(node.name)
+        yield from self._visit_function(node)
+
+    def _visit_function(self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef]) -> Any:
+        self.scopes.bind(node.name)
+        static_names = self._static_names_of(node.lineno, node.name)
+        if self.only_functions is not None and node not in self.only_functions:
+            return
+        inherited_straight_line = self._inherited_straight_line()
+        cache_key = self._function_cache_key(node, static_names, inherited_straight_line)
+        if cache_key is not None and self._replay_function(node, cache_key):
+            return
+        errors_before = len(self.errors)
+        outer_static_names, self.static_names = self.static_names, static_names
+        outer_straight_line = self.straight_line
+        self.straight_line = inherited_straight_line or self._takes_fast_path(node)
+        outer_budget = self._enter_budget(node)
+        budgets_exceeded = self._budgets_exceeded
         try:
-            self.stack.append(Frame())
+            self.scopes.push(scope=True)
             for arg in node.args.args:
-                self.stack[-1].append(arg.arg)
+                self.scopes.bind(arg.arg)
             if node.args.vararg is not None:
-                self.stack[-1].append(node.args.vararg.arg)
+                self.scopes.bind(node.args.vararg.arg)
             if node.args.kwarg is not None:
-                self.stack[-1].append(node.args.kwarg.arg)
+                self.scopes.bind(node.args.kwarg.arg)
             if node.args.kwonlyargs is not None:
-                self.stack[-1].extend([arg.arg for arg in node.args.kwonlyargs])
+                self.scopes.bind_all([arg.arg for arg in node.args.kwonlyargs])
 
-            self.generic_visit(node)
+            yield child_nodes(node)
         finally:
-            self.stack.pop()
+            self.scopes.pop()
+            self.static_names = outer_static_names
+            self.straight_line = outer_straight_line
+            self._leave_budget(outer_budget)
+        # How far a time budget gets isn't reproducible, in this function or one nested in it.
+        if cache_key is not None and self._budgets_exceeded == budgets_exceeded:
+            self._store_function(node, cache_key, errors_before)
+
+    def _takes_fast_path(self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef]) -> bool:
+        return self.mode == FAST or is_straight_line(node)
+
+    def _inherited_straight_line(self) -> bool:
+        # Functions nested in a straight-line one were covered by its scan. A scope that
+        # ran out of budget doesn't pass that on to the functions in it.
+        before = self._straight_line_before_budget
+        return self.straight_line if before is None else before
+
+    def _enter_budget(self, node: Optional[ast.AST]) -> BudgetState:
+        """Start the budget of a scope; returns the budget of the enclosing one."""
+        outer = self._budget_scope, self._branches_left, self._deadline, self._straight_line_before_budget
+        self._budget_scope = node
+        self._branches_left = self.branch_budget or None
+        self._deadline = perf_counter() + self.time_budget if self.time_budget else None
+        self._straight_line_before_budget = None
+        return outer
+
+    def _leave_budget(self, outer: BudgetState) -> None:
+        self._budget_scope, self._branches_left, self._deadline, self._straight_line_before_budget = outer
+
+    def _spend_budget(self) -> bool:
+        """Count a branch statement to merge; False once the budget of the scope is spent."""
+        left = self._branches_left
+        if left is not None:
+            left = self._branches_left = left - 1
+            if left < 0:
+                self._exceed_budget()
+                return False
+        deadline = self._deadline
+        if deadline is not None and perf_counter() > deadline:
+            self._exceed_budget()
+            return False
+        return True
+
+    def _exceed_budget(self) -> None:
+        # Statements already merged stay merged; the rest of the scope is walked straight.
+        self._straight_line_before_budget = self.straight_line
+        self.straight_line = True
+        self._branches_left = self._deadline = None
+        self._budgets_exceeded += 1
+        scope = self._budget_scope
+        if scope is None:
+            self.errors.append(ErrorRecord(1, 0, BUDGET_CODE, '<module>', ast.Module))
+        else:
+            self.errors.append(ErrorRecord(
+                scope.lineno, scope.col_offset, BUDGET_CODE, scope.name, type(scope)))  # type: ignore
+
+    def _function_first_line(self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef]) -> int:
+        return min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+
+    def _function_cache_key(
+            self,
+            node: Union[ast.FunctionDef, ast.AsyncFunctionDef],
+            static_names: StaticNames,
+            straight_line: bool,
+    ) -> Optional[FunctionKey]:
+        end_lineno = getattr(node, 'end_lineno', None) or self._function_bounds.get(node)
+        if self.function_cache is None or self.lines is None or end_lineno is None:
+            return None
+        if self.only_functions is not None:
+            # Only some of the functions nested in this one are visited.
+            return None
+        source = self.lines[self._function_first_line(node) - 1:end_lineno]
+        # Identifiers can't contain ':', so these never clash with visible names.
+        visible_names = list(self.scopes.names()) + [
+            f':{self.mode}:{straight_line}:{self.branch_budget}:{self.time_budget}',
+        ]
+        if static_names:
+            visible_names += [f'{name}:{bound}' for name, bound in static_names.items()]
+        return self.function_cache.key(source, visible_names)
+
+    def _load_static_scopes(self) -> None:
+        if not self.use_symtable or not self.lines:
+            return
+        try:
+            self._static_scopes = static_names(''.join(self.lines))
+        except (SyntaxError, ValueError):
+            # symtable is stricter than ast, e.g. about misplaced nonlocal statements.
+            self._static_scopes = None
+
+    def _static_names_of(self, lineno: int, name: str) -> StaticNames:
+        scopes = self._static_scopes
+        if scopes is None:
+            return {}
+        candidates = scopes.get((lineno, name))
+        return candidates.pop(0) if candidates else {}
+
+    def _replay_function(self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef], cache_key: FunctionKey) -> bool:
+        cached = self.function_cache.get(cache_key)  # type: ignore
+        if cached is None:
+            return False
+        first_line = self._function_first_line(node)
+        for line_offset, col, code, name, node_cls in cached:
+            self.errors.append(ErrorRecord(first_line + line_offset, col, code, name, node_cls))
+        return True
+
+    def _store_function(
+            self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef], cache_key: FunctionKey, errors_before: int
+    ) -> None:
+        first_line = self._function_first_line(node)
+        self.function_cache.put(cache_key, [  # type: ignore
+            (error.line_number - first_line, error.offset, error.code, error.name, error.cls)
+            for error in self.errors[errors_before:]
+        ])
 
     def visit_For(self, node: ast.For) -> Any:
-        frame = Frame()
-        self.stack.append(frame)
+        self.scopes.push()
         try:
             # frame.append(node.target.id)  # type: ignore
             self._visit_assign_target(node.target)
-            for field, value in ast.iter_fields(node):
-                if isinstance(value, list):
-                    for item in value:
-                        if isinstance(item, ast.AST):
-                            self.visit(item)
-                elif isinstance(value, ast.AST):
-                    self.visit(value)
+            yield child_nodes(node)
         except AttributeError:
             print("Can't check For", node.lineno, node.col_offset)
         finally:
-            self.stack.pop()
+            self.scopes.pop()
 
     def visit_AsyncFor(self, node: ast.AsyncFor) -> Any:
-        frame = Frame()
-        self.stack.append(frame)
+        self.scopes.push()
         try:
             # frame.append(node.target.id)  # type: ignore
             self._visit_assign_target(node.target)
-            for field, value in ast.iter_fields(node):
-                if isinstance(value, list):
-                    for item in value:
-                        if isinstance(item, ast.AST):
-                            self.visit(item)
-                elif isinstance(value, ast.AST):
-                    self.visit(value)
+            yield child_nodes(node)
         except AttributeError:
             print("Can't check For", node.lineno, node.col_offset)
         finally:
-            self.stack.pop()
-
-    def visit_IfExp(self, node: ast.IfExp) -> Any:
-        for field, value in ast.iter_fields(node):
-            if isinstance(value, list):
-                for item in value:
-                    if isinstance(item, ast.AST):
-                        self.visit(item)
-            elif isinstance(value, ast.AST):
-                self.visit(value)
-        self.generic_visit(node)
+            self.scopes.pop()
 
     def _visit_import(self, node: Union[ast.Import, ast.ImportFrom]):
-        self.stack[-1].extend([
+        names = [
             sub_node.asname if sub_node.asname is not None else sub_node.name
             for sub_node in node.names
-        ])
-        for field, value in ast.iter_fields(node):
-            if isinstance(value, list):
-                for item in value:
-                    if isinstance(item, ast.AST):
-                        self.visit(item)
-            elif isinstance(value, ast.AST):
-                self.visit(value)
-        self.generic_visit(node)
+        ]
+        if names == ['*'] and self.export_index is not None:
+            exported = self.export_index.star_import(node.module, node.level or 0, self.module_name)  # type: ignore
+            if exported is not None:
+                names.extend(exported)
+        self.scopes.bind_all(names)
 
     def visit_Import(self, node: ast.Import) -> Any:
-        self._visit_import(node)
+        return self._visit_import(node)
 
     def visit_ImportFrom(self, node: ast.ImportFrom) -> Any:
-        self._visit_import(node)
+        return self._visit_import(node)
 
     def visit_Module(self, node: ast.Module) -> Any:
-        frame = Frame()
-        self.stack.append(frame)
+        self._load_static_scopes()
+        if self.function_cache is not None and self.lines and sys.version_info < (3, 8):  # pragma: no cover
+            self._function_bounds = function_bounds(node, len(self.lines))  # type: ignore
+        self._enter_budget(None)
+        if self.mode == FAST:
+            self.straight_line = True
+        self.scopes.push()
         self._visit_top_level(node)  # Needed to detect top-level module definitions
         try:
-            for field, value in ast.iter_fields(node):
-                if isinstance(value, list):
-                    for item in value:
-                        if isinstance(item, ast.AST):
-                            self.visit(item)
-                elif isinstance(value, ast.AST):
-                    self.visit(value)
+            yield child_nodes(node)
         finally:
-            self.stack.pop()
+            self.scopes.pop()
 
     def _visit_top_level(self, node):
         # Todo: it's definitely not enough to properly list all the fns,
         #  but just works for most cases
         for expr in node.body:
             if isinstance(expr, (ast.FunctionDef, ast.ClassDef)):
-                self.stack[-1].append(expr.name)
+                self.scopes.bind(expr.name)
 
     def visit_ClassDef(self, node: ast.ClassDef) -> Any:
         # Todo: add metaclass/superclass/etc analysis.
-        self.stack[-1].append(node.name)
-        for field, value in ast.iter_fields(node):
-            if isinstance(value, list):
-                for item in value:
-                    if isinstance(item, ast.AST):
-                        self.visit(item)
-            elif isinstance(value, ast.AST):
-                self.visit(value)
+        self.scopes.bind(node.name)
+        if not self.static_names:
+            return child_nodes(node)
+        return self._visit_class_body(node)
+
+    def _visit_class_body(self, node: ast.ClassDef) -> Any:
+        # Names of a class body inside a function are tracked like module level ones.
+        outer_static_names, self.static_names = self.static_names, {}
+        try:
+            yield child_nodes(node)
+        finally:
+            self.static_names = outer_static_names
 
     def visit(self, node):
-        """Visit a node."""
-        method = 'visit_' + node.__class__.__name__
-        visitor = getattr(self, method, self.generic_visit)
-        return visitor(node)  # type: ignore
+        """Visit a node and its subtree."""
+        walk(self, node)
+
+    def iter_visit(self, node: ast.AST) -> Iterator['ErrorRecord']:
+        """Visit a node and its subtree, yielding errors as soon as they are found.
+
+        Errors are still collected in `errors`. Closing the iterator early stops the walk,
+        after which the visitor has to be reset before it's used again.
+        """
+        return iter_walk(self, node, self.errors)
+
+    def generic_visit(self, node):
+        for child in child_nodes(node):
+            self.visit(child)
 
     def visit_Name(self, node: ast.Name) -> Any:
-        self._visit_names(node)
+        name = node.id
+        if name in self.default_names:
+            return
+        bound = self.static_names.get(name)
+        if not (name in self.scopes if bound is None else bound):
+            self._report(node)
 
     def visit_Tuple(self, node: ast.Tuple) -> Any:
         self._visit_names(node)
 
     def _visit_names(self, node: Union[ast.Name, ast.Tuple]):
-        if isinstance(node, ast.Name):
-            if hasattr(node, 'id') and not (
-                    node.id in self.default_names or self._check_stack(node.id)):
-                self.errors.append(
-                    Flake8ASTErrorInfo(
-                        node.lineno,
-                        node.col_offset,
-                        self.msg % str(node.id),  # type: ignore
-                        type(node)
-                    )
-                )
-        elif isinstance(node, ast.Tuple):
-            for element in node.elts:
-                self._visit_names(element)  # type: ignore
+        pending = [node]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, ast.Name):
+                if hasattr(node, 'id') and not (
+                        node.id in self.default_names or self._check_stack(node.id)):
+                    self._report(node)
+            elif isinstance(node, ast.Tuple):
+                pending.extend(reversed(node.elts))  # type: ignore
+
+    def _report(self, node: ast.Name) -> None:
+        self.errors.append(ErrorRecord(node.lineno, node.col_offset, CODE, str(node.id), type(node)))
 
     def visit_Call(self, node: ast.Call) -> Any:
         if hasattr(node, 'id') and not (
                 node.id in self.default_names  # type: ignore
                 or self._check_stack(node.id)):  # type: ignore
             self.errors.append(
-                Flake8ASTErrorInfo(
+                ErrorRecord(
                     node.lineno,
                     node.col_offset,
-                    self.msg % str(node.id),  # type: ignore
+                    CODE,
+                    str(node.id),  # type: ignore
                     type(node)
                 )
             )
-        for field, value in ast.iter_fields(node):
-            if isinstance(value, list):
-                for item in value:
-                    if isinstance(item, ast.AST):
-                        self.visit(item)
-            elif isinstance(value, ast.AST):
-                self.visit(value)
+        return child_nodes(node)
 
     def _check_stack(self, name):
-        for frame in self.stack:
-            for entry in frame:
-                if entry == name:
-                    return True
-        return False
+        bound = self.static_names.get(name)
+        return name in self.scopes if bound is None else bound
 
     def visit_ListComp(self, node: ast.ListComp) -> Any:
-        self.stack.append(Frame())
+        self.scopes.push()
         for generator in node.generators:
             self._visit_assign_target(generator.target)
         self._visit_names(node.elt)  # type: ignore
-        self.stack.pop()
+        self.scopes.pop()
 
     def visit_DictComp(self, node: ast.DictComp) -> Any:
-        self.stack.append(Frame())
+        self.scopes.push()
         for generator in node.generators:
             self._visit_assign_target(generator.target)
         # Todo: what's the problem?
         self._visit_names(node.key)  # type: ignore
         self._visit_names(node.value)  # type: ignore
-        self.stack.pop()
+        self.scopes.pop()
 
     def visit_SetComp(self, node: ast.SetComp) -> Any:
-        self.stack.append(Frame())
+        self.scopes.push()
         for generator in node.generators:
             self._visit_assign_target(generator.target)
         self._visit_names(node.elt)  # type: ignore
-        self.stack.pop()
+        self.scopes.pop()
 
     def visit_GeneratorExp(self, node: ast.GeneratorExp) -> Any:
-        self.stack.append(Frame())
+        self.scopes.push()
         for generator in node.generators:
             self._visit_assign_target(generator.target)
         self._visit_names(node.elt)  # type: ignore
-        self.stack.pop()
+        self.scopes.pop()
 
     def visit_With(self, node: ast.With) -> Any:
-        self.stack.append(Frame())
+        self.scopes.push()
         for withitem in node.items:
             if isinstance(withitem, ast.withitem) and withitem.optional_vars is not None:
                 self._visit_assign_target(withitem.optional_vars)
         # Frame for variables defined within 'with' scope.
-        self.stack.append(Frame())
+        self.scopes.push()
         for expr in node.body:
-            self.visit(expr)  # type: ignore
+            yield expr
         # Pop variables to save them in the higher-level frame
-        defined_within_with = self.stack.pop()
-        self.stack.pop()
-        for val in defined_within_with:
-            self.stack[-1].append(val)
+        defined_within_with = self.scopes.pop()
+        self.scopes.pop()
+        self.scopes.bind_mask(defined_within_with)
 
     def visit_AsyncWith(self, node: ast.AsyncWith) -> Any:
-        self.stack.append(Frame())
+        self.scopes.push()
         for withitem in node.items:
             if isinstance(withitem, ast.withitem) and withitem.optional_vars is not None:
                 self._visit_assign_target(withitem.optional_vars)
         # Frame for variables defined within 'with' scope.
-        self.stack.append(Frame())
+        self.scopes.push()
         for expr in node.body:
-            self.visit(expr)  # type: ignore
+            yield expr
         # Pop variables to save them in the higher-level frame
-        defined_within_with = self.stack.pop()
-        self.stack.pop()
-        for val in defined_within_with:
-            self.stack[-1].append(val)
+        defined_within_with = self.scopes.pop()
+        self.scopes.pop()
+        self.scopes.bind_mask(defined_within_with)
 
     def visit_Lambda(self, node: ast.Lambda) -> Any:
+        outer_static_names, self.static_names = self.static_names, self._static_names_of(node.lineno, LAMBDA)
         try:
-            self.stack.append(Frame())
+            self.scopes.push(scope=True)
             for arg in node.args.args:
-                self.stack[-1].append(arg.arg)
+                self.scopes.bind(arg.arg)
             if node.args.vararg is not None:
-                self.stack[-1].append(node.args.vararg.arg)
+                self.scopes.bind(node.args.vararg.arg)
             if node.args.kwarg is not None:
-                self.stack[-1].append(node.args.kwarg.arg)
-            self.visit(node.body)  # type: ignore
+                self.scopes.bind(node.args.kwarg.arg)
+            yield node.body
         finally:
-            self.stack.pop()
+            self.scopes.pop()
+            self.static_names = outer_static_names
 
     @property
     def msg(self):
-        return "F823 variable '%s' referenced_before_assignment"
+        return MSG
+
+
+CODE = 'F823'
+MSG = f"{CODE} variable '%s' referenced_before_assignment"
+
+ENGINES = ('visitor', 'cfg')
 
 
 class Flake8ASTErrorInfo(NamedTuple):
+    """A diagnostic, the tuple (line_number, offset, msg, cls) flake8 unpacks."""
     line_number: int
     offset: int
     msg: str
     cls: type  # unused as for now
 
+    @classmethod
+    def for_name(cls, line_number: int, offset: int, name: str, node_cls: type = ast.Name) -> 'Flake8ASTErrorInfo':
+        return cls(line_number, offset, MSG % name, node_cls)
+
+
+MESSAGES = {CODE: MSG, BUDGET_CODE: BUDGET_MSG}
+
+
+class ErrorRecord:
+    """An error as the visitor collects it, formatted into a message only by `info`.
+
+    `name` is the name an F823 error is about, or the scope an F829 notice names.
+    """
+    __slots__ = ('line_number', 'offset', 'code', 'name', 'cls')
+
+    def __init__(self, line_number: int, offset: int, code: str, name: str, cls: type = ast.Name):
+        self.line_number = line_number
+        self.offset = offset
+        self.code = code
+        self.name = name
+        self.cls = cls
+
+    @property
+    def msg(self) -> str:
+        return MESSAGES[self.code] % self.name
+
+    def info(self) -> Flake8ASTErrorInfo:
+        return Flake8ASTErrorInfo(self.line_number, self.offset, MESSAGES[self.code] % self.name, self.cls)
+
+
+def _split_names(value: Union[str, List[str], None]) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [name.strip() for name in value if name.strip()]
+
 
 class ReferencedBeforeAssignmentASTPlugin:
     name = 'flake_rba'
     version = '0.0.0'
     _code = 'F823'
 
-    def __init__(self, tree: ast.AST):
+    default_names: FrozenSet[str] = ReferencedBeforeAssignmentNodeVisitor.default_names
+    cache: Optional[ResultCache] = None
+    function_cache: Optional[FunctionCache] = None
+    engine = 'visitor'
+    use_symtable = False
+    # At most this many errors are reported per file, 0 for no limit.
+    max_errors_per_file = 0
+    fail_fast = False
+    mode = PRECISE
+    branch_budget = DEFAULT_BRANCH_BUDGET
+    time_budget = 0.0
+    # Lines changed since the --rba-diff revision, None to check whole files.
+    changed_lines: Optional[ChangedLines] = None
+    export_index: Optional[ExportIndex] = None
+    visitor_class: type = ReferencedBeforeAssignmentNodeVisitor
+    profiler: Optional[Profiler] = None
+    _options_key: Optional[str] = None
+
+    def __init__(self, tree: ast.AST, lines: Optional[Sequence[str]] = None, filename: Optional[str] = None):
         self._tree = tree
+        self._lines = lines
+        self._filename = filename
+
+    @classmethod
+    def add_options(cls, parser) -> None:
+        parser.add_option(
+            '--rba-target-version',
+            default=None,
+            parse_from_config=True,
+            help='Python version of the checked code, e.g. 3.8. Selects the set of builtins '
+                 '(default: the version running flake8).',
+        )
+        parser.add_option(
+            '--rba-extra-globals',
+            default='',
+            parse_from_config=True,
+            comma_separated_list=True,
+            help='Comma-separated names to treat as always defined, '
+                 'e.g. names injected by a framework.',
+        )
+        parser.add_option(
+            '--rba-engine',
+            default='visitor',
+            choices=ENGINES,
+            parse_from_config=True,
+            help='Analysis to run: "visitor", the original AST walk, or "cfg", definite assignment '
+                 'over control flow graphs (default: %(default)s).',
+        )
+        parser.add_option(
+            '--rba-mode',
+            default=PRECISE,
+            choices=MODES,
+            parse_from_config=True,
+            help='"precise" merges the names bound in if/else and try branches; "fast" checks '
+                 'statements in order, in time linear in the code but missing names bound in '
+                 'some branches only (default: %(default)s).',
+        )
+        parser.add_option(
+            '--rba-branch-budget',
+            default=DEFAULT_BRANCH_BUDGET,
+            type=int,
+            parse_from_config=True,
+            help='If and try statements to merge per function before checking the rest of it in '
+                 'fast mode and reporting F829, 0 for no limit (default: %(default)s).',
+        )
+        parser.add_option(
+            '--rba-time-budget',
+            default=0.0,
+            type=float,
+            parse_from_config=True,
+            help='Seconds to spend per function before checking the rest of it in fast mode and '
+                 'reporting F829, 0 for no limit; makes results depend on the machine (default: %(default)s).',
+        )
+        parser.add_option(
+            '--rba-symtable',
+            default=False,
+            action='store_true',
+            parse_from_config=True,
+            help='Resolve names a function never binds with a symtable pre-pass: globals '
+                 'bound anywhere in the module, and free and nonlocal names, are always defined. '
+                 'More precise, but slower than the default.',
+        )
+        parser.add_option(
+            '--rba-max-errors-per-file',
+            default=0,
+            type=int,
+            parse_from_config=True,
+            help='Report at most this many errors per file, 0 for all of them (default: %(default)s).',
+        )
+        parser.add_option(
+            '--rba-fail-fast',
+            default=False,
+            action='store_true',
+            parse_from_config=True,
+            help='Stop checking a file once --rba-max-errors-per-file errors (1 if unset) are found, '
+                 'instead of finishing the analysis and dropping the rest.',
+        )
+        parser.add_option(
+            '--rba-diff',
+            default=None,
+            metavar='REV',
+            parse_from_config=True,
+            help='Only check the functions, classes and module level code changed since this git '
+                 'revision, e.g. origin/main; files without changes are skipped.',
+        )
+        parser.add_option(
+            '--rba-export-index',
+            default=None,
+            parse_from_config=True,
+            help='File to keep an index of the names every project module exports in, to resolve '
+                 '`from module import *` of project modules (default: off).',
+        )
+        parser.add_option(
+            '--rba-source-roots',
+            default='.',
+            parse_from_config=True,
+            comma_separated_list=True,
+            help='Comma-separated directories project modules are imported from, for the export '
+                 'index (default: %(default)s).',
+        )
+        parser.add_option(
+            '--rba-cache-dir',
+            default=None,
+            parse_from_config=True,
+            help='Directory to cache results of unchanged files in (default: no cache).',
+        )
+        parser.add_option(
+            '--rba-cache-max-size',
+            default=DEFAULT_MAX_SIZE // (1024 * 1024),
+            type=int,
+            parse_from_config=True,
+            help='Size of the result cache in megabytes (default: %(default)s).',
+        )
+        parser.add_option(
+            '--rba-function-cache',
+            default=False,
+            action='store_true',
+            parse_from_config=True,
+            help='Reuse results of functions whose text was already checked in this process.',
+        )
+        parser.add_option(
+            '--rba-profile',
+            default=None,
+            parse_from_config=True,
+            help='Record calls and time per visitor handler and write the report to this file, '
+                 f'or to stderr for "-" (default: ${PROFILE_ENV}, or off).',
+        )
+        parser.add_option(
+            '--rba-profile-per-file',
+            default=False,
+            action='store_true',
+            parse_from_config=True,
+            help='Append one JSON line per checked file to the profile instead of writing a total '
+                 'at exit; needed when flake8 runs several jobs.',
+        )
+
+    @classmethod
+    def parse_options(cls, options) -> None:
+        target_version = getattr(options, 'rba_target_version', None)
+        cls.default_names = known_names(
+            parse_version(target_version) if target_version else None,
+            _split_names(getattr(options, 'rba_extra_globals', None)),
+        )
+        engine = getattr(options, 'rba_engine', None) or 'visitor'
+        if engine not in ENGINES:
+            raise ValueError(f'unknown engine {engine!r}, expected one of: {", ".join(ENGINES)}')
+        cls.engine = engine
+        mode = getattr(options, 'rba_mode', None) or PRECISE
+        if mode not in MODES:
+            raise ValueError(f'unknown mode {mode!r}, expected one of: {", ".join(MODES)}')
+        cls.mode = mode
+        branch_budget = getattr(options, 'rba_branch_budget', None)
+        cls.branch_budget = DEFAULT_BRANCH_BUDGET if branch_budget is None else int(branch_budget)
+        cls.time_budget = float(getattr(options, 'rba_time_budget', None) or 0.0)
+        if cls.branch_budget < 0 or cls.time_budget < 0:
+            raise ValueError('budgets must not be negative')
+        cls.use_symtable = bool(getattr(options, 'rba_symtable', False))
+        cls.fail_fast = bool(getattr(options, 'rba_fail_fast', False))
+        max_errors = int(getattr(options, 'rba_max_errors_per_file', None) or 0)
+        if max_errors < 0:
+            raise ValueError(f'--rba-max-errors-per-file must not be negative, got {max_errors}')
+        cls.max_errors_per_file = max_errors or (1 if cls.fail_fast else 0)
+        diff_rev = getattr(options, 'rba_diff', None)
+        cls.changed_lines = changed_lines(diff_rev) if diff_rev else None
+        index_path = getattr(options, 'rba_export_index', None)
+        if index_path:
+            roots = _split_names(getattr(options, 'rba_source_roots', None)) or ['.']
+            cls.export_index = ExportIndex(index_path, roots)
+            cls.export_index.update()
+            cls.export_index.save()
+        else:
+            cls.export_index = None
+        cls._options_key = None
+        cache_dir = getattr(options, 'rba_cache_dir', None)
+        if cache_dir:
+            max_size = getattr(options, 'rba_cache_max_size', None) or DEFAULT_MAX_SIZE // (1024 * 1024)
+            cls.cache = ResultCache(cache_dir, int(max_size) * 1024 * 1024)
+        else:
+            cls.cache = None
+        # Entries depend on the options, so start over whenever they change.
+        cls.function_cache = FunctionCache() if getattr(options, 'rba_function_cache', False) else None
+        cls.configure_profiling(
+            getattr(options, 'rba_profile', None),
+            getattr(options, 'rba_profile_per_file', False),
+        )
+
+    @classmethod
+    def configure_profiling(cls, target: Optional[str] = None, per_file: bool = False) -> None:
+        """Switch to the profiled visitor if a report target is given or set in the environment."""
+        target = target or os.environ.get(PROFILE_ENV) or None
+        per_file = per_file or bool(os.environ.get(PROFILE_PER_FILE_ENV))
+        if target is None:
+            cls.profiler = None
+            cls.visitor_class = ReferencedBeforeAssignmentNodeVisitor
+        else:
+            cls.profiler = get_profiler(target, per_file)
+            cls.visitor_class = profiled(ReferencedBeforeAssignmentNodeVisitor)
+
+    @classmethod
+    def options_key(cls) -> str:
+        """Digest of the options that affect results, part of the cache key."""
+        if cls._options_key is None:
+            cls._options_key = hashlib.sha256(
+                '\n'.join(
+                    [cls.engine, cls.mode, str(cls.branch_budget), str(cls.time_budget), str(cls.use_symtable),
+                     str(cls.export_index is not None)]
+                    + sorted(cls.default_names)
+                ).encode()
+            ).hexdigest()
+        return cls._options_key
 
     def run(self) -> Iterator[Flake8ASTErrorInfo]:
-        visitor = ReferencedBeforeAssignmentNodeVisitor()
-        visitor.visit(self._tree)
-
-        for error in visitor.errors:
+        errors = self._results() if self.changed_lines is None else self._changed_results()
+        limit = self.max_errors_per_file
+        if limit:
+            if not self.fail_fast:
+                # Finish the analysis, so the caches get the complete results.
+                errors = iter(list(errors))
+            errors = islice(errors, limit)
+        yield from errors
+
+    def _results(self) -> Iterator[Flake8ASTErrorInfo]:
+        cache = self.cache
+        if cache is None or self._lines is None:
+            yield from self._check()
+            return
+
+        parts = [self.name, self.version, self.options_key()]
+        if self.export_index is not None:
+            # Star imports of project modules depend on where the file is and what they export.
+            parts.append(self.export_index.digest_for(self._tree, self._module_name()))  # type: ignore
+        key = cache.key(self._lines, *parts)
+        cached = cache.get(key)
+        if cached is not None:
+            for line, col, msg in cached:
+                yield Flake8ASTErrorInfo(line, col, msg, ast.Name)
+            return
+
+        errors = []
+        for error in self._check():
+            errors.append(error)
             yield error
+        # Only reached if the analysis ran to the end.
+        cache.put(key, [(error.line_number, error.offset, error.msg) for error in errors])
+
+    def _changed_results(self) -> Iterator[Flake8ASTErrorInfo]:
+        path = os.path.realpath(self._filename or '')
+        if path not in self.changed_lines:  # type: ignore
+            return
+        lines = self.changed_lines[path]  # type: ignore
+        if lines is None:
+            # Not tracked by git, so new as a whole.
+            yield from self._results()
+            return
+        scopes = ScopeMap(self._tree)
+        touched = scopes.touched(lines)
+        for error in self._check(scopes.containing(lines)):
+            if scopes.scope_of(error.line_number) in touched:
+                yield error
+
+    def _module_name(self) -> Optional[str]:
+        if self.export_index is None or not self._filename:
+            return None
+        return self.export_index.module_of(self._filename)
+
+    def _check(self, only_functions: Optional[AbstractSet[ast.AST]] = None) -> Iterator[Flake8ASTErrorInfo]:
+        if self.engine == 'cfg':
+            for node in unbound_loads(self._tree, self.default_names):
+                yield Flake8ASTErrorInfo.for_name(node.lineno, node.col_offset, node.id, type(node))
+            return
+
+        visitor = self.visitor_class(
+            self.default_names, self._lines, self.function_cache, self.use_symtable, self.export_index,
+        )
+        visitor.only_functions = only_functions
+        visitor.mode = self.mode
+        visitor.branch_budget = self.branch_budget
+        visitor.time_budget = self.time_budget
+        visitor.module_name = self._module_name()
+        try:
+            for error in visitor.iter_visit(self._tree):
+                yield error.info()
+        finally:
+            if self.profiler is not None:
+                self.profiler.record(visitor.profile, self._filename)
+
+
+ReferencedBeforeAssignmentASTPlugin.configure_profiling()
@@ -0,0 +1,110 @@
+"""Structural pre-scan deciding whether a function needs the branch-merging walk.
+
+The if/try helpers of the visitor only matter when a name is bound inside a branch:
+without such bindings every branch sees the same names, so visiting the statements in
+order gives the same result. The scan also rules out the places where the helpers
+deliberately skip or repeat statements, so both walks report exactly the same errors.
+"""
+import ast
+from typing import Dict, List, Union
+
+_TERMINAL = (ast.Return, ast.Raise, ast.Continue, ast.Break)
+# Statements the visitor binds names for.
+_BINDING = frozenset((
+    ast.Assign, ast.AnnAssign, ast.Import, ast.ImportFrom,
+    ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef,
+))
+
+Function = Union[ast.FunctionDef, ast.AsyncFunctionDef]
+
+
+def _aborts(stmts: List[ast.stmt], memo: Dict[int, bool]) -> bool:
+    for stmt in stmts:
+        if isinstance(stmt, _TERMINAL):
+            return True
+        if isinstance(stmt, ast.If) and _if_aborts(stmt, memo):
+            return True
+    return False
+
+
+def _if_aborts(node: ast.If, memo: Dict[int, bool]) -> bool:
+    """Whether both branches of an if statement end in a jump."""
+    # elif chains are followed in a loop, however long they are.
+    chain = []
+    while True:
+        cached = memo.get(id(node))
+        if cached is not None:
+            result = cached
+            break
+        chain.append(node)
+        if not _aborts(node.body, memo):
+            result = False
+            break
+        orelse = node.orelse
+        if len(orelse) == 1 and isinstance(orelse[0], ast.If):
+            node = orelse[0]
+            continue
+        result = _aborts(orelse, memo)
+        break
+    for link in chain:
+        memo[id(link)] = result
+    return result
+
+
+# Statement lists of compound statements, other than the clauses of try and match.
+_BODIES = {
+    ast.FunctionDef: ('body',),
+    ast.AsyncFunctionDef: ('body',),
+    ast.ClassDef: ('body',),
+    ast.For: ('body', 'orelse'),
+    ast.AsyncFor: ('body', 'orelse'),
+    ast.While: ('body', 'orelse'),
+    ast.If: ('body', 'orelse'),
+    ast.With: ('body',),
+    ast.AsyncWith: ('body',),
+    ast.Try: ('body', 'orelse', 'finalbody'),
+}
+if hasattr(ast, 'TryStar'):
+    _BODIES[ast.TryStar] = ('body', 'orelse', 'finalbody')  # type: ignore
+if hasattr(ast, 'Match'):
+    _BODIES[ast.Match] = ()  # type: ignore
+
+
+def _breaks_off(body: List[ast.stmt], memo: Dict[int, bool]) -> bool:
+    """Whether a statement of a branch follows one that always jumps away."""
+    for stmt in body[:-1]:
+        if isinstance(stmt, _TERMINAL) or (stmt.__class__ is ast.If and _if_aborts(stmt, memo)):  # type: ignore
+            return True
+    return False
+
+
+def is_straight_line(function: Function) -> bool:
+    """Whether a function can be checked without merging the names bound in branches.
+
+    That holds when no name is bound anywhere inside an if or try statement, no
+    statement in a branch follows one that always jumps away and no handler names its
+    exception.
+    """
+    memo: Dict[int, bool] = {}
+    # Statement lists to scan, and whether they are inside an if or try statement.
+    pending = [(function.body, False)]
+    while pending:
+        body, in_branch = pending.pop()
+        for stmt in body:
+            cls = stmt.__class__
+            if in_branch and cls in _BINDING:
+                return False
+            fields = _BODIES.get(cls)
+            if fields is None:
+                continue
+            clauses = getattr(stmt, 'handlers', None) or getattr(stmt, 'cases', None) or ()
+            bodies = [getattr(stmt, field) for field in fields] + [clause.body for clause in clauses]
+            if cls is ast.If or cls is ast.Try:
+                if any(_breaks_off(branch, memo) for branch in bodies):
+                    return False
+                if cls is ast.Try and any(handler.name is not None for handler in clauses):
+                    return False
+                pending.extend((branch, True) for branch in bodies)
+            else:
+                pending.extend((branch, in_branch) for branch in bodies)
+    return True
@@ -0,0 +1,294 @@
+"""Opt-in instrumentation of the visitor.
+
+Profiling swaps the visitor class for a subclass whose handlers are wrapped with
+counters and timers, so an ordinary run pays nothing for it. Tests swap it for one
+counting the visits of every node the same way.
+"""
+import ast
+import atexit
+import inspect
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flake_rba.symbols import Mask, SymbolTable
+from flake_rba.traversal import child_nodes
+
+PROFILE_ENV = 'FLAKE_RBA_PROFILE'
+PROFILE_PER_FILE_ENV = 'FLAKE_RBA_PROFILE_PER_FILE'
+GENERIC = 'generic_visit'
+FAST_PATH = 'fast path functions'
+
+
+class Profile:
+    """Call counts and times per handler, plus symbol table statistics.
+
+    Times of generator handlers include the children they visit; plain handlers hand
+    their children back to the traversal, so only their own work is timed.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.max_depth = 0
+        self.max_frame_size = 0
+        self.probes = 0
+
+    def merge(self, other: 'Profile') -> None:
+        self.files += other.files
+        for name, calls in other.calls.items():
+            self.calls[name] += calls
+        for name, seconds in other.seconds.items():
+            self.seconds[name] += seconds
+        for name, count in other.counters.items():
+            self.counters[name] += count
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.max_frame_size = max(self.max_frame_size, other.max_frame_size)
+        self.probes += other.probes
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'files': self.files,
+            'handlers': {
+                name: {'calls': self.calls[name], 'seconds': self.seconds[name]}
+                for name in sorted(self.calls)
+            },
+            'counters': dict(sorted(self.counters.items())),
+            'max_depth': self.max_depth,
+            'max_frame_size': self.max_frame_size,
+            'probes': self.probes,
+        }
+
+    def format(self) -> str:
+        lines = [f'flake_rba profile: {self.files} file(s)', f"{'handler':<28}{'calls':>12}{'seconds':>12}"]
+        for name in sorted(self.calls, key=lambda name: -self.seconds[name]):
+            lines.append(f'{name:<28}{self.calls[name]:>12}{self.seconds[name]:>12.6f}')
+        for name, count in sorted(self.counters.items()):
+            lines.append(f'{name}: {count}')
+        lines += [
+            f'max stack depth: {self.max_depth}',
+            f'max frame size: {self.max_frame_size}',
+            f'symbol table probes: {self.probes}',
+        ]
+        return '\n'.join(lines)
+
+
+class ProfilingSymbolTable(SymbolTable):
+    __slots__ = ('profile',)
+
+    def __init__(self, profile: Profile):
+        super().__init__()
+        self.profile = profile
+
+    def __contains__(self, name: str) -> bool:
+        self.profile.probes += 1
+        return name in self._index
+
+    def push(self, scope: bool = False) -> None:
+        super().push(scope)
+        if len(self._frames) > self.profile.max_depth:
+            self.profile.max_depth = len(self._frames)
+
+    def bind(self, name: str) -> None:
+        super().bind(name)
+        self._measure_frame()
+
+    def bind_mask(self, mask: Mask) -> None:
+        super().bind_mask(mask)
+        self._measure_frame()
+
+    def _measure_frame(self) -> None:
+        size = bin(self._frames[-1]).count('1')
+        if size > self.profile.max_frame_size:
+            self.profile.max_frame_size = size
+
+
+def _wrap(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    if inspect.isgeneratorfunction(func):
+        def wrapper(self, *args):
+            profile = self.profile
+            profile.calls[name] += 1
+            start = time.perf_counter()
+            try:
+                return (yield from func(self, *args))
+            finally:
+                profile.seconds[name] += time.perf_counter() - start
+    else:
+        def wrapper(self, *args):
+            profile = self.profile
+            profile.calls[name] += 1
+            start = time.perf_counter()
+            try:
+                return func(self, *args)
+            finally:
+                profile.seconds[name] += time.perf_counter() - start
+    wrapper.__name__ = name
+    wrapper.__wrapped__ = func  # type: ignore
+    return wrapper
+
+
+def _count_fast_path(func: Callable[..., bool]) -> Callable[..., bool]:
+    def wrapper(self, *args):
+        taken = func(self, *args)
+        if taken:
+            self.profile.counters[FAST_PATH] += 1
+        return taken
+    return wrapper
+
+
+def _generic(self, node: ast.AST) -> Any:
+    self.profile.calls[GENERIC] += 1
+    return child_nodes(node)
+
+
+def _children(self, node: ast.AST) -> Any:
+    return child_nodes(node)
+
+
+def _is_handler(name: str) -> bool:
+    return name.startswith(('visit_', '_visit_')) or name == '_check_stack'
+
+
+_PROFILED_CLASSES: Dict[type, type] = {}
+
+
+def profiled(visitor_cls: type) -> type:
+    """Return a subclass of `visitor_cls` that records a Profile in `self.profile`."""
+    cls = _PROFILED_CLASSES.get(visitor_cls)
+    if cls is not None:
+        return cls
+
+    namespace: Dict[str, Any] = {}
+    for name in dir(visitor_cls):
+        func = getattr(visitor_cls, name)
+        if _is_handler(name) and inspect.isfunction(func) and func is not getattr(ast.NodeVisitor, name, None):
+            namespace[name] = _wrap(name, func)
+    if hasattr(visitor_cls, '_takes_fast_path'):
+        namespace['_takes_fast_path'] = _count_fast_path(visitor_cls._takes_fast_path)  # type: ignore
+    # Count nodes that would be visited generically as well.
+    for node_cls in vars(ast).values():
+        if isinstance(node_cls, type) and issubclass(node_cls, ast.AST) and node_cls._fields:
+            namespace.setdefault('visit_' + node_cls.__name__, _generic)
+
+    def reset(self, lines=None):
+        self.profile = Profile()
+        self.profile.files = 1
+        visitor_cls.reset(self, lines)  # type: ignore
+        self.scopes = ProfilingSymbolTable(self.profile)
+
+    namespace['reset'] = reset
+    cls = _PROFILED_CLASSES[visitor_cls] = type('Profiled' + visitor_cls.__name__, (visitor_cls,), namespace)
+    return cls
+
+
+def _count_visits(func: Callable[..., Any]) -> Callable[..., Any]:
+    def wrapper(self, node):
+        self.visits[node] += 1
+        self._dispatched = node
+        try:
+            return func(self, node)
+        finally:
+            self._dispatched = None
+    wrapper.__name__ = func.__name__
+    wrapper.__wrapped__ = func  # type: ignore
+    return wrapper
+
+
+def _count_helper_visits(func: Callable[..., Any]) -> Callable[..., Any]:
+    def wrapper(self, node):
+        # Handlers pass the node they were dispatched for on to their helper.
+        if node is not self._dispatched:
+            self.visits[node] += 1
+        self._dispatched = None
+        return func(self, node)
+    wrapper.__name__ = func.__name__
+    wrapper.__wrapped__ = func  # type: ignore
+    return wrapper
+
+
+_COUNTING_CLASSES: Dict[type, type] = {}
+
+
+def counting(visitor_cls: type) -> type:
+    """Return a subclass of `visitor_cls` that counts in `self.visits` how often each node is entered.
+
+    A node is entered when the walk dispatches it to a handler, or when a handler passes
+    it to one of the `_visit_*_helper` methods directly. For tests: every node should be
+    entered at most once.
+    """
+    cls = _COUNTING_CLASSES.get(visitor_cls)
+    if cls is not None:
+        return cls
+
+    namespace: Dict[str, Any] = {}
+    for name in dir(visitor_cls):
+        func = getattr(visitor_cls, name)
+        if not inspect.isfunction(func) or func is getattr(ast.NodeVisitor, name, None):
+            continue
+        if name.startswith('visit_'):
+            namespace[name] = _count_visits(func)
+        elif name.startswith('_visit_') and name.endswith('_helper'):
+            namespace[name] = _count_helper_visits(func)
+    for node_cls in vars(ast).values():
+        if isinstance(node_cls, type) and issubclass(node_cls, ast.AST) and node_cls._fields:
+            namespace.setdefault('visit_' + node_cls.__name__, _count_visits(_children))
+
+    def reset(self, lines=None):
+        visitor_cls.reset(self, lines)  # type: ignore
+        self.visits = Counter()
+        self._dispatched = None
+
+    namespace['reset'] = reset
+    cls = _COUNTING_CLASSES[visitor_cls] = type('Counting' + visitor_cls.__name__, (visitor_cls,), namespace)
+    return cls
+
+
+class Profiler:
+    """Collects profiles of checked files and writes the report."""
+
+    def __init__(self, target: str, per_file: bool = False):
+        # '-' stands for stderr.
+        self.target = target
+        self.per_file = per_file
+        self.total = Profile()
+
+    def record(self, profile: Profile, filename: Optional[str] = None) -> None:
+        self.total.merge(profile)
+        if self.per_file:
+            entry = dict(profile.as_dict(), filename=filename)
+            self._write(json.dumps(entry) + '\n', append=True)
+
+    def dump(self) -> None:
+        if self.target == '-':
+            self._write(self.total.format() + '\n', append=True)
+        else:
+            self._write(json.dumps(self.total.as_dict(), indent=2) + '\n', append=False)
+
+    def _write(self, text: str, append: bool) -> None:
+        if self.target == '-':
+            sys.stderr.write(text)
+            return
+        # One write per entry on an O_APPEND file, so parallel workers don't interleave.
+        with open(self.target, 'a' if append else 'w') as file:
+            file.write(text)
+
+
+_PROFILERS: Dict[Tuple[str, bool], Profiler] = {}
+
+
+def get_profiler(target: str, per_file: bool = False) -> Profiler:
+    """Return the profiler writing to `target`; aggregated reports are written at exit.
+
+    Only the process that registered the profiler writes the aggregated report, so
+    checks spread over worker processes need the per-file report.
+    """
+    profiler = _PROFILERS.get((target, per_file))
+    if profiler is None:
+        profiler = _PROFILERS[target, per_file] = Profiler(target, per_file)
+        if not per_file:
+            atexit.register(profiler.dump)
+    return profiler
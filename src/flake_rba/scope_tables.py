@@ -0,0 +1,76 @@
+"""Scope pre-pass built on CPython's `symtable` module.
+
+`symtable` classifies every name of every function as local, free, global or declared
+nonlocal without a Python-level walk of the tree. The visitor only needs to track the
+flow of local names; the others are resolved once per function here. That makes the
+check more precise rather than faster: building the tables costs about as much as the
+visitor's own walk.
+"""
+import re
+import symtable
+from collections import defaultdict
+from typing import DefaultDict, Dict, List, Set, Tuple
+
+from _symtable import (  # type: ignore
+    CELL, DEF_BOUND, DEF_GLOBAL, DEF_LOCAL, GLOBAL_EXPLICIT, GLOBAL_IMPLICIT, LOCAL, SCOPE_MASK, SCOPE_OFF,
+)
+
+# Non-local names of a function, mapped to whether some scope binds them.
+StaticNames = Dict[str, bool]
+ScopeKey = Tuple[int, str]
+
+LAMBDA = 'lambda'
+_COMPREHENSIONS = frozenset(('listcomp', 'setcomp', 'dictcomp', 'genexpr'))
+_STAR_IMPORT = re.compile(r'^[ \t]*from[ \t]+[\w.]+[ \t]+import[ \t]*\*', re.MULTILINE)
+
+
+def static_names(source: str, filename: str = '<unknown>') -> DefaultDict[ScopeKey, List[StaticNames]]:
+    """Return the resolved non-local names of every function and lambda of a module.
+
+    Functions are keyed by their line and name, `lambda` for lambdas; functions sharing
+    a key are listed in source order, depth first. Free and nonlocal names are
+    always bound by an enclosing function; global ones are bound if the module binds
+    them anywhere. Raises SyntaxError for code `symtable` rejects.
+    """
+    top = symtable.symtable(source, filename, 'exec')
+    # Flags are read from the tables directly: SymbolTable.lookup looks for child tables
+    # of the same name, which is quadratic in functions with many comprehensions.
+    module_names: Set[str] = {
+        name for name, flags in top._table.symbols.items() if flags & DEF_BOUND  # type: ignore
+    }
+    # symtable doesn't report star imports, which may bind anything.
+    star_import = _STAR_IMPORT.search(source) is not None
+
+    functions: DefaultDict[ScopeKey, List[StaticNames]] = defaultdict(list)
+    # Global names of every function, resolved once the whole module is known.
+    global_names: List[Tuple[StaticNames, List[str]]] = []
+    # Depth-first, in source order, the order the visitor meets them in.
+    pending = top.get_children()[::-1]
+    while pending:
+        table = pending.pop()
+        pending.extend(table.get_children()[::-1])
+        name = table.get_name()
+        is_function = table.get_type() == 'function' and name not in _COMPREHENSIONS
+        names: StaticNames = {}
+        globals_: List[str] = []
+        for symbol, flags in table._table.symbols.items():  # type: ignore
+            if flags & DEF_GLOBAL and flags & DEF_LOCAL:
+                module_names.add(symbol)
+            if not is_function:
+                continue
+            scope = (flags >> SCOPE_OFF) & SCOPE_MASK
+            if scope in (LOCAL, CELL):
+                continue
+            if scope in (GLOBAL_IMPLICIT, GLOBAL_EXPLICIT):
+                globals_.append(symbol)
+            else:
+                # Free or nonlocal.
+                names[symbol] = True
+        if is_function:
+            global_names.append((names, globals_))
+            functions[table.get_lineno(), LAMBDA if name in (LAMBDA, '<lambda>') else name].append(names)
+
+    for names, globals_ in global_names:
+        for name in globals_:
+            names[name] = star_import or name in module_names
+    return functions
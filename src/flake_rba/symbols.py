@@ -0,0 +1,116 @@
+from typing import Dict, Iterable, Iterator, KeysView, List
+
+# A set of names as a bitmask of their ids in a SymbolTable.
+Mask = int
+
+
+def _bits(mask: Mask) -> Iterator[int]:
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class SymbolTable:
+    """Stack of scopes holding the names bound in each of them.
+
+    Names are interned to small integer ids and every frame is an int bitmask of the
+    ids bound in it, so snapshots of a frame are immutable and merging the frames of
+    two branches is a single `&`. An index maps each name to the number of frames it
+    is bound in, so a lookup is a single dict probe no matter how deep the stack is.
+
+    Frames pushed with `scope=True` start a function scope: names first seen inside
+    it get their ids released when it is popped, so ids stay small.
+    """
+    __slots__ = ('_frames', '_marks', '_ids', '_names', '_index')
+
+    def __init__(self):
+        self._frames: List[Mask] = []
+        # Number of interned names when each frame was pushed, or -1 for frames
+        # that don't start a scope.
+        self._marks: List[int] = []
+        # The bit of every interned name; its position is the index in `_names`.
+        self._ids: Dict[str, Mask] = {}
+        self._names: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._index
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def push(self, scope: bool = False) -> None:
+        self._frames.append(0)
+        self._marks.append(len(self._names) if scope else -1)
+
+    def pop(self) -> Mask:
+        frame = self._frames.pop()
+        self._release(frame)
+        mark = self._marks.pop()
+        if mark >= 0:
+            # Ids interned since the scope was pushed can only be held by its frames.
+            ids = self._ids
+            for name in self._names[mark:]:
+                del ids[name]
+            del self._names[mark:]
+        return frame
+
+    def clear(self) -> Mask:
+        """Unbind everything in the innermost frame, returning what was bound there."""
+        frame = self._frames[-1]
+        self._frames[-1] = 0
+        self._release(frame)
+        return frame
+
+    def names(self) -> KeysView[str]:
+        """Every name bound in any frame."""
+        return self._index.keys()
+
+    def names_in(self, mask: Mask) -> List[str]:
+        names = self._names
+        return [names[name_id] for name_id in _bits(mask)]
+
+    def top(self) -> Mask:
+        return self._frames[-1]
+
+    def bind(self, name: str) -> None:
+        bit = self._ids.get(name)
+        if bit is None:
+            bit = self._ids[name] = 1 << len(self._names)
+            self._names.append(name)
+        frames = self._frames
+        frame = frames[-1]
+        if not frame & bit:
+            frames[-1] = frame | bit
+            index = self._index
+            index[name] = index.get(name, 0) + 1
+
+    def bind_all(self, names: Iterable[str]) -> None:
+        for name in names:
+            self.bind(name)
+
+    def bind_mask(self, mask: Mask) -> None:
+        """Bind the names of a mask taken from this table in the innermost frame."""
+        frame = self._frames[-1]
+        new = mask & ~frame
+        if new:
+            self._frames[-1] = frame | new
+            index = self._index
+            names = self._names
+            for name_id in _bits(new):
+                name = names[name_id]
+                index[name] = index.get(name, 0) + 1
+
+    def _release(self, frame: Mask) -> None:
+        index = self._index
+        names = self._names
+        while frame:
+            low = frame & -frame
+            frame ^= low
+            name = names[low.bit_length() - 1]
+            count = index[name] - 1
+            if count:
+                index[name] = count
+            else:
+                del index[name]
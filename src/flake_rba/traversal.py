@@ -0,0 +1,183 @@
+import ast
+from types import GeneratorType
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Fields that never hold child nodes, whatever node class they belong to.
+_SCALAR_FIELDS = frozenset((
+    'arg', 'asname', 'attr', 'conversion', 'id', 'is_async', 'kind', 'level', 'module', 'n',
+    'name', 'rest', 's', 'simple', 'tag', 'type_comment',
+    # Expression contexts and operators are singletons without children or handlers.
+    'ctx', 'op', 'ops',
+))
+
+# Fields holding scalars for these node classes only.
+_SCALAR_CLASS_FIELDS = {
+    'Constant': ('value',),
+    'NameConstant': ('value',),
+    'MatchSingleton': ('value',),
+    'Global': ('names',),
+    'Nonlocal': ('names',),
+    'MatchClass': ('kwd_attrs',),
+}
+
+
+class ChildFieldTable(Dict[type, Tuple[str, ...]]):
+    """Maps an AST node class to the names of its fields that may hold child nodes."""
+
+    def __missing__(self, node_cls: type) -> Tuple[str, ...]:
+        scalar = _SCALAR_CLASS_FIELDS.get(node_cls.__name__, ())
+        fields = tuple(
+            field for field in getattr(node_cls, '_fields', ())
+            if field not in _SCALAR_FIELDS and field not in scalar
+        )
+        self[node_cls] = fields
+        return fields
+
+
+CHILD_FIELDS = ChildFieldTable()
+
+_MISSING = object()
+
+Handler = Callable[[ast.NodeVisitor, ast.AST], object]
+
+
+class HandlerTable(Dict[type, Optional[Handler]]):
+    """Maps an AST node class to the `visit_<ClassName>` function of a visitor class.
+
+    Classes without a handler map to None, meaning the node is visited generically. So do
+    the handlers `ast.NodeVisitor` itself defines, which only exist for deprecated node classes.
+    """
+
+    def __init__(self, visitor_cls: type):
+        super().__init__()
+        self._visitor_cls = visitor_cls
+
+    def __missing__(self, node_cls: type) -> Optional[Handler]:
+        name = 'visit_' + node_cls.__name__
+        handler = getattr(self._visitor_cls, name, None)
+        if handler is not None and handler is getattr(ast.NodeVisitor, name, None):
+            handler = None
+        self[node_cls] = handler
+        return handler
+
+
+_HANDLER_TABLES: Dict[type, HandlerTable] = {}
+
+
+def handler_table(visitor_cls: type) -> HandlerTable:
+    """Return the handler table of a visitor class, shared by all of its instances."""
+    table = _HANDLER_TABLES.get(visitor_cls)
+    if table is None:
+        table = _HANDLER_TABLES[visitor_cls] = HandlerTable(visitor_cls)
+    return table
+
+
+def child_nodes(node: ast.AST) -> List[ast.AST]:
+    """Return the direct children of a node, in field order."""
+    children: List[ast.AST] = []
+    for field in CHILD_FIELDS[node.__class__]:
+        value = getattr(node, field, None)
+        if value.__class__ is list:
+            children.extend([item for item in value if item is not None])
+        elif value is not None:
+            children.append(value)
+    return children
+
+
+def walk(visitor: ast.NodeVisitor, root: ast.AST) -> None:
+    """Run the handlers of `visitor` over the tree under `root` from an explicit work stack.
+
+    A handler either returns the list of nodes to visit next (or None), or is a generator
+    function. A generator handler yields the nodes (or lists of nodes) it wants visited and
+    the helper generators it wants to call; the value a helper returns is sent back into
+    the caller, and an exception raised below a handler is thrown into it. Nodes without a
+    handler have their children pushed directly, so neither the depth of the tree nor the
+    nesting of handlers grows the Python stack.
+    """
+    for _ in iter_walk(visitor, root, []):
+        pass
+
+
+def iter_walk(visitor: ast.NodeVisitor, root: ast.AST, results: List[Any]) -> Iterator[Any]:
+    """Walk like `walk`, yielding what handlers append to `results` as soon as they return.
+
+    Closing the iterator stops the walk; the visitor is left mid-tree and has to be reset.
+    """
+    handlers = visitor._handlers  # type: ignore
+    get_handler = handlers.get
+    child_fields = CHILD_FIELDS
+    get_fields = child_fields.get
+    stack: List[Any] = [root]
+    pop = stack.pop
+    push = stack.append
+    extend = stack.extend
+    value = None
+    error: Optional[BaseException] = None
+    emitted = 0
+    while stack:
+        item = pop()
+        node_cls = item.__class__
+        if node_cls is GeneratorType:
+            try:
+                if error is None:
+                    child = item.send(value)
+                else:
+                    exc, error = error, None
+                    child = item.throw(exc)
+            except StopIteration as stop:
+                value = stop.value
+                continue
+            except BaseException as exc:
+                error = exc
+            else:
+                value = None
+                push(item)
+                if child.__class__ is list:
+                    extend(child[::-1])
+                else:
+                    push(child)
+                if len(results) > emitted:
+                    yield from results[emitted:]
+                    emitted = len(results)
+                continue
+        else:
+            value = None
+            handler = get_handler(node_cls, _MISSING)
+            if handler is _MISSING:
+                handler = handlers[node_cls]
+            if handler is None:
+                # Visited generically. None stands in for missing dict keys and defaults,
+                # it has no handler and no children.
+                fields = get_fields(node_cls)
+                if fields is None:
+                    fields = child_fields[node_cls]
+                children: List[Any] = []
+                for field in fields:
+                    child = getattr(item, field, None)
+                    if child.__class__ is list:
+                        children.extend(child)
+                    elif child is not None:
+                        children.append(child)
+                if children:
+                    extend(children[::-1])
+                continue
+            try:
+                result = handler(visitor, item)
+            except BaseException as exc:
+                error = exc
+            else:
+                if result.__class__ is GeneratorType:
+                    push(result)
+                elif result:
+                    extend(result[::-1])
+                if len(results) > emitted:
+                    yield from results[emitted:]
+                    emitted = len(results)
+                continue
+        # Unwind pending nodes down to the nearest suspended handler.
+        while stack and stack[-1].__class__ is not GeneratorType:
+            pop()
+        if not stack:
+            raise error  # type: ignore
+    if len(results) > emitted:
+        yield from results[emitted:]
@@ -0,0 +1,298 @@
+"""Watch mode: check everything once, then re-check only the files that change.
+
+Changes are picked up with inotify on Linux, which names the files and directories that
+changed, so only these are looked at again. Elsewhere, and when inotify drops events,
+the modification times and sizes of all files are compared. Parsed files and results
+per function are kept by a `Daemon`, so a change re-parses the modified files and
+re-analyzes only the functions whose text changed.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set, TextIO, Tuple
+
+from flake_rba.api import Report
+from flake_rba.daemon import Daemon, Options
+from flake_rba.files import iter_directories, iter_directories_at, iter_python_files, iter_python_files_at
+
+DEFAULT_POLL_INTERVAL = 0.5
+# Editors save in several steps; changes within that many seconds are handled together.
+_SETTLE_DELAY = 0.05
+
+# inotify(7) event masks.
+_IN_MODIFY = 0x2
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+    | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+)
+# struct inotify_event without the name that follows it: wd, mask, cookie, len.
+_EVENT = struct.Struct('iIII')
+
+# Modification time and size of a file.
+Stat = Tuple[int, int]
+
+
+class Poller:
+    """Wakes up every `interval` seconds; the caller compares the stats of all files."""
+
+    def __init__(self, interval: float = DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+
+    def watch(self, directories: Iterable[str]) -> None:
+        pass
+
+    def wait(self) -> bool:
+        time.sleep(self.interval)
+        return True
+
+    def changed_paths(self) -> Optional[Set[str]]:
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """Sleeps until something changes in the watched directories. Linux only.
+
+    Raises OSError if inotify isn't available.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        self.timeout = timeout
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        # Watch descriptors by directory and the other way round.
+        self._watched: Dict[str, int] = {}
+        self._directories: Dict[int, str] = {}
+        self._changed: Set[str] = set()
+        self._overflowed = False
+
+    def watch(self, directories: Iterable[str]) -> None:
+        """Watch the directories not watched yet; fails if the watch limit is reached."""
+        for directory in directories:
+            if directory in self._watched:
+                continue
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                # Directories removed in the meantime are just skipped.
+                if not os.path.isdir(directory):
+                    continue
+                raise OSError(errno, f'inotify_add_watch failed for {directory}')
+            # A directory moved within the tree keeps its watch descriptor.
+            self._watched[directory] = wd
+            self._directories[wd] = directory
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            self._decode(data)
+
+    def _decode(self, data: bytes) -> None:
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                self._overflowed = True
+                continue
+            directory = self._directories.get(wd)
+            if directory is None or mask & _IN_IGNORED:
+                continue
+            if name:
+                self._changed.add(os.path.join(directory, os.fsdecode(name)))
+                continue
+            self._changed.add(directory)
+            if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                self._forget(directory)
+
+    def _forget(self, directory: str) -> None:
+        # The paths of the directory and the ones in it may be reused; watching them again
+        # gives a new watch descriptor, or the same one if the directory was moved there.
+        prefix = os.path.join(directory, '')
+        for watched in [watched for watched in self._watched if watched == directory or watched.startswith(prefix)]:
+            wd = self._watched.pop(watched)
+            if self._directories.get(wd) == watched:
+                del self._directories[wd]
+
+    def wait(self) -> bool:
+        """Block until an event comes in, or the timeout passes; returns whether one did."""
+        readable, _, _ = select.select([self._fd], [], [], self.timeout)
+        if not readable:
+            return False
+        self._drain()
+        time.sleep(_SETTLE_DELAY)
+        self._drain()
+        return True
+
+    def changed_paths(self) -> Optional[Set[str]]:
+        """The files and directories events came in for since the last call.
+
+        None if the kernel's event queue overflowed and events were lost.
+        """
+        changed, self._changed = self._changed, set()
+        if self._overflowed:
+            self._overflowed = False
+            return None
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def _snapshot(files: Iterable[str]) -> Dict[str, Stat]:
+    stats = {}
+    for path in files:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        stats[path] = (stat.st_mtime_ns, stat.st_size)
+    return stats
+
+
+def _format(path: str, report: Report, prefix: str = '') -> str:
+    line, col, msg = report
+    return f'{prefix}{path}:{line}:{col}: {msg}'
+
+
+class Watch:
+    """Reports of the watched files, updated from the files that changed since the last scan."""
+
+    def __init__(self, paths: Sequence[str], exclude: Sequence[str], options: Options, daemon: Optional[Daemon] = None):
+        self.paths = paths
+        self.exclude = exclude
+        self.options = options
+        self.daemon = daemon or Daemon()
+        self.stats: Dict[str, Stat] = {}
+        self.reports: Dict[str, List[Report]] = {}
+
+    def scan(
+            self, changed: Optional[Iterable[str]] = None,
+    ) -> Tuple[List[Tuple[str, Report]], List[Tuple[str, Report]]]:
+        """Re-check new and modified files; return the new and the resolved reports.
+
+        `changed` holds the absolute paths of the files and directories that changed; only
+        the files at or under them are looked at. None looks at all files.
+        """
+        if changed is None:
+            stats = _snapshot(iter_python_files(self.paths, self.exclude))
+            gone = self.stats.keys() - stats.keys()
+        else:
+            stats, gone = self._restat(changed)
+        added: List[Tuple[str, Report]] = []
+        resolved: List[Tuple[str, Report]] = []
+        for path in gone:
+            del self.stats[path]
+            resolved.extend((path, report) for report in self.reports.pop(path, ()))
+        for path, stat in stats.items():
+            if self.stats.get(path) == stat:
+                continue
+            self.stats[path] = stat
+            old = self.reports.get(path, [])
+            new = self.daemon.check_path(path, self.options)
+            self.reports[path] = new
+            added.extend((path, report) for report in new if report not in old)
+            resolved.extend((path, report) for report in old if report not in new)
+        added.sort()
+        resolved.sort()
+        return added, resolved
+
+    def _restat(self, changed: Iterable[str]) -> Tuple[Dict[str, Stat], Set[str]]:
+        """Stats of the files at or under the changed paths, and the known ones gone from there."""
+        changed = set(changed)
+        stats = _snapshot(file for path in changed for file in iter_python_files_at(self.paths, self.exclude, path))
+        prefixes = tuple(os.path.join(path, '') for path in changed)
+        cwd = os.getcwd()
+        gone = set()
+        for path in self.stats.keys() - stats.keys():
+            absolute = os.path.normpath(os.path.join(cwd, path))
+            if absolute in changed or absolute.startswith(prefixes):
+                gone.add(path)
+        return stats, gone
+
+    def directories(self, changed: Optional[Iterable[str]] = None) -> Iterable[str]:
+        """The directories to watch, only the ones at or under the `changed` paths if given."""
+        if changed is None:
+            return iter_directories(self.paths, self.exclude)
+        return [
+            directory for path in changed for directory in iter_directories_at(self.paths, self.exclude, path)
+        ]
+
+
+def _watch_directories(watcher, directories: Iterable[str], poll_interval: float):
+    try:
+        watcher.watch(directories)
+    except OSError:
+        # Out of inotify watches: keep going, polling.
+        watcher.close()
+        watcher = Poller(poll_interval)
+    return watcher
+
+
+def watch(
+        paths: Sequence[str],
+        exclude: Sequence[str],
+        options: Options,
+        out: Optional[TextIO] = None,
+        watcher=None,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        rounds: Optional[int] = None,
+) -> None:
+    """Print the reports of all files, then the new (+) and resolved (-) ones after each change.
+
+    Runs until interrupted, or for `rounds` changes.
+    """
+    out = out or sys.stdout
+    if watcher is None:
+        try:
+            watcher = InotifyWatcher()
+        except OSError:
+            watcher = Poller(poll_interval)
+    state = Watch(paths, exclude, options)
+    try:
+        watcher = _watch_directories(watcher, state.directories(), poll_interval)
+        added, _ = state.scan()
+        for path, report in added:
+            print(_format(path, report), file=out)
+        out.flush()
+        while rounds is None or rounds > 0:
+            if not watcher.wait():
+                continue
+            if rounds is not None:
+                rounds -= 1
+            changed = watcher.changed_paths()
+            watcher = _watch_directories(watcher, state.directories(changed), poll_interval)
+            added, resolved = state.scan(changed)
+            for path, report in resolved:
+                print(_format(path, report, '- '), file=out)
+            for path, report in added:
+                print(_format(path, report, '+ '), file=out)
+            out.flush()
+    finally:
+        watcher.close()
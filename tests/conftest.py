@@ -1,6 +1,41 @@
+import argparse
+import ast
+import textwrap
+
 import pytest
 
+from flake_rba.plugin import ReferencedBeforeAssignmentASTPlugin
+
 
 @pytest.fixture
 def fixture_template():
     return "Hello World!"
+
+
+@pytest.fixture
+def plugin_options():
+    """Return a function that parses plugin options like flake8 does and returns the plugin class.
+
+    Options are class attributes, so the defaults are parsed again afterwards.
+    """
+    def parse(**options):
+        ReferencedBeforeAssignmentASTPlugin.parse_options(argparse.Namespace(**options))
+        return ReferencedBeforeAssignmentASTPlugin
+
+    yield parse
+    ReferencedBeforeAssignmentASTPlugin.parse_options(argparse.Namespace())
+
+
+@pytest.fixture
+def plugin_errors(plugin_options):
+    """Return a function that checks code with the given options, as `line:col code name` strings."""
+    def check(code, filename=None, **options):
+        plugin_cls = plugin_options(**options)
+        code = textwrap.dedent(code)
+        plugin = plugin_cls(ast.parse(code), code.splitlines(True), filename)
+        return [
+            f'{line}:{col} {msg.partition(" ")[0]} {msg.split(chr(39))[1]}'
+            for line, col, msg, _ in plugin.run()
+        ]
+
+    return check
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from flake_rba import aio
+from flake_rba.aio import analyze_paths_async, analyze_source_async
+
+MSG = "F823 variable 'missing' referenced_before_assignment"
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / f'module_{i}.py'
+        path.write_text(f'value = {i}\nprint(value, missing)\n')
+        paths.append(str(path))
+    return paths
+
+
+def test_analyze_source():
+    errors = asyncio.run(analyze_source_async('print(missing)\n'))
+    assert [tuple(error)[:3] for error in errors] == [(1, 6, MSG)]
+
+
+def test_syntax_error():
+    with pytest.raises(SyntaxError):
+        asyncio.run(analyze_source_async('def f(:\n'))
+
+
+def test_limits():
+    source = 'print(missing, missing, missing)\n'
+    assert len(asyncio.run(analyze_source_async(source, max_errors=2))) == 2
+    assert len(asyncio.run(analyze_source_async(source, fail_fast=True))) == 1
+
+
+def test_analyze_paths_in_processes(files):
+    with ProcessPoolExecutor(2) as executor:
+        results = asyncio.run(analyze_paths_async(files, executor=executor))
+    assert [[tuple(error)[:3] for error in errors] for errors in results] == [[(2, 13, MSG)]] * len(files)
+
+
+def test_analyze_paths_exceptions(files, tmp_path):
+    paths = [files[0], str(tmp_path / 'missing.py')]
+    with pytest.raises(OSError):
+        asyncio.run(analyze_paths_async(paths))
+    results = asyncio.run(analyze_paths_async(paths, return_exceptions=True))
+    assert len(results[0]) == 1 and isinstance(results[1], OSError)
+
+
+def test_concurrency_is_bounded(files, monkeypatch):
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def slow(path, options):
+        with lock:
+            running.append(path)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(path)
+        return []
+
+    monkeypatch.setattr(aio, '_analyze_path', slow)
+    with ThreadPoolExecutor(8) as executor:
+        asyncio.run(analyze_paths_async(files, executor=executor, concurrency=2))
+    assert len(peak) == len(files) and max(peak) == 2
+
+
+def test_cancellation_stops_pending_files(files, monkeypatch):
+    started = []
+
+    def slow(path, options):
+        started.append(path)
+        time.sleep(0.05)
+        return []
+
+    async def cancel_soon():
+        task = asyncio.ensure_future(analyze_paths_async(files, concurrency=1))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    monkeypatch.setattr(aio, '_analyze_path', slow)
+    asyncio.run(cancel_soon())
+    time.sleep(0.1)
+    assert started == files[:1]
@@ -0,0 +1,52 @@
+import ast
+
+from flake_rba import check_many, plugin
+from flake_rba.cache import FunctionCache
+from flake_rba.plugin import MSG, ReferencedBeforeAssignmentASTPlugin
+
+
+def test_columns(tmp_path):
+    path = tmp_path / 'module.py'
+    path.write_text('print(missing)\n')
+    results = check_many([
+        ('first.py', 'print(missing, other)\n'),
+        path,
+        ('broken.py', 'def f(:\n'),
+        ('clean.py', 'x = 1\n'),
+    ])
+    assert results.files == ['first.py', str(path), 'broken.py', 'clean.py']
+    assert len(results) == 3
+    assert list(results.file_index) == [0, 0, 1]
+    assert list(results.line) == [1, 1, 1]
+    assert list(results.col) == [6, 15, 6]
+    assert results.names == ['missing', 'other']
+    assert list(results.name_id) == [0, 1, 0]
+    assert [(index, report[2].split(':')[0]) for index, report in results.failures] == [(2, 'E999 SyntaxError')]
+    assert next(results.reports()) == ('first.py', (1, 7, MSG % 'missing'))
+
+
+def test_matches_plugin():
+    sources = [
+        ('a.py', 'def f(a):\n    if a:\n        b = 1\n    return b\n'),
+        ('b.py', 'for i in []:\n    pass\nprint(i, j)\n'),
+    ]
+    results = check_many(sources)
+    expected = [
+        (filename, (error.line_number, error.offset + 1, error.msg))
+        for filename, source in sources
+        for error in ReferencedBeforeAssignmentASTPlugin(ast.parse(source)).run()
+    ]
+    assert list(results.reports()) == expected
+
+
+def test_names_of_replayed_functions():
+    source = 'def f():\n    return missing\n'
+    results = check_many([('a.py', source), ('b.py', source)], function_cache=FunctionCache())
+    assert results.names == ['missing'] and list(results.name_id) == [0, 0]
+
+
+def test_names_come_from_the_visitor(monkeypatch):
+    # Without message templates, formatting or parsing a message would fail.
+    monkeypatch.setattr(plugin, 'MESSAGES', {})
+    results = check_many([('a.py', 'print(missing)\n'), ('b.py', 'print(missing, other)\n')])
+    assert results.names == ['missing', 'other'] and list(results.name_id) == [0, 0, 1]
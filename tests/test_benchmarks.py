@@ -0,0 +1,24 @@
+import ast
+import json
+
+import pytest
+
+from benchmarks.run import compare, main
+from benchmarks.shapes import SHAPES
+
+
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+def test_shapes_are_valid_python(shape):
+    ast.parse(SHAPES[shape](5))
+
+
+def test_report_and_compare(tmp_path, capsys):
+    output = tmp_path / 'report.json'
+    assert main(['--shape', 'elif_chain', '--size', '5', '--repeat', '1', '--output', str(output)]) == 0
+    report = json.loads(output.read_text())
+    [entry] = report['results']
+    assert entry['shape'] == 'elif_chain'
+    assert entry['nodes'] > 0
+    assert entry['nodes_per_second'] > 0
+    assert entry['peak_memory_bytes'] > 0
+    assert len(compare(report['results'], report)) == 1
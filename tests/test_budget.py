@@ -0,0 +1,176 @@
+import ast
+import textwrap
+
+import pytest
+
+from flake_rba import check_many
+from flake_rba.cache import FunctionCache
+from flake_rba.plugin import FAST, ReferencedBeforeAssignmentASTPlugin, ReferencedBeforeAssignmentNodeVisitor
+
+
+CONDITIONAL = """
+def f(a):
+    if a:
+        x = 1
+    print(x)
+    if a:
+        y = 1
+    print(y)
+
+def g(a):
+    if a:
+        z = 1
+    print(z)
+"""
+
+
+def test_precise_by_default(plugin_errors):
+    assert plugin_errors(CONDITIONAL) == ['5:10 F823 x', '8:10 F823 y', '13:10 F823 z']
+
+
+def test_fast_mode(plugin_errors):
+    assert plugin_errors(CONDITIONAL, rba_mode='fast') == []
+    assert plugin_errors('def f():\n    print(x)\n    x = 1\n', rba_mode='fast') == ['2:10 F823 x']
+
+
+def test_branch_budget_per_function(plugin_errors):
+    # f spends its budget on the first if and walks the second one straight; g gets a
+    # budget of its own.
+    assert plugin_errors(CONDITIONAL, rba_branch_budget=1) == [
+        '5:10 F823 x', '2:0 F829 f', '13:10 F823 z',
+    ]
+    assert plugin_errors(CONDITIONAL, rba_branch_budget=2) == [
+        '5:10 F823 x', '8:10 F823 y', '13:10 F823 z',
+    ]
+
+
+def test_nested_functions_restore_the_budget(plugin_errors):
+    code = """
+    def outer(a):
+        def inner(b):
+            if b:
+                y = 1
+            if b:
+                y = 2
+            return y
+        if a:
+            x = 1
+        return x
+    """
+    assert plugin_errors(code, rba_branch_budget=1) == ['3:4 F829 inner', '11:11 F823 x']
+
+
+def test_module_budget(plugin_errors):
+    code = 'if a:\n    x = 1\nif a:\n    y = 1\nprint(x, y)\n'
+    assert plugin_errors(code, rba_branch_budget=1) == [
+        '1:3 F823 a', '1:0 F829 <module>', '3:3 F823 a', '5:6 F823 x',
+    ]
+
+
+def test_nested_statements_spend_the_budget(plugin_errors):
+    lines = ['def f(a):']
+    for depth in range(10):
+        lines.append(f'{"    " * (depth + 1)}if a > {depth}:')
+    lines += [f'{"    " * 11}b = 1', '    return b']
+    code = '\n'.join(lines) + '\n'
+    assert plugin_errors(code) == ['13:11 F823 b']
+    assert plugin_errors(code, rba_branch_budget=3) == ['1:0 F829 f', '13:11 F823 b']
+
+
+def test_budget_of_the_module_is_its_own(plugin_errors):
+    code = """
+    if a:
+        x = 1
+    if a:
+        y = 1
+
+    def f(a):
+        if a:
+            z = 1
+        return z
+    """
+    assert plugin_errors(code, rba_branch_budget=1) == [
+        '2:3 F823 a', '1:0 F829 <module>', '4:3 F823 a', '10:11 F823 z',
+    ]
+
+
+HANDLER_NAME = """
+def f(a):
+    if a:
+        pass
+    try:
+        a()
+    except ValueError as error:
+        print(error)
+"""
+
+
+def test_handler_names_without_branch_tracking(plugin_errors):
+    assert plugin_errors(HANDLER_NAME, rba_mode='fast') == []
+    assert plugin_errors(HANDLER_NAME, rba_branch_budget=1) == ['2:0 F829 f']
+
+
+def visit_with_cache(code, function_cache, **attributes):
+    visitor = ReferencedBeforeAssignmentNodeVisitor(lines=code.splitlines(True), function_cache=function_cache)
+    for name, value in attributes.items():
+        setattr(visitor, name, value)
+    visitor.reset(visitor.lines)
+    visitor.visit(ast.parse(code))
+    return [error.msg.split(' ')[0] for error in visitor.errors]
+
+
+def test_function_cache_keeps_modes_apart():
+    code = textwrap.dedent(CONDITIONAL)
+    function_cache = FunctionCache()
+    assert visit_with_cache(code, function_cache, mode=FAST) == []
+    assert visit_with_cache(code, function_cache) == ['F823', 'F823', 'F823']
+
+
+def test_function_cache_skips_scopes_over_budget():
+    code = textwrap.dedent(CONDITIONAL)
+    function_cache = FunctionCache()
+    assert visit_with_cache(code, function_cache, branch_budget=1) == ['F823', 'F829', 'F823']
+    assert len(function_cache) == 1
+
+
+def test_function_cache_skips_scopes_around_ones_over_budget():
+    code = textwrap.dedent("""
+    def outer(a):
+        def inner(a):
+            if a:
+                b = 1
+            if a:
+                c = 1
+            return b, c
+        return inner
+    """)
+    function_cache = FunctionCache()
+    assert visit_with_cache(code, function_cache, branch_budget=1) == ['F829', 'F823']
+    assert len(function_cache) == 0
+
+
+def test_function_cache_keeps_time_budgets_apart():
+    code = textwrap.dedent(CONDITIONAL)
+    function_cache = FunctionCache()
+    visit_with_cache(code, function_cache)
+    visit_with_cache(code, function_cache, time_budget=60.0)
+    assert len(function_cache) == 4
+
+
+def test_time_budget(plugin_errors):
+    errors = plugin_errors(CONDITIONAL, rba_time_budget=1e-9)
+    assert errors == ['2:0 F829 f', '10:0 F829 g']
+
+
+def test_invalid_options(plugin_options):
+    with pytest.raises(ValueError):
+        plugin_options(rba_mode='slow')
+    with pytest.raises(ValueError):
+        plugin_options(rba_branch_budget=-1)
+
+
+def test_notices_in_batches(monkeypatch):
+    monkeypatch.setattr(ReferencedBeforeAssignmentASTPlugin.visitor_class, 'branch_budget', 1)
+    results = check_many([('module.py', textwrap.dedent(CONDITIONAL))])
+    assert results.names == ['x', 'z']
+    assert [(index, report[2].split(' ')[:2]) for index, report in results.notices] == [(0, ['F829', "'f'"])]
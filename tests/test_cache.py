@@ -0,0 +1,144 @@
+import ast
+import os
+import textwrap
+
+import pytest
+
+from flake_rba import plugin
+from flake_rba.cache import FunctionCache, ResultCache
+
+
+@pytest.fixture
+def cached_plugin(plugin_options, tmp_path):
+    return plugin_options(rba_cache_dir=str(tmp_path / 'cache'), rba_cache_max_size=1)
+
+
+def run_plugin(plugin_cls, code):
+    lines = code.splitlines(True)
+    return [tuple(error)[:3] for error in plugin_cls(ast.parse(code), lines).run()]
+
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = cache.key(['x = y\n'], 'a', 'b')
+    assert cache.get(key) is None
+    cache.put(key, [(1, 4, 'F823 message')])
+    assert cache.get(key) == [(1, 4, 'F823 message')]
+    assert not [name for name in os.listdir(str(tmp_path)) if name.startswith('.tmp-')]
+
+
+def test_key_depends_on_lines_and_parts():
+    key = ResultCache.key(['x = 1\n'], 'a')
+    assert key == ResultCache.key(['x = 1\n'], 'a')
+    assert key != ResultCache.key(['x = 2\n'], 'a')
+    assert key != ResultCache.key(['x = 1\n'], 'b')
+
+
+def test_corrupted_entry_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = cache.key(['x\n'])
+    (tmp_path / (key + '.json')).write_text('[[1, ')
+    assert cache.get(key) is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path), max_size=1000)
+    keys = [cache.key([str(i)]) for i in range(10)]
+    for i, key in enumerate(keys):
+        cache.put(key, [(1, 0, 'F823 ' + 'x' * 200)])
+        path = str(tmp_path / (key + '.json'))
+        os.utime(path, (i, i))
+    cache.evict()
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[-1]) is not None
+    total = sum(entry.stat().st_size for entry in os.scandir(str(tmp_path)))
+    assert total <= 900
+
+
+def test_plugin_reuses_cached_results(cached_plugin, monkeypatch):
+    code = textwrap.dedent("""
+    for value in [1, 2]:
+        pass
+    print(value)
+    """)
+    first = run_plugin(cached_plugin, code)
+    assert first == [(4, 6, "F823 variable 'value' referenced_before_assignment")]
+
+    def fail(self, node):
+        raise AssertionError('file was analyzed again')
+
+    monkeypatch.setattr(plugin.ReferencedBeforeAssignmentNodeVisitor, 'visit', fail)
+    assert run_plugin(cached_plugin, code) == first
+
+
+def test_plugin_cache_key_depends_on_options(cached_plugin, plugin_options, tmp_path):
+    code = 'print(request)\n'
+    assert len(run_plugin(cached_plugin, code)) == 1
+    plugin_options(rba_extra_globals=['request'], rba_cache_dir=str(tmp_path / 'cache'))
+    assert run_plugin(cached_plugin, code) == []
+
+
+def visit_with_cache(code, function_cache):
+    visitor = plugin.ReferencedBeforeAssignmentNodeVisitor(
+        lines=code.splitlines(True), function_cache=function_cache)
+    visitor.visit(ast.parse(code))
+    return [tuple(error.info())[:3] for error in visitor.errors]
+
+
+def test_function_cache_relocates_errors():
+    function_cache = FunctionCache()
+    body = textwrap.dedent("""
+    def fn(values):
+        for value in values:
+            pass
+        return value
+    """)
+    first = visit_with_cache(body, function_cache)
+    assert first == [(5, 11, "F823 variable 'value' referenced_before_assignment")]
+    assert len(function_cache) == 1
+    shifted = visit_with_cache('# moved down\n\n' + body, function_cache)
+    assert shifted == [(7, 11, "F823 variable 'value' referenced_before_assignment")]
+    assert len(function_cache) == 1
+
+
+def test_function_cache_reused_for_unchanged_function(monkeypatch):
+    function_cache = FunctionCache()
+    code = textwrap.dedent("""
+    def first():
+        return missing
+
+    def second():
+        return 1
+    """)
+    visit_with_cache(code, function_cache)
+    changed = code.replace('return 1', 'return 2')
+    walked = []
+    original = plugin.ReferencedBeforeAssignmentNodeVisitor._store_function
+
+    def store(self, node, *args):
+        walked.append(node.name)
+        return original(self, node, *args)
+
+    monkeypatch.setattr(plugin.ReferencedBeforeAssignmentNodeVisitor, '_store_function', store)
+    assert visit_with_cache(changed, function_cache) == [
+        (3, 11, "F823 variable 'missing' referenced_before_assignment"),
+    ]
+    assert walked == ['second']
+
+
+def test_function_cache_key_depends_on_visible_names():
+    function_cache = FunctionCache()
+    code = textwrap.dedent("""
+    def fn():
+        return value
+    """)
+    assert len(visit_with_cache(code, function_cache)) == 1
+    assert visit_with_cache('value = 1\n' + code, function_cache) == []
+
+
+def test_function_cache_lru():
+    function_cache = FunctionCache(max_entries=2)
+    for key in 'abc':
+        function_cache.put(key, ())
+    assert function_cache.get('a') is None
+    assert function_cache.get('c') == ()
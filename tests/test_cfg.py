@@ -0,0 +1,261 @@
+import ast
+import sys
+import textwrap
+
+import pytest
+
+from flake_rba.cfg import build_scopes, solve
+
+
+def test_plugin_runs_selected_engine(plugin_options):
+    code = textwrap.dedent("""
+        def f(a):
+            for item in a:
+                pass
+            return item
+        """)
+    errors = list(plugin_options(rba_engine='cfg')(ast.parse(code)).run())
+    assert [(error.line_number, error.offset) for error in errors] == [(5, 11)]
+    assert errors[0].msg == "F823 variable 'item' referenced_before_assignment"
+
+
+def test_unknown_engine(plugin_options):
+    with pytest.raises(ValueError):
+        plugin_options(rba_engine='fast')
+
+
+def test_if_else(plugin_errors):
+    code = """
+    def f(a):
+        if a:
+            both = one = 1
+        elif a > 1:
+            both = 2
+        else:
+            both = 3
+            return
+        return both, one
+    """
+    assert plugin_errors(code, rba_engine='cfg') == ['10:17 F823 one']
+
+
+def test_load_before_local_binding(plugin_errors):
+    code = """
+    value = 1
+
+    def f():
+        print(value)
+        value = 2
+    """
+    assert plugin_errors(code, rba_engine='cfg') == ['5:10 F823 value']
+
+
+def test_loops(plugin_errors):
+    code = """
+    def f(items):
+        while True:
+            found = 1
+            if items:
+                break
+        for item in items:
+            last = item
+        else:
+            done = 1
+        while items:
+            pending = items.pop()
+        else:
+            empty = 1
+        return found, item, last, done, pending, empty
+    """
+    assert plugin_errors(code, rba_engine='cfg') == ['15:18 F823 item', '15:24 F823 last', '15:36 F823 pending']
+
+
+def test_break_skips_else(plugin_errors):
+    code = """
+    def f(items):
+        for item in items:
+            if item:
+                break
+        else:
+            missing = 1
+        return missing
+    """
+    assert plugin_errors(code, rba_engine='cfg') == ['8:11 F823 missing']
+
+
+def test_try(plugin_errors):
+    code = """
+    def f():
+        try:
+            import json
+            loaded = 1
+        except ImportError as exc:
+            json = None
+            print(exc, loaded)
+        else:
+            extra = 1
+        finally:
+            cleanup = 1
+        return json, exc, extra, cleanup
+    """
+    assert plugin_errors(code, rba_engine='cfg') == ['8:19 F823 loaded', '13:17 F823 exc', '13:22 F823 extra']
+
+
+def test_try_everything_returns(plugin_errors):
+    code = """
+    def f():
+        try:
+            value = compute()
+        except ValueError:
+            raise
+        return value
+    """
+    assert plugin_errors(code, rba_engine='cfg') == ['4:16 F823 compute']
+
+
+def test_unreachable_code_is_not_reported(plugin_errors):
+    code = """
+    def f():
+        return
+        print(missing)
+    """
+    assert plugin_errors(code, rba_engine='cfg') == []
+
+
+def test_del(plugin_errors):
+    code = """
+    def f():
+        value = 1
+        del value
+        return value
+    """
+    assert plugin_errors(code, rba_engine='cfg') == ['5:11 F823 value']
+
+
+def test_with(plugin_errors):
+    code = """
+    def f(path):
+        with open(path) as file, open(path + '.bak'):
+            line = file.readline()
+        return file, line
+    """
+    assert plugin_errors(code, rba_engine='cfg') == []
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason='assignment expressions need Python 3.8')
+def test_walrus(plugin_errors):
+    code = """
+    def f(file):
+        if (line := file.readline()):
+            pass
+        return line
+    """
+    assert plugin_errors(code, rba_engine='cfg') == []
+
+
+def test_comprehensions_have_own_scope(plugin_errors):
+    code = """
+    def f(rows):
+        cells = [cell for row in rows for cell in row if cell]
+        return cells, cell
+    """
+    assert plugin_errors(code, rba_engine='cfg') == ['4:18 F823 cell']
+
+
+def test_nested_scopes_see_enclosing_names(plugin_errors):
+    code = """
+    def outer():
+        def inner():
+            return later, counter, missing
+        later = 1
+        return inner
+
+    def bump():
+        global counter
+        counter = 1
+
+    class Config:
+        name = 'config'
+
+        def method(self):
+            return name, __class__
+    """
+    assert plugin_errors(code, rba_engine='cfg') == ['4:31 F823 missing', '16:15 F823 name']
+
+
+def test_top_level_definitions_are_bound_from_the_start(plugin_errors):
+    code = """
+    try:
+        pass
+    except Error as e:
+        handle(e)
+    print(later)
+
+    def handle(e):
+        pass
+
+    class Error(Exception):
+        pass
+
+    later = 1
+    """
+    assert plugin_errors(code) == ['6:6 F823 later']
+    assert plugin_errors(code, rba_engine='cfg') == ['6:6 F823 later']
+
+
+def test_class_body_falls_back_to_globals(plugin_errors):
+    code = """
+    size = 1
+
+    class Box:
+        size = size
+        print = print
+    """
+    assert plugin_errors(code, rba_engine='cfg') == []
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason='match needs Python 3.10')
+def test_match(plugin_errors):
+    code = """
+    def f(command):
+        match command:
+            case ['go', direction]:
+                pass
+            case {'stop': value, **rest}:
+                direction = value
+            case _:
+                direction = None
+        return direction, rest
+    """
+    assert plugin_errors(code, rba_engine='cfg') == ['10:22 F823 rest']
+
+
+def test_star_import_binds_everything(plugin_errors):
+    code = """
+    from os.path import *
+
+    print(join, anything)
+    """
+    assert plugin_errors(code, rba_engine='cfg') == []
+
+
+def test_long_elif_chain(plugin_errors):
+    branches = ''.join(f'    elif a == {i}:\n        x = {i}\n' for i in range(1, 900))
+    code = f'def f(a):\n    if a == 0:\n        x = 0\n{branches}    return x\n'
+    assert plugin_errors(code, rba_engine='cfg') == ['1802:11 F823 x']
+
+
+def test_solver_reaches_fixpoint_around_loops(plugin_errors):
+    code = textwrap.dedent("""
+        def f(items):
+            while items:
+                if items:
+                    a = 1
+                b = a
+        """)
+    function = build_scopes(ast.parse(code))[1]
+    bits = {'a': 1, 'b': 2, 'items': 4}
+    states = solve(function.blocks, 4, bits)
+    assert states[0] == 4
+    assert all(state is None or state & 4 for state in states)
+    assert plugin_errors(code, rba_engine='cfg') == ['6:12 F823 a']
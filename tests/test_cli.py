@@ -0,0 +1,60 @@
+import textwrap
+
+import pytest
+
+from flake_rba.cli import iter_python_files, main
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / 'pkg').mkdir()
+    (tmp_path / 'pkg' / 'good.py').write_text('value = 1\nprint(value)\n')
+    (tmp_path / 'pkg' / 'bad.py').write_text(textwrap.dedent("""\
+    for value in range(3):
+        pass
+    print(value)
+    """))
+    (tmp_path / 'pkg' / 'broken.py').write_text('def f(:\n')
+    (tmp_path / 'pkg' / 'notes.txt').write_text('print(missing)\n')
+    (tmp_path / 'build').mkdir()
+    (tmp_path / 'build' / 'generated.py').write_text('print(missing)\n')
+    return tmp_path
+
+
+def test_iter_python_files(project):
+    files = list(iter_python_files([str(project)], ['build']))
+    assert [path[len(str(project)) + 1:] for path in files] == ['pkg/bad.py', 'pkg/broken.py', 'pkg/good.py']
+
+
+def test_reports_in_flake8_format(project, capsys):
+    assert main([str(project / 'pkg'), '--jobs', '1']) == 1
+    out = capsys.readouterr().out.splitlines()
+    bad = str(project / 'pkg' / 'bad.py')
+    broken = str(project / 'pkg' / 'broken.py')
+    assert out[0] == f"{bad}:3:7: F823 variable 'value' referenced_before_assignment"
+    assert out[1].startswith(f'{broken}:1:') and ': E999 SyntaxError' in out[1]
+    assert len(out) == 2
+
+
+def test_exclude(project, capsys):
+    assert main([str(project), '--jobs', '1', '--extend-exclude', 'bad.py,broken.py,build']) == 0
+    assert capsys.readouterr().out == ''
+
+
+def test_extra_globals(project, capsys):
+    assert main([str(project / 'build'), '--jobs', '1']) == 1
+    assert main([str(project / 'build'), '--jobs', '1', '--extra-globals', 'missing']) == 0
+
+
+def test_process_pool_matches_in_process(project, capsys):
+    main([str(project), '--jobs', '1'])
+    sequential = capsys.readouterr().out
+    main([str(project), '--jobs', '2'])
+    assert capsys.readouterr().out == sequential
+
+
+def test_fail_fast(project, capsys):
+    (project / 'pkg' / 'also_bad.py').write_text('print(missing, other)\n')
+    assert main([str(project / 'pkg'), '--jobs', '1', '--fail-fast']) == 1
+    out = capsys.readouterr().out.splitlines()
+    assert out == [f"{project / 'pkg' / 'also_bad.py'}:1:7: F823 variable 'missing' referenced_before_assignment"]
@@ -0,0 +1,142 @@
+import os
+import socket
+import stat
+import tempfile
+import threading
+
+import pytest
+
+from flake_rba import daemon
+from flake_rba.cli import main
+from flake_rba.daemon import Daemon, SourceCache, check_remote, request, serve
+
+MSG = "F823 variable 'missing' referenced_before_assignment"
+OPTIONS = (None, (), 0, False)
+
+
+@pytest.fixture
+def module(tmp_path):
+    path = tmp_path / 'module.py'
+    path.write_text('print(missing)\n')
+    return path
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    path = str(tmp_path / 'rba.sock')
+    thread = threading.Thread(target=serve, args=(path,))
+    thread.start()
+    while not os.path.exists(path):
+        thread.join(0.01)
+    yield path
+    request(path, {'command': 'stop'})
+    thread.join()
+    assert not os.path.exists(path)
+
+
+def test_unchanged_files_are_not_parsed_again(module, monkeypatch):
+    server = Daemon()
+    assert server.check_path(str(module), OPTIONS) == [(1, 7, MSG)]
+
+    def fail(*args):
+        raise AssertionError('parsed again')
+
+    monkeypatch.setattr(daemon, '_parse', fail)
+    assert server.check_path(str(module), OPTIONS) == [(1, 7, MSG)]
+    monkeypatch.undo()
+
+    module.write_text('missing = 1\nprint(missing)\n')
+    os.utime(str(module), ns=(0, 0))
+    assert server.check_path(str(module), OPTIONS) == []
+    assert len(server.sources) == 1
+
+
+def test_requests(module, tmp_path):
+    server = Daemon()
+    response = server.handle({
+        'paths': [str(module), str(tmp_path / 'gone.py')],
+        'buffers': [{'filename': 'buffer.py', 'source': 'print(request)\n'}, {'source': 'def f(:\n'}],
+        'options': {'extra_globals': ['request']},
+    })
+    module_reports, gone, buffer, broken = response['results']
+    assert module_reports == [(1, 7, MSG)]
+    assert gone[0][2].startswith('E902 FileNotFoundError')
+    assert buffer == []
+    assert broken[0][2].startswith('E999 SyntaxError')
+    assert server.handle({'options': {'target_version': 'three'}}).keys() == {'error'}
+
+
+def test_source_cache_evicts_least_recently_used():
+    server = Daemon(max_source_bytes=40)
+    sources = [f'print(missing_{i})\n' for i in range(3)]
+    for source in sources:
+        server.check_buffer(source, 'buffer.py', OPTIONS)
+    assert len(server.sources) == 2 and server.sources.size <= 40
+    cache = SourceCache(10)
+    cache.put('large', daemon._parse('x = 1\n' * 10, 'large.py'))
+    assert len(cache) == 1
+
+
+def test_socket_round_trip(socket_path, module):
+    reports = check_remote([str(module)], [('buffer.py', 'print(missing, other)\n')], socket_path)
+    assert reports == [[(1, 7, MSG)], [(1, 7, MSG), (1, 16, MSG.replace('missing', 'other'))]]
+    assert request(socket_path, {'command': 'ping'}) == {'sources': 2, 'functions': 0}
+    with pytest.raises(OSError):
+        serve(socket_path)
+
+
+def test_default_socket_path(monkeypatch, tmp_path):
+    monkeypatch.delenv(daemon.SOCKET_ENV, raising=False)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    assert daemon.default_socket_path() == str(tmp_path / 'flake_rba.sock')
+
+    monkeypatch.delenv('XDG_RUNTIME_DIR')
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    directory = tmp_path / f'flake_rba-{os.getuid()}'
+    assert daemon.default_socket_path() == str(directory / 'flake_rba.sock')
+    assert stat.S_IMODE(directory.stat().st_mode) == 0o700
+    directory.chmod(0o755)
+    with pytest.raises(PermissionError):
+        daemon.default_socket_path()
+
+
+def test_socket_is_private(socket_path, monkeypatch):
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) & 0o077 == 0
+    monkeypatch.setattr(os, 'getuid', lambda: os.stat(socket_path).st_uid + 1)
+    with pytest.raises(PermissionError):
+        request(socket_path, {'command': 'ping'})
+
+
+def test_stalled_client_does_not_block_the_daemon(socket_path, monkeypatch):
+    monkeypatch.setattr(daemon._RequestHandler, 'timeout', 0.1)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stalled:
+        stalled.connect(socket_path)
+        assert request(socket_path, {'command': 'ping'}, timeout=5) == {'sources': 0, 'functions': 0}
+
+
+def test_cli_uses_daemon(socket_path, module, capsys):
+    assert main([str(module), '--daemon', '--socket', socket_path]) == 1
+    assert capsys.readouterr().out == f'{module}:1:7: {MSG}\n'
+    assert request(socket_path, {'command': 'ping'})['sources'] == 1
+
+
+def test_cli_falls_back_without_daemon(module, tmp_path, capsys):
+    assert main([str(module), '--daemon', '--socket', str(tmp_path / 'none.sock'), '--jobs', '1']) == 1
+    assert capsys.readouterr().out == f'{module}:1:7: {MSG}\n'
+
+
+def test_cli_falls_back_on_daemon_errors(module, monkeypatch, capsys):
+    def rejected(*args, **kwargs):
+        raise ValueError('bad request')
+
+    monkeypatch.setattr('flake_rba.cli.check_remote', rejected)
+    assert main([str(module), '--daemon', '--jobs', '1']) == 1
+    assert capsys.readouterr().out == f'{module}:1:7: {MSG}\n'
+
+
+def test_function_results_depend_on_extra_globals(tmp_path):
+    path = tmp_path / 'handler.py'
+    path.write_text('def handle():\n    return request\n')
+    server = Daemon()
+    assert server.check_path(str(path), (None, ('request',), 0, False)) == []
+    assert server.check_path(str(path), OPTIONS) == [(2, 12, MSG.replace('missing', 'request'))]
@@ -0,0 +1,171 @@
+import ast
+import subprocess
+import textwrap
+
+import pytest
+
+from flake_rba.diff import ScopeMap, changed_lines, function_bounds, parse_diff
+from flake_rba.plugin import ReferencedBeforeAssignmentASTPlugin
+
+CODE = textwrap.dedent("""\
+    import os
+
+    def first():
+        print(a)
+
+    class Config:
+        value = b
+
+        def method(self):
+            return c
+
+    def second():
+        def inner():
+            return d
+        return e, inner
+
+    print(f)
+    """)
+
+
+@pytest.fixture
+def diff_plugin(monkeypatch):
+    def check(lines, filename='/repo/module.py'):
+        monkeypatch.setattr(ReferencedBeforeAssignmentASTPlugin, 'changed_lines', {filename: lines})
+        plugin = ReferencedBeforeAssignmentASTPlugin(ast.parse(CODE), CODE.splitlines(True), '/repo/module.py')
+        return [error.msg.split("'")[1] for error in plugin.run()]
+
+    return check
+
+
+def test_parse_diff():
+    diff = textwrap.dedent("""\
+        diff --git a/pkg/mod.py b/pkg/mod.py
+        --- a/pkg/mod.py
+        +++ b/pkg/mod.py
+        @@ -3 +3 @@ def f():
+        @@ -10,2 +10,3 @@
+        @@ -20,4 +22,0 @@
+        diff --git a/old.py b/old.py
+        --- a/old.py
+        +++ /dev/null
+        @@ -1,2 +0,0 @@
+        """)
+    assert parse_diff(diff, '/repo') == {'/repo/pkg/mod.py': {3, 10, 11, 12, 22, 23}}
+
+
+def test_touched_scopes():
+    scopes = ScopeMap(ast.parse(CODE))
+    module = scopes.tree
+    first, config, second = module.body[1:4]
+    method = config.body[1]
+    assert scopes.touched({4}) == {first}
+    assert scopes.touched({3}) == {first, module}
+    assert scopes.touched({10, 17}) == {method, module}
+    assert scopes.containing({14}) == {second, second.body[0]}
+    assert scopes.scope_of(7) is config
+
+
+def test_function_bounds():
+    code = textwrap.dedent("""\
+        def first():
+            return f(
+                a,
+            )
+
+        @decorator
+        def second():
+            try:
+                pass
+            except Error:
+                def inner():
+                    return '''
+                    text'''
+            return 1
+        """)
+    module = ast.parse(code)
+    first, second = module.body
+    inner = second.body[0].handlers[0].body[0]
+    assert function_bounds(module, 14) == {first: 5, second: 14, inner: 13}
+
+
+@pytest.mark.parametrize('lines, expected', [
+    ({4}, ['a']),
+    ({10}, ['c']),
+    ({7}, ['b']),
+    ({14}, ['d']),
+    ({15}, ['e']),
+    ({17}, ['f']),
+    (set(), []),
+    (None, ['a', 'b', 'c', 'd', 'e', 'f']),
+])
+def test_only_touched_scopes_are_reported(diff_plugin, lines, expected):
+    assert diff_plugin(lines) == expected
+
+
+def test_unchanged_files_are_skipped(diff_plugin):
+    assert diff_plugin({4}, filename='/repo/other.py') == []
+
+
+def test_untouched_functions_are_not_visited(diff_plugin, monkeypatch):
+    visited = []
+
+    class RecordingVisitor(ReferencedBeforeAssignmentASTPlugin.visitor_class):
+        def visit_Name(self, node):
+            visited.append(node.id)
+            return super().visit_Name(node)
+
+    monkeypatch.setattr(ReferencedBeforeAssignmentASTPlugin, 'visitor_class', RecordingVisitor)
+    assert diff_plugin({14}) == ['d']
+    assert 'a' not in visited and 'c' not in visited and 'd' in visited
+
+
+def test_function_cache_not_filled_from_partial_visits(diff_plugin, plugin_options):
+    plugin_options(rba_function_cache=True)
+    # `inner` isn't touched, so its body isn't visited and `second` lacks its errors.
+    assert diff_plugin({15}) == ['e']
+    assert diff_plugin(None) == ['a', 'b', 'c', 'd', 'e', 'f']
+
+
+def test_changed_lines_from_git(tmp_path):
+    def git(*args):
+        subprocess.run(['git', *args], cwd=str(tmp_path), check=True, stdout=subprocess.DEVNULL)
+
+    git('init', '-q')
+    git('config', 'user.email', 'test@example.com')
+    git('config', 'user.name', 'test')
+    git('config', 'diff.noprefix', 'true')
+    (tmp_path / 'module.py').write_text(CODE)
+    git('add', 'module.py')
+    git('commit', '-q', '-m', 'initial')
+    (tmp_path / 'module.py').write_text(CODE.replace('return c', 'return c, g'))
+    (tmp_path / 'new.py').write_text('x = 1\n')
+
+    changed = changed_lines('HEAD', str(tmp_path))
+    root = str(tmp_path.resolve())
+    assert changed == {f'{root}/module.py': {10}, f'{root}/new.py': None}
+    with pytest.raises(ValueError):
+        changed_lines('no-such-revision', str(tmp_path))
+
+
+def test_diff_option(plugin_options, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError):
+        plugin_options(rba_diff='HEAD')
+    assert plugin_options().changed_lines is None
+
+
+def test_symlinked_checkout(monkeypatch, tmp_path):
+    checkout = tmp_path / 'checkout'
+    checkout.mkdir()
+    subprocess.run(['git', 'init', '-q'], cwd=str(checkout), check=True)
+    (checkout / 'module.py').write_text(CODE)
+    link = tmp_path / 'link'
+    link.symlink_to(checkout, target_is_directory=True)
+
+    # Compared to git's empty tree, as there are no commits; the untracked file counts
+    # as changed all over.
+    changed = changed_lines('4b825dc642cb6eb9a060e54bf8d69288fbee4904', str(link))
+    monkeypatch.setattr(ReferencedBeforeAssignmentASTPlugin, 'changed_lines', changed)
+    plugin = ReferencedBeforeAssignmentASTPlugin(ast.parse(CODE), CODE.splitlines(True), str(link / 'module.py'))
+    assert [error.msg.split("'")[1] for error in plugin.run()] == ['a', 'b', 'c', 'd', 'e', 'f']
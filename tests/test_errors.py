@@ -0,0 +1,39 @@
+import ast
+
+from flake_rba import plugin
+from flake_rba.plugin import (
+    BUDGET_CODE, BUDGET_MSG, CODE, MSG, ErrorRecord, Flake8ASTErrorInfo, ReferencedBeforeAssignmentASTPlugin,
+)
+
+
+def test_records_for_names():
+    error = Flake8ASTErrorInfo.for_name(3, 6, 'value')
+    assert error.msg == MSG % 'value'
+    assert ErrorRecord(3, 6, CODE, 'value').info() == error
+    notice = ErrorRecord(1, 0, BUDGET_CODE, 'f', ast.FunctionDef)
+    assert notice.msg == BUDGET_MSG % 'f'
+    assert notice.info() == (1, 0, BUDGET_MSG % 'f', ast.FunctionDef)
+
+
+def test_visitor_formats_no_messages(monkeypatch):
+    monkeypatch.setattr(plugin, 'MESSAGES', {})
+    visitor = plugin.ReferencedBeforeAssignmentNodeVisitor()
+    visitor.visit(ast.parse('print(missing)\n'))
+    assert [(error.line_number, error.offset, error.code, error.name) for error in visitor.errors] == [
+        (1, 6, CODE, 'missing'),
+    ]
+
+
+def test_is_the_flake8_tuple():
+    error = Flake8ASTErrorInfo.for_name(3, 6, 'value')
+    line, col, msg, cls = error
+    assert isinstance(error, tuple)
+    assert (line, col, msg, cls) == (3, 6, MSG % 'value', ast.Name)
+    assert len(error) == 4 and error[0] == 3 and error[:2] == (3, 6)
+    assert error == Flake8ASTErrorInfo(3, 6, MSG % 'value', ast.Name)
+    assert error._replace(offset=7)._asdict()['offset'] == 7
+
+
+def test_plugin_yields_records():
+    plugin = ReferencedBeforeAssignmentASTPlugin(ast.parse('print(missing)\n'))
+    assert [tuple(error) for error in plugin.run()] == [(1, 6, MSG % 'missing', ast.Name)]
@@ -0,0 +1,138 @@
+import ast
+import os
+import textwrap
+
+import pytest
+
+from flake_rba import exports
+from flake_rba.exports import ExportIndex, ModuleExports
+
+
+@pytest.fixture
+def project(tmp_path):
+    package = tmp_path / 'pkg'
+    package.mkdir()
+    (package / '__init__.py').write_text('from .shapes import *\nVERSION = 1\n')
+    (package / 'shapes.py').write_text(textwrap.dedent("""\
+        import math
+        from .base import *
+
+        __all__ = ['Circle']
+        __all__ += ['area']
+
+        class Circle:
+            pass
+
+        def area(shape):
+            return math.pi
+        """))
+    (package / 'base.py').write_text('from pkg.missing import *\nclass Shape:\n    pass\n_private = 1\n')
+    return tmp_path
+
+
+def exports_of(code):
+    result = ModuleExports.from_tree(ast.parse(textwrap.dedent(code)), 'pkg.module')
+    return result.names, result.has_all, result.star_imports
+
+
+def test_top_level_names():
+    code = """
+    import os.path, json as _json
+    from collections import OrderedDict
+    from .sibling import *
+    a, (b, c) = 1, (2, 3)
+    if a:
+        def f(): pass
+    try:
+        import yaml
+    except ImportError:
+        yaml = None
+    with open('x') as handle:
+        pass
+    _hidden = 1
+
+    def g():
+        local = 1
+    """
+    names, has_all, stars = exports_of(code)
+    assert names == ['OrderedDict', 'a', 'b', 'c', 'f', 'g', 'handle', 'os', 'yaml']
+    assert not has_all and stars == ['pkg.sibling']
+
+
+def test_literal_all():
+    assert exports_of("__all__ = ['a']\n__all__ += ('b',)\n__all__.append('c')\n__all__.extend(['d'])\n")[:2] == (
+        ['a', 'b', 'c', 'd'], True)
+    assert exports_of("__all__ = [name for name in dir()]\nvalue = 1\n")[:2] == (['value'], False)
+
+
+def test_star_imports_resolve(project):
+    index = ExportIndex(None, [str(project)])
+    index.update()
+    assert index.star_import('pkg.shapes', 0, None) == {'Circle', 'area'}
+    assert index.star_import('pkg', 0, None) == {'Circle', 'area', 'VERSION'}
+    assert index.star_import('base', 1, 'pkg.shapes') == {'Shape'}
+    assert index.star_import('shapes', 1, 'pkg') == {'Circle', 'area'}
+    assert index.star_import('os.path', 0, None) is None
+
+
+def test_index_is_updated_incrementally(project, tmp_path):
+    path = str(tmp_path / 'cache' / 'exports.json')
+    index = ExportIndex(path, [str(project)])
+    assert index.update() == 3
+    index.save()
+    index = ExportIndex(path, [str(project)])
+    assert index.update() == 0
+
+    base = project / 'pkg' / 'base.py'
+    os.utime(str(base), ns=(0, 0))
+    index = ExportIndex(path, [str(project)])
+    assert index.update() == 0
+    base.write_text('class Shape:\n    pass\nclass Square(Shape):\n    pass\n')
+    assert index.update() == 1
+    assert index.star_import('pkg.base', 0, None) == {'Shape', 'Square'}
+
+
+def test_digest_for_star_imports(project):
+    index = ExportIndex(None, [str(project)])
+    index.update()
+    tree = ast.parse('import os\nif os:\n    from .base import *\n')
+    digest = index.digest_for(tree, 'pkg.module')
+    assert index.digest_for(tree, 'pkg.other') != digest
+    assert index.digest_for(ast.parse('import os\n'), 'pkg.module') != digest
+
+    (project / 'pkg' / 'extra.py').write_text('EXTRA = 1\n')
+    index.update()
+    assert index.digest_for(tree, 'pkg.module') == digest
+    (project / 'pkg' / 'base.py').write_text('class Shape:\n    pass\nclass Square(Shape):\n    pass\n')
+    index.update()
+    assert index.digest_for(tree, 'pkg.module') != digest
+
+
+def test_plugin_binds_star_imports(project, tmp_path, plugin_errors):
+    code = 'from .shapes import *\nfrom os.path import *\nprint(Circle, area, Shape, join)\n'
+    errors = plugin_errors(
+        code, str(project / 'pkg' / 'module.py'),
+        rba_export_index=str(tmp_path / 'exports.json'), rba_source_roots=[str(project)],
+    )
+    assert errors == ['3:20 F823 Shape', '3:27 F823 join']
+    assert os.path.exists(str(tmp_path / 'exports.json'))
+
+
+def test_cached_results_of_same_source_in_other_packages(tmp_path, plugin_errors):
+    for package, defs in (('a', 'foo = 1\n'), ('b', 'bar = 1\n')):
+        (tmp_path / package).mkdir()
+        (tmp_path / package / '__init__.py').write_text('')
+        (tmp_path / package / 'defs.py').write_text(defs)
+    code = 'from .defs import *\nprint(foo)\n'
+    options = dict(
+        rba_export_index=str(tmp_path / 'exports.json'),
+        rba_source_roots=[str(tmp_path)],
+        rba_cache_dir=str(tmp_path / 'cache'),
+    )
+    for _ in range(2):
+        assert plugin_errors(code, str(tmp_path / 'a' / 'use.py'), **options) == []
+        assert plugin_errors(code, str(tmp_path / 'b' / 'use.py'), **options) == ['2:6 F823 foo']
+
+
+def test_relative_import_beyond_top_level():
+    assert exports._absolute_module('x', 3, 'pkg.module', False) is None
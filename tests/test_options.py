@@ -0,0 +1,50 @@
+import pytest
+
+from flake_rba.builtin_names import builtins_for, known_names, parse_version
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('3.8', (3, 8)),
+    ('py310', (3, 10)),
+    (' 3.11 ', (3, 11)),
+])
+def test_parse_version(value, expected):
+    assert parse_version(value) == expected
+
+
+def test_parse_version_invalid():
+    with pytest.raises(ValueError):
+        parse_version('three')
+
+
+def test_builtins_depend_on_target_version():
+    assert 'breakpoint' not in builtins_for((3, 6))
+    assert 'breakpoint' in builtins_for((3, 7))
+    assert 'ExceptionGroup' not in builtins_for((3, 10))
+    assert 'ExceptionGroup' in builtins_for((3, 11))
+
+
+def test_builtins_clamped_to_known_versions():
+    assert builtins_for((2, 7)) is builtins_for((3, 6))
+    assert builtins_for((3, 99)) is builtins_for((3, 13))
+
+
+def test_known_names_extra():
+    names = known_names((3, 8), ['request', 'settings'])
+    assert {'request', 'settings', 'print', '__file__'} <= names
+
+
+def test_target_version_option(plugin_errors):
+    code = """
+    aiter([])
+    """
+    assert plugin_errors(code, rba_target_version='3.9') == ['2:0 F823 aiter']
+    assert plugin_errors(code, rba_target_version='3.10') == []
+
+
+def test_extra_globals_option(plugin_errors):
+    code = """
+    print(request, settings)
+    """
+    assert plugin_errors(code) == ['2:6 F823 request', '2:15 F823 settings']
+    assert plugin_errors(code, rba_extra_globals='request, settings') == []
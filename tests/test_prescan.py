@@ -0,0 +1,135 @@
+import ast
+import textwrap
+
+import pytest
+
+from flake_rba.plugin import ReferencedBeforeAssignmentNodeVisitor
+from flake_rba.prescan import is_straight_line
+
+
+def first_function(code):
+    return ast.parse(textwrap.dedent(code)).body[0]
+
+
+@pytest.mark.parametrize('code', [
+    """
+    def f(a):
+        b = a
+        for item in a:
+            c = item
+        if b:
+            print(b, c)
+        else:
+            print(missing)
+        return b
+    """,
+    """
+    def f(a):
+        try:
+            print(a)
+        except ValueError:
+            raise
+        finally:
+            print(a)
+    """,
+    """
+    def f(a):
+        try:
+            try:
+                pass
+            finally:
+                pass
+        except ValueError:
+            print(a)
+    """,
+    """
+    def f(a):
+        if a:
+            return
+        with open(a) as file:
+            data = file.read()
+        return data
+    """,
+])
+def test_straight_line(code):
+    assert is_straight_line(first_function(code))
+
+
+@pytest.mark.parametrize('code', [
+    """
+    def f(a):
+        if a:
+            b = 1
+        return b
+    """,
+    """
+    def f(a):
+        try:
+            import json
+        except ImportError:
+            pass
+    """,
+    """
+    def f(a):
+        if a:
+            return
+            print(a)
+    """,
+    """
+    def f(a):
+        if a:
+            if a > 1:
+                return
+            else:
+                raise ValueError
+            print(a)
+    """,
+    """
+    def f(a):
+        try:
+            pass
+        except ValueError as error:
+            print(error)
+    """,
+    """
+    def f(a):
+        while a:
+            if a:
+                def g():
+                    pass
+    """,
+])
+def test_needs_branch_merging(code):
+    assert not is_straight_line(first_function(code))
+
+
+def test_long_elif_chain():
+    branches = ''.join(f'    elif a == {i}:\n        return {i}\n' for i in range(1, 900))
+    code = f'def f(a):\n    if a == 0:\n        return 0\n{branches}    else:\n        raise ValueError\n'
+    assert is_straight_line(first_function(code))
+
+
+@pytest.mark.parametrize('straight_line', [True, False])
+def test_fast_path_reports_the_same(monkeypatch, straight_line):
+    code = textwrap.dedent("""
+        def f(a):
+            if a:
+                print(missing)
+            elif a > 1:
+                return other
+            try:
+                print(a, unknown)
+            except ValueError:
+                print(handled)
+            else:
+                print(orelse)
+            finally:
+                print(final)
+        """)
+    assert is_straight_line(first_function(code))
+    monkeypatch.setattr(ReferencedBeforeAssignmentNodeVisitor, '_takes_fast_path', lambda self, node: straight_line)
+    visitor = ReferencedBeforeAssignmentNodeVisitor()
+    visitor.visit(ast.parse(code))
+    assert [(error.line_number, error.offset) for error in visitor.errors] == [
+        (4, 14), (6, 15), (8, 17), (10, 14), (12, 14), (14, 14),
+    ]
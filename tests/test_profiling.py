@@ -0,0 +1,121 @@
+import ast
+import json
+import textwrap
+
+import pytest
+
+from flake_rba.plugin import ReferencedBeforeAssignmentNodeVisitor
+from flake_rba.profiling import PROFILE_ENV, Profile, Profiler, profiled
+from flake_rba.traversal import handler_table
+
+CODE = textwrap.dedent("""
+    import os
+
+    def f(a, b):
+        if a:
+            c = b
+        else:
+            c = os
+        return c + d
+    """)
+
+
+@pytest.fixture
+def profiled_plugin(plugin_options, tmp_path, monkeypatch):
+    monkeypatch.delenv(PROFILE_ENV, raising=False)
+    target = tmp_path / 'profile.jsonl'
+    return plugin_options(rba_profile=str(target), rba_profile_per_file=True), target
+
+
+def profile_code(code):
+    visitor = profiled(ReferencedBeforeAssignmentNodeVisitor)()
+    visitor.visit(ast.parse(code))
+    return visitor
+
+
+def test_disabled_by_default(plugin_options, monkeypatch):
+    monkeypatch.delenv(PROFILE_ENV, raising=False)
+    plugin_cls = plugin_options()
+    assert plugin_cls.visitor_class is ReferencedBeforeAssignmentNodeVisitor
+    assert plugin_cls.profiler is None
+
+
+def test_profiled_class_has_its_own_handlers():
+    cls = profiled(ReferencedBeforeAssignmentNodeVisitor)
+    assert cls is profiled(ReferencedBeforeAssignmentNodeVisitor)
+    assert handler_table(cls)[ast.If] is not handler_table(ReferencedBeforeAssignmentNodeVisitor)[ast.If]
+    assert handler_table(ReferencedBeforeAssignmentNodeVisitor)[ast.BinOp] is None
+
+
+def test_counts_handlers_and_symbol_table():
+    visitor = profile_code(CODE)
+    profile = visitor.profile
+    assert {error.line_number for error in visitor.errors} == {9}
+    assert profile.calls['visit_If'] == 1
+    assert profile.calls['_visit_if_helper'] == 1
+    assert profile.calls['visit_FunctionDef'] == 1
+    assert profile.calls['visit_Name'] == 5
+    assert profile.calls['generic_visit'] > 0
+    assert profile.seconds['visit_FunctionDef'] >= profile.seconds['_visit_if_helper']
+    # module, function and if frames
+    assert profile.max_depth == 3
+    assert profile.max_frame_size == 3
+    assert profile.probes > 0
+
+
+def test_same_errors_as_plain_visitor():
+    plain = ReferencedBeforeAssignmentNodeVisitor()
+    plain.visit(ast.parse(CODE))
+    assert [error.info() for error in profile_code(CODE).errors] == [error.info() for error in plain.errors]
+
+
+def test_merge():
+    total = Profile()
+    total.merge(profile_code(CODE).profile)
+    total.merge(profile_code(CODE).profile)
+    assert total.files == 2
+    assert total.calls['visit_If'] == 2
+    assert 'visit_If' in total.format()
+
+
+def test_aggregated_report(tmp_path):
+    profiler = Profiler(str(tmp_path / 'profile.json'))
+    profiler.record(profile_code(CODE).profile)
+    profiler.dump()
+    report = json.loads((tmp_path / 'profile.json').read_text())
+    assert report['files'] == 1
+    assert report['handlers']['visit_If']['calls'] == 1
+
+
+def test_plugin_writes_per_file_report(profiled_plugin):
+    plugin_cls, target = profiled_plugin
+    for filename in ('a.py', 'b.py'):
+        errors = list(plugin_cls(ast.parse(CODE), CODE.splitlines(True), filename).run())
+        assert [error.line_number for error in errors] == [9]
+    entries = [json.loads(line) for line in target.read_text().splitlines()]
+    assert [entry['filename'] for entry in entries] == ['a.py', 'b.py']
+    assert entries[0]['handlers']['visit_FunctionDef']['calls'] == 1
+
+
+def test_enabled_by_environment(plugin_options, tmp_path, monkeypatch):
+    monkeypatch.setenv(PROFILE_ENV, str(tmp_path / 'profile.json'))
+    assert plugin_options().visitor_class is profiled(ReferencedBeforeAssignmentNodeVisitor)
+
+
+def test_counts_fast_path_functions():
+    code = textwrap.dedent("""
+        def straight(a):
+            b = a
+            if b:
+                print(b)
+            return b
+
+        def branchy(a):
+            if a:
+                b = 1
+            return b
+        """)
+    profile = profile_code(code).profile
+    assert profile.calls['visit_FunctionDef'] == 2
+    assert profile.counters['fast path functions'] == 1
+    assert 'fast path functions: 1' in profile.format()
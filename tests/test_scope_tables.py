@@ -0,0 +1,95 @@
+import ast
+import textwrap
+
+from flake_rba.scope_tables import static_names
+
+
+def test_static_names():
+    code = textwrap.dedent("""
+        import os
+
+        @decorator
+        def outer(a):
+            global counter
+            counter = 1
+
+            def inner():
+                nonlocal a
+                return a, os, later, missing, helper
+
+            helper = lambda value: value + a
+            return [item for item in a]
+
+        later = 2
+        """)
+    outer = ast.parse(code).body[1]
+    inner, helper = outer.body[2:4]
+    scopes = static_names(code)
+    # Before Python 3.8 a decorated function starts at its first decorator.
+    assert scopes[outer.lineno, 'outer'] == [{'counter': True}]
+    assert scopes[inner.lineno, 'inner'] == [{'a': True, 'os': True, 'later': True, 'missing': False, 'helper': True}]
+    assert scopes[helper.lineno, 'lambda'] == [{'a': True}]
+    assert not [key for key in scopes if key[1] == 'listcomp']
+
+
+def test_star_import_binds_globals():
+    scopes = static_names('from os.path import *\n\ndef f():\n    return join\n')
+    assert scopes[3, 'f'] == [{'join': True}]
+
+
+def test_globals_bound_later_in_the_module(plugin_errors):
+    code = """
+    def f():
+        return CONSTANT, missing
+
+    CONSTANT = 1
+    """
+    assert plugin_errors(code, rba_symtable=True) == ['3:21 F823 missing']
+
+
+def test_nested_lambdas_on_one_line(plugin_errors):
+    code = """
+    g = [lambda: [lambda: v], lambda: 0]
+    v = 1
+    """
+    assert plugin_errors(code, rba_symtable=True) == []
+
+
+def test_global_declaration(plugin_errors):
+    code = """
+    counter = 0
+
+    def bump():
+        global counter
+        counter += 1
+        return counter
+    """
+    assert plugin_errors(code, rba_symtable=True) == []
+
+
+def test_locals_are_still_tracked(plugin_errors):
+    code = """
+    def f(a):
+        if a:
+            value = 1
+        result = [value for _ in a]
+        return value
+    """
+    assert plugin_errors(code, rba_symtable=True) == ['5:14 F823 value', '6:11 F823 value']
+
+
+def test_class_body_in_function(plugin_errors):
+    code = """
+    def f():
+        class Local:
+            attribute = 1
+            copy = attribute
+        return Local, attribute
+    """
+    assert plugin_errors(code, rba_symtable=True) == ['6:18 F823 attribute']
+
+
+def test_disabled_without_lines(plugin_options):
+    code = 'def f():\n    return later\n\nlater = 1\n'
+    errors = list(plugin_options(rba_symtable=True)(ast.parse(code)).run())
+    assert [(error.line_number, error.offset) for error in errors] == [(2, 11)]
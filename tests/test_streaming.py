@@ -0,0 +1,70 @@
+import ast
+
+import pytest
+
+from flake_rba import plugin
+from flake_rba.api import Checker
+
+CODE = ''.join(f'print(missing_{i})\n' for i in range(10))
+
+
+def names_in(errors):
+    return [error.msg.split("'")[1] for error in errors]
+
+
+def test_errors_are_yielded_during_the_walk():
+    visitor = plugin.ReferencedBeforeAssignmentNodeVisitor()
+    errors = visitor.iter_visit(ast.parse(CODE))
+    assert names_in([next(errors)]) == ['missing_0']
+    assert len(visitor.errors) == 1
+    assert names_in(errors) == [f'missing_{i}' for i in range(1, 10)]
+
+
+def test_max_errors_per_file(plugin_options):
+    plugin_cls = plugin_options(rba_max_errors_per_file=3)
+    assert names_in(plugin_cls(ast.parse(CODE)).run()) == ['missing_0', 'missing_1', 'missing_2']
+
+
+def test_fail_fast_stops_the_walk(plugin_options, monkeypatch):
+    visited = []
+
+    class RecordingVisitor(plugin.ReferencedBeforeAssignmentNodeVisitor):
+        def visit_Name(self, node):
+            visited.append(node.id)
+            return super().visit_Name(node)
+
+    plugin_cls = plugin_options(rba_fail_fast=True)
+    monkeypatch.setattr(plugin_cls, 'visitor_class', RecordingVisitor)
+    assert names_in(plugin_cls(ast.parse(CODE)).run()) == ['missing_0']
+    assert visited == ['print', 'missing_0']
+
+
+def test_capped_runs_cache_complete_results(plugin_options, tmp_path):
+    lines = CODE.splitlines(True)
+    cache_dir = str(tmp_path / 'cache')
+    plugin_cls = plugin_options(rba_cache_dir=cache_dir, rba_max_errors_per_file=2)
+    assert len(list(plugin_cls(ast.parse(CODE), lines).run())) == 2
+    plugin_cls = plugin_options(rba_cache_dir=cache_dir)
+    key = plugin_cls.cache.key(lines, plugin_cls.name, plugin_cls.version, plugin_cls.options_key())
+    assert len(plugin_cls.cache.get(key)) == 10
+
+
+def test_fail_fast_runs_are_not_cached(plugin_options, tmp_path):
+    lines = CODE.splitlines(True)
+    plugin_cls = plugin_options(rba_cache_dir=str(tmp_path / 'cache'), rba_fail_fast=True)
+    assert len(list(plugin_cls(ast.parse(CODE), lines).run())) == 1
+    key = plugin_cls.cache.key(lines, plugin_cls.name, plugin_cls.version, plugin_cls.options_key())
+    assert plugin_cls.cache.get(key) is None
+
+
+def test_negative_limit(plugin_options):
+    with pytest.raises(ValueError):
+        plugin_options(rba_max_errors_per_file=-1)
+
+
+def test_checker_limits():
+    assert len(Checker(max_errors=4).check_source(CODE)) == 4
+    checker = Checker(fail_fast=True)
+    assert names_in(checker.check_source(CODE)) == ['missing_0']
+    # The visitor is reset after a walk that was cut short.
+    assert names_in(checker.check_source('print(other)\n')) == ['other']
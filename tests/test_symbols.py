@@ -0,0 +1,74 @@
+from flake_rba.symbols import SymbolTable
+
+
+def test_lookup_through_all_frames():
+    table = SymbolTable()
+    table.push()
+    table.bind('outer')
+    table.push()
+    table.bind('inner')
+    assert 'outer' in table
+    assert 'inner' in table
+    assert 'missing' not in table
+
+
+def test_rebinding_is_deduplicated():
+    table = SymbolTable()
+    table.push()
+    for _ in range(3):
+        table.bind('value')
+    assert table.names_in(table.top()) == ['value']
+    table.pop()
+    assert 'value' not in table
+
+
+def test_pop_keeps_names_bound_in_outer_frames():
+    table = SymbolTable()
+    table.push()
+    table.bind('value')
+    table.push()
+    table.bind('value')
+    assert table.names_in(table.pop()) == ['value']
+    assert 'value' in table
+    assert len(table) == 1
+
+
+def test_clear_returns_innermost_frame():
+    table = SymbolTable()
+    table.push()
+    table.bind_all(['a', 'b'])
+    assert table.names_in(table.clear()) == ['a', 'b']
+    assert 'a' not in table
+    assert table.top() == 0
+    assert len(table) == 1
+
+
+def test_branch_snapshots_merge_with_and():
+    table = SymbolTable()
+    table.push()
+    table.push()
+    table.bind_all(['a', 'b', 'c'])
+    body = table.clear()
+    table.bind_all(['c', 'a', 'd'])
+    orelse = table.clear()
+    table.pop()
+    table.bind_mask(body & orelse)
+    assert sorted(table.names_in(table.top())) == ['a', 'c']
+    assert 'b' not in table and 'd' not in table
+    # Binding again doesn't count names twice.
+    table.bind_mask(body)
+    table.pop()
+    assert not list(table.names())
+
+
+def test_scope_releases_its_ids():
+    table = SymbolTable()
+    table.push()
+    table.bind('module_name')
+    table.push(scope=True)
+    table.bind_all('local_%d' % i for i in range(100))
+    assert table.top().bit_length() == 101
+    table.pop()
+    table.bind('late')
+    assert table.top() == 0b11
+    assert table.names_in(table.top()) == ['module_name', 'late']
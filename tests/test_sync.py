@@ -285,6 +285,34 @@ def test_case_if_multiple_elif_set_ok():
     assert actual == expected
 
 
+def test_case_elif_chain_jumps_out():
+    code = textwrap.dedent("""
+    def foo(cond):
+        if cond == 1:
+            value = 1
+        elif cond == 2:
+            return
+        elif cond == 3:
+            value = 3
+            other = 3
+        else:
+            raise ValueError(cond)
+        return value, other
+    """)
+    actual = get_errors(code)
+    expected = {"12:18 F823"}
+    assert actual == expected
+
+
+def test_case_long_elif_chain():
+    branches = ''.join(f'    elif cond == {i}:\n        value = {i}\n        name_{i} = {i}\n' for i in range(1, 900))
+    code = f'def foo(cond):\n    if cond == 0:\n        value = 0\n{branches}    else:\n        value = -1\n' \
+        f'    return value, name_1\n'
+    actual = get_errors(code)
+    expected = {"2703:18 F823"}
+    assert actual == expected
+
+
 def test_simple_if_else_set_ok():
     code = textwrap.dedent("""
     def foo(cond):
@@ -0,0 +1,64 @@
+import ast
+
+import pytest
+
+from flake_rba.plugin import ReferencedBeforeAssignmentASTPlugin, ReferencedBeforeAssignmentNodeVisitor
+from flake_rba.traversal import CHILD_FIELDS, handler_table
+
+
+def test_child_fields_skip_scalars_and_contexts():
+    assert CHILD_FIELDS[ast.Name] == ()
+    assert CHILD_FIELDS[ast.Constant] == ()
+    assert CHILD_FIELDS[ast.Attribute] == ('value',)
+    assert CHILD_FIELDS[ast.BinOp] == ('left', 'right')
+    assert CHILD_FIELDS[ast.Global] == ()
+
+
+def test_handler_table_is_shared_per_class():
+    first = ReferencedBeforeAssignmentNodeVisitor()
+    second = ReferencedBeforeAssignmentNodeVisitor()
+    table = handler_table(ReferencedBeforeAssignmentNodeVisitor)
+    assert first._handlers is second._handlers is table
+    assert table[ast.If] is ReferencedBeforeAssignmentNodeVisitor.visit_If
+    assert table[ast.BinOp] is None
+
+
+def test_handler_table_of_subclass():
+    class Visitor(ReferencedBeforeAssignmentNodeVisitor):
+        def visit_BinOp(self, node):
+            pass
+
+    table = handler_table(Visitor)
+    assert table[ast.BinOp] is Visitor.visit_BinOp
+    assert handler_table(ReferencedBeforeAssignmentNodeVisitor)[ast.BinOp] is None
+
+
+def get_errors(s: str):
+    tree = ast.parse(s)
+    plugin = ReferencedBeforeAssignmentASTPlugin(tree)
+    return {f'{line}:{col} {msg.partition(" ")[0]}' for line, col, msg, _ in plugin.run()}
+
+
+def test_long_binop_chain_does_not_recurse():
+    code = 'total = ' + ' + '.join(['a'] * 2000)
+    assert len(list(ReferencedBeforeAssignmentASTPlugin(ast.parse(code)).run())) == 2000
+
+
+def test_long_elif_chain_does_not_recurse():
+    lines = ['def f(value):', '    if value == 0:', '        result = 0']
+    for i in range(1, 900):
+        lines += [f'    elif value == {i}:', f'        result = {i}']
+    lines += ['    return result']
+    assert get_errors('\n'.join(lines)) == {'1802:11 F823'}
+
+
+def test_exception_is_thrown_into_enclosing_handler():
+    class Visitor(ReferencedBeforeAssignmentNodeVisitor):
+        def visit_Name(self, node):
+            raise KeyError(node.id)
+
+    visitor = Visitor()
+    with pytest.raises(KeyError):
+        visitor.visit(ast.parse('def f():\n    return value\n'))
+    # Both visit_FunctionDef and visit_Module popped their frames on the way out.
+    assert len(visitor.scopes) == 0
@@ -0,0 +1,121 @@
+import ast
+import textwrap
+
+import pytest
+
+from benchmarks.shapes import DEFAULT_SIZES, SHAPES, nested_ifexp, nested_try
+from flake_rba.plugin import ReferencedBeforeAssignmentASTPlugin, ReferencedBeforeAssignmentNodeVisitor
+from flake_rba.profiling import counting
+
+SAMPLES = [
+    """
+    def f(a):
+        try:
+            try:
+                b = a
+            except ValueError:
+                try:
+                    b = 1
+                finally:
+                    print(b)
+            else:
+                try:
+                    c = b
+                except KeyError:
+                    return
+        except OSError as error:
+            try:
+                if a:
+                    b = error
+            except TypeError:
+                raise
+        else:
+            try:
+                pass
+            finally:
+                print(b, c)
+        finally:
+            try:
+                print(a)
+            except ValueError:
+                pass
+        return b
+    """,
+    """
+    def f(a):
+        if a:
+            try:
+                b = 1
+            except ValueError:
+                if a > 1:
+                    return
+                elif a < 0:
+                    b = 2
+                else:
+                    raise
+        elif a is None:
+            b = 3
+        for line in a:
+            c = len(line)
+        return b + c
+    """,
+    nested_try(12),
+]
+
+
+def entered(code: str, visitor_cls: type = ReferencedBeforeAssignmentNodeVisitor):
+    tree = ast.parse(textwrap.dedent(code))
+    visitor = counting(visitor_cls)()
+    visitor.visit(tree)
+    return tree, visitor.visits
+
+
+@pytest.mark.parametrize('straight_line', [True, False])
+@pytest.mark.parametrize('code', SAMPLES, ids=['try_clauses', 'if_in_try', 'nested_try'])
+def test_nodes_are_entered_once(monkeypatch, code, straight_line):
+    monkeypatch.setattr(ReferencedBeforeAssignmentNodeVisitor, '_takes_fast_path', lambda self, node: straight_line)
+    tree, visits = entered(code)
+    assert [node for node, count in visits.items() if count > 1] == []
+    # Exception types aren't checked; all other names that are read are.
+    handler_types = {node.type for node in ast.walk(tree) if isinstance(node, ast.ExceptHandler)}
+    names = {node for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+    names -= handler_types
+    assert names <= visits.keys()
+
+
+def test_nested_try_is_linear():
+    _, visits = entered(nested_try(12))
+    assert sum(isinstance(node, ast.Try) for node in visits) == 12
+    assert sum(visits.values()) == len(visits)
+
+
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+def test_shapes_scale_linearly(shape):
+    size = DEFAULT_SIZES[shape][0]
+    _, small = entered(SHAPES[shape](size))
+    _, large = entered(SHAPES[shape](size * 3))
+    assert max(small.values()) == max(large.values()) == 1
+    assert len(large) <= 3 * len(small) + 10
+
+
+def test_nested_ifexp_reports_once():
+    # The same expression at module level, where none of its names are defined.
+    expression = nested_ifexp(60).partition('return ')[2]
+    tree = ast.parse(f'print{expression}')
+    names = [msg.split("'")[1] for _, _, msg, _ in ReferencedBeforeAssignmentASTPlugin(tree).run()]
+    expected = [f'value{level}' for level in range(60)] + [f'flag{level}' for level in range(60)] + ['default']
+    assert sorted(names) == sorted(expected)
+
+
+def test_imports_are_entered_once():
+    tree, visits = entered('import os, os.path as path\nfrom . import *\nprint(os, path)\n')
+    assert [node for node, count in visits.items() if count > 1] == []
+
+
+def test_counts_repeated_visits():
+    class Visitor(ReferencedBeforeAssignmentNodeVisitor):
+        def visit_BinOp(self, node):
+            return [node.left, node.left, node.right]
+
+    _, visits = entered('print(a + b)', Visitor)
+    assert sorted(node.id for node, count in visits.items() if count > 1) == ['a']
@@ -0,0 +1,116 @@
+import io
+import os
+import shutil
+import sys
+
+import pytest
+
+from flake_rba.watch import _EVENT, _IN_Q_OVERFLOW, InotifyWatcher, Poller, Watch, watch
+
+OPTIONS = (None, (), 0, False)
+MSG = "F823 variable '{}' referenced_before_assignment"
+
+
+class ScriptedWatcher(Poller):
+    """Applies one change to the files before each wake-up."""
+
+    def __init__(self, changes):
+        super().__init__(0)
+        self.changes = list(changes)
+
+    def wait(self):
+        self.changes.pop(0)()
+        return True
+
+
+def write(path, text):
+    path.write_text(text)
+    # Make sure the modification time changes, whatever its resolution.
+    stat = os.stat(str(path))
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_reports_deltas(tmp_path):
+    first, second = tmp_path / 'first.py', tmp_path / 'second.py'
+    first.write_text('print(a)\n')
+    second.write_text('print(b)\n')
+    out = io.StringIO()
+    changes = [
+        lambda: write(first, 'a = 1\nprint(a, c)\n'),
+        lambda: second.unlink(),
+    ]
+    watch([str(tmp_path)], [], OPTIONS, out, ScriptedWatcher(changes), rounds=2)
+    assert out.getvalue().splitlines() == [
+        f'{first}:1:7: {MSG.format("a")}',
+        f'{second}:1:7: {MSG.format("b")}',
+        f'- {first}:1:7: {MSG.format("a")}',
+        f'+ {first}:2:10: {MSG.format("c")}',
+        f'- {second}:1:7: {MSG.format("b")}',
+    ]
+
+
+def test_only_changed_files_are_checked(tmp_path, monkeypatch):
+    for i in range(3):
+        (tmp_path / f'module_{i}.py').write_text(f'value_{i} = 1\n')
+    state = Watch([str(tmp_path)], [], OPTIONS)
+    state.scan()
+    checked = []
+    check_path = state.daemon.check_path
+
+    def recording_check_path(path, options):
+        checked.append(path)
+        return check_path(path, options)
+
+    monkeypatch.setattr(state.daemon, 'check_path', recording_check_path)
+    write(tmp_path / 'module_1.py', 'print(missing)\n')
+    added, resolved = state.scan()
+    assert checked == [str(tmp_path / 'module_1.py')]
+    assert [report[2] for _, report in added] == [MSG.format('missing')] and resolved == []
+
+
+def test_only_changed_paths_are_looked_at(tmp_path):
+    package, new, build = tmp_path / 'package', tmp_path / 'new', tmp_path / 'build'
+    package.mkdir()
+    (package / 'gone.py').write_text('print(a)\n')
+    (tmp_path / 'kept.py').write_text('x = 1\n')
+    state = Watch([str(tmp_path)], ['build'], OPTIONS)
+    state.scan()
+
+    # Not among the changed paths, so not noticed.
+    write(tmp_path / 'kept.py', 'print(b)\n')
+    shutil.rmtree(str(package))
+    for directory in (new, build):
+        directory.mkdir()
+        (directory / 'module.py').write_text('print(c)\n')
+    added, resolved = state.scan({str(package), str(new), str(build)})
+    assert [(path, report[2]) for path, report in added] == [(str(new / 'module.py'), MSG.format('c'))]
+    assert [(path, report[2]) for path, report in resolved] == [(str(package / 'gone.py'), MSG.format('a'))]
+    assert sorted(state.stats) == [str(tmp_path / 'kept.py'), str(new / 'module.py')]
+    assert list(state.directories({str(new), str(build)})) == [str(new)]
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is Linux only')
+def test_inotify_names_changed_paths(tmp_path):
+    watcher = InotifyWatcher(timeout=0.05)
+    try:
+        watcher.watch([str(tmp_path)])
+        assert not watcher.wait()
+        (tmp_path / 'module.py').write_text('x = 1\n')
+        (tmp_path / 'package').mkdir()
+        watcher.timeout = 5
+        assert watcher.wait()
+        assert watcher.changed_paths() == {str(tmp_path / 'module.py'), str(tmp_path / 'package')}
+        assert watcher.changed_paths() == set()
+    finally:
+        watcher.close()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is Linux only')
+def test_inotify_overflow_asks_for_a_full_scan(tmp_path):
+    watcher = InotifyWatcher()
+    try:
+        watcher._decode(_EVENT.pack(-1, _IN_Q_OVERFLOW, 0, 0))
+        assert watcher.changed_paths() is None
+        assert watcher.changed_paths() == set()
+    finally:
+        watcher.close()